@@ -1,18 +1,176 @@
 """
 Flask веб-приложение для авторизации через QR-код
 """
-from flask import Flask, render_template, jsonify, request, send_file
+from flask import Flask, Response, render_template, jsonify, request, session, g
+import hmac
 import asyncio
+import functools
 import threading
 import time
 import os
-from auth_manager import auth_manager
-from userbot_manager import userbot_manager
+import queue
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+from async_runtime import async_runtime
+from event_bus import event_bus, format_sse
+from qr_registry import QRCapacityError
+from photo_cache import parse_photo_size
+from qr_renderer import QR_FORMATS, DEFAULT_QR_FORMAT
+from metrics import registry as metrics_registry, HTTP_REQUESTS, HTTP_REQUEST_DURATION
+from tracing import tracer
+from tenants import DEFAULT_SESSION_ID, new_session_id, is_valid_session_id
+from datetime import timedelta
 from pathlib import Path
 import config
+from log_pipeline import log_pipeline, get_logger
+
+logger = get_logger("API")
+poll_logger = get_logger("API.POLL")
+app_logger = get_logger("APP")
+keepalive_logger = get_logger("APP.KEEPALIVE")
+
+if config.BOT_SUPERVISOR_SOCKET:
+    # Клиенты Telethon и боты живут в отдельном процессе bot_supervisor.py, вызовы идут через Unix-сокет
+    from bot_ipc import SupervisorClient
+    supervisor = SupervisorClient(config.BOT_SUPERVISOR_SOCKET, config.BOT_SUPERVISOR_TIMEOUT)
+    auth_manager, bot_control = supervisor.auth_manager, supervisor.bot_control
+else:
+    supervisor = None
+    from auth_manager import auth_manager
+    from shared_state import shared_state
+    from bot_control import bot_control
 
 app = Flask(__name__, static_folder='static', static_url_path='/static')
 app.secret_key = config.SECRET_KEY
+# ID пользователя хранится в подписанной cookie сессии Flask - живет долго, как и сама сессия Telegram
+app.permanent_session_lifetime = timedelta(days=365)
+
+if supervisor is None:
+    from client_pool import qr_client_pool
+    # Авторизованный клиент QR-кода сразу передается боту, отзыв сессии в Telegram завершает ее
+    bot_control.install()
+    # Прогреваем пул подключенных клиентов, чтобы первый QR-код генерировался мгновенно
+    if config.API_ID and config.API_HASH:
+        qr_client_pool.start()
+    # Метрики QR-кодов и ботов выводит процесс, которому они принадлежат
+    bot_control.register_metrics(metrics_registry)
+else:
+    # События QR-кодов и ботов приходят из супервизора и рассылаются подписчикам SSE этого воркера
+    supervisor.relay_events(event_bus)
+
+
+# Метрики текущего состояния процесса (вычисляются при запросе /metrics)
+# С супервизором ботов веб-воркер выводит только их и метрики HTTP запросов
+WEB_METRICS = {
+    HTTP_REQUESTS.name,
+    HTTP_REQUEST_DURATION.name,
+    metrics_registry.gauge("threads_active", "Потоки процесса", threading.active_count).name,
+    metrics_registry.gauge("sse_subscribers", "Открытые SSE потоки", event_bus.subscriber_count).name,
+    metrics_registry.gauge("log_records_dropped", "Записи лога, отброшенные из-за переполненной очереди",
+                           lambda: log_pipeline.dropped).name,
+}
+
+
+@app.before_request
+def start_request_timer():
+    """
+    Запоминает время начала запроса для метрик
+    """
+    g.request_started_at = time.perf_counter()
+
+
+@app.before_request
+def start_request_span():
+    """
+    Открывает корневой спан запроса; ID запроса берется из X-Request-ID или создается новый
+    """
+    if not tracer.enabled:
+        return
+    request_id = request_id_from_header(request.headers.get('X-Request-ID'))
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.trace_span = tracer.start_span(f"HTTP {request.method} {route}", request_id=request_id)
+
+
+def request_id_from_header(value: Optional[str]) -> Optional[str]:
+    """
+    Возвращает ID запроса из заголовка X-Request-ID, если он допустим (иначе None - будет создан новый)
+    """
+    if value and len(value) <= 64 and value.replace('-', '').isalnum():
+        return value
+    return None
+
+
+@app.teardown_request
+def end_request_span(error=None):
+    """
+    Закрывает корневой спан запроса (в том числе при исключении)
+    """
+    span = g.pop('trace_span', None)
+    if span is not None:
+        tracer.end_span(span, error)
+
+
+@app.after_request
+def record_request_metrics(response):
+    """
+    Записывает длительность и статус запроса в метрики по шаблону маршрута
+    """
+    started_at = g.pop('request_started_at', None)
+    if started_at is not None:
+        # Шаблон маршрута (/api/check_status/<qr_id>), а не сам путь - чтобы не плодить метки
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_DURATION.observe(time.perf_counter() - started_at, route=route, method=request.method)
+        HTTP_REQUESTS.inc(route=route, method=request.method, status=str(response.status_code))
+    span = g.get('trace_span')
+    if span is not None:
+        span.set(status=response.status_code)
+        response.headers['X-Request-ID'] = span.request_id
+    return response
+
+
+# Маршруты, которые браузер опрашивает по таймеру: их лог пишется только для доли запросов
+POLL_ENDPOINTS = {'check_status', 'check_session_status', 'active_sessions'}
+
+
+@app.before_request
+def sample_poll_logging():
+    """
+    Решает, пишется ли лог этого запроса опроса (LOG_POLL_SAMPLE_RATE)
+    """
+    if request.endpoint in POLL_ENDPOINTS:
+        log_pipeline.sample_poll_request()
+
+
+def get_session_id() -> str:
+    """
+    Возвращает ID пользователя текущего запроса, при первом обращении создает новый
+    
+    Returns:
+        str: ID пользователя (DEFAULT_SESSION_ID при MULTI_TENANT=false)
+    """
+    session_id, created = resolve_session_id(session.get('session_id'))
+    if created:
+        session['session_id'] = session_id
+        session.permanent = True
+    return session_id
+
+
+def resolve_session_id(current: Optional[str]) -> Tuple[str, bool]:
+    """
+    Возвращает ID пользователя по значению из cookie сессии, для нового пользователя создает ID
+    
+    Args:
+        current: session_id из cookie (None, если его нет)
+    
+    Returns:
+        tuple: (ID пользователя, True если ID только что создан и его нужно записать в cookie)
+    """
+    if not config.MULTI_TENANT:
+        return DEFAULT_SESSION_ID, False
+    if is_valid_session_id(current):
+        return current, False
+    session_id = new_session_id()
+    logger.info(f"Новый пользователь: {session_id}")
+    return session_id, True
 
 
 @app.route('/')
@@ -20,6 +178,8 @@ def index():
     """
     Главная страница с QR-кодом
     """
+    # Выдаем ID пользователя сразу, чтобы EventSource и fetch шли с готовой cookie
+    get_session_id()
     return render_template('index.html')
 
 
@@ -31,9 +191,7 @@ def inactive():
     try:
         return render_template('inactive.html')
     except Exception as e:
-        print(f"[APP] Ошибка при рендеринге inactive.html: {e}")
-        import traceback
-        traceback.print_exc()
+        app_logger.exception(f"Ошибка при рендеринге inactive.html: {e}")
         # Возвращаем простую заглушку если шаблон не найден
         return f"""
         <!DOCTYPE html>
@@ -60,66 +218,290 @@ def health():
     }), 200
 
 
-@app.route('/api/generate_qr', methods=['POST'])
-def generate_qr():
+@app.route('/metrics', methods=['GET'])
+def metrics():
     """
-    Генерирует новый QR-код для авторизации
+    Метрики сервиса в текстовом формате Prometheus
+    """
+    if supervisor is None:
+        text = metrics_registry.render()
+    else:
+        # Метрики запросов и процесса выводит этот воркер, метрики QR-кодов и ботов - супервизор
+        text = metrics_registry.render(exclude=[name for name in metrics_registry.names() if name not in WEB_METRICS])
+        try:
+            text += supervisor.metrics(exclude=list(WEB_METRICS))
+        except Exception as e:
+            app_logger.warning(f"metrics: супервизор ботов недоступен: {e}")
+    return Response(text, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def debug_traces():
+    """
+    Последние завершенные спаны (все или одного запроса: ?request_id=...&limit=...)
+    Доступны только с заголовком Authorization: Bearer <TRACES_TOKEN> - спаны содержат ID пользователей
+    """
+    auth = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(auth.encode(), f"Bearer {config.TRACES_TOKEN}".encode()):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    if not tracer.enabled:
+        return jsonify({'success': False, 'error': 'Tracing disabled'}), 404
+    request_id = request.args.get('request_id') or None
+    limit = min(request.args.get('limit', 200, type=int), config.TRACE_BUFFER_SIZE)
+    return jsonify({
+        'success': True,
+        'spans': tracer.recent(request_id, limit)
+    })
+
+
+# Без токена администратора маршрута нет вовсе (404)
+if config.TRACES_TOKEN:
+    app.add_url_rule('/debug/traces', 'debug_traces', debug_traces, methods=['GET'])
+
+
+# Интервал keepalive-комментариев в SSE потоке (секунды)
+SSE_KEEPALIVE_INTERVAL = 15
+# Через сколько секунд браузеру, получившему 503, стоит снова открыть поток событий
+SSE_RETRY_AFTER = 60
+_sse_streams = threading.BoundedSemaphore(max(0, config.SSE_MAX_STREAMS))
+# Начало потока: браузер переподключится через 3 секунды при обрыве
+SSE_RETRY = "retry: 3000\n\n"
+# Комментарий не дает прокси закрыть простаивающее соединение
+SSE_KEEPALIVE = ": keepalive\n\n"
+
+# Сколько секунд поток запроса Flask ждет корутину маршрута в общем event loop
+GENERATE_QR_TIMEOUT = 90
+SUBMIT_PASSWORD_TIMEOUT = 40
+
+
+class ApiResult(NamedTuple):
+    """
+    JSON ответ маршрута без привязки к фреймворку: его одинаково отдают Flask (app.py) и ASGI (asgi_app.py)
+    """
+    payload: dict
+    status: int = 200
+    headers: Optional[Dict[str, str]] = None
+
+
+def to_flask_response(result: ApiResult) -> Response:
+    """
+    Превращает ApiResult в ответ Flask
+    """
+    response = jsonify(result.payload)
+    response.status_code = result.status
+    response.headers.update(result.headers or {})
+    return response
+
+
+def run_route(coro, timeout: float) -> Response:
+    """
+    Выполняет корутину маршрута в общем event loop и ждет ее в потоке запроса Flask
+    
+    Args:
+        coro: Корутина, возвращающая ApiResult
+        timeout: Таймаут в секундах
     
     Returns:
-        JSON с qr_id и base64 изображением QR-кода
+        Ответ Flask (504 при таймауте)
     """
-    print("[API] generate_qr: запрос получен")
+    try:
+        result = async_runtime.run(coro, timeout=timeout)
+    except TimeoutError as e:
+        logger.error(f"Маршрут {request.endpoint}: {e}")
+        result = ApiResult({'success': False, 'error': str(e)}, 504)
+    return to_flask_response(result)
+
+
+async def run_blocking(func: Callable, *args):
+    """
+    Выполняет блокирующий вызов из корутины маршрута, не останавливая event loop:
+    чтение SQLite общего состояния - в его потоке, вызов супервизора ботов (Unix-сокет) - в executor loop
+    
+    Args:
+        func: Функция
+        *args: Аргументы
+    
+    Returns:
+        Результат func
+    """
+    # Спан запроса и выборка логов опроса переходят в поток вместе с вызовом
+    call = tracer.bind(functools.partial(func, *args))
+    if supervisor is None:
+        return await shared_state.run(call)
+    return await asyncio.get_running_loop().run_in_executor(None, call)
+
+
+def bot_status_event(session_id: str) -> dict:
+    """
+    Данные события bot_status, которое поток /api/events отдает сразу после подключения
+    """
+    return {
+        'session_id': session_id,
+        'active': bot_control.is_bot_active(session_id)
+    }
+
+
+@app.route('/api/events')
+def events():
+    """
+    Поток Server-Sent Events: статус QR-кода, авторизация, 2FA, состояние бота и отзыв сессии
+    
+    Returns:
+        text/event-stream
+    """
+    session_id = get_session_id()
+    # Каждый поток занимает поток запросов gunicorn - без лимита вкладки заняли бы их все
+    if not _sse_streams.acquire(blocking=False):
+        logger.warning(f"events: открыто максимум потоков ({config.SSE_MAX_STREAMS}), отвечаем 503")
+        response = jsonify({
+            'success': False,
+            'error': 'Too many event streams, use polling'
+        })
+        response.status_code = 503
+        response.headers['Retry-After'] = str(SSE_RETRY_AFTER)
+        return response
+    
+    def stream():
+        subscriber = event_bus.subscribe(session_id)
+        logger.debug(f"events: новый подписчик, всего: {event_bus.subscriber_count()}")
+        try:
+            yield SSE_RETRY
+            # Сразу отдаем текущее состояние бота
+            yield format_sse('bot_status', bot_status_event(session_id))
+            while True:
+                try:
+                    event, data = subscriber.get(timeout=SSE_KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    yield SSE_KEEPALIVE
+                    continue
+                yield format_sse(event, data)
+        finally:
+            event_bus.unsubscribe(session_id, subscriber)
+            logger.debug(f"events: подписчик отключен, осталось: {event_bus.subscriber_count()}")
+    
+    response = Response(stream(), mimetype='text/event-stream')
+    # Слот освобождается при закрытии ответа, даже если генератор так и не был запущен
+    response.call_on_close(_sse_streams.release)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def qr_capacity_result(error: QRCapacityError) -> ApiResult:
+    """
+    Быстрый ответ 429, когда лимит одновременно ожидающих QR-логинов достигнут
+    
+    Args:
+        error: Ошибка с рекомендуемой задержкой повтора
+    
+    Returns:
+        ApiResult 429 с заголовком Retry-After
+    """
+    return ApiResult({
+        'success': False,
+        'error': 'Too many pending QR logins, try again later',
+        'retry_after': error.retry_after
+    }, 429, {'Retry-After': str(error.retry_after)})
+
+
+def requested_qr_format(body, query_format: Optional[str]) -> str:
+    """
+    Формат изображения QR-кода: из JSON тела или query-параметра, по умолчанию png
+    """
+    if isinstance(body, dict) and body.get('format'):
+        return body['format']
+    return query_format or DEFAULT_QR_FORMAT
+
+
+async def generate_qr_result(session_id: str, qr_format: str) -> ApiResult:
+    """
+    Генерирует новый QR-код для авторизации (корутина в общем event loop)
+    
+    Args:
+        session_id: ID пользователя
+        qr_format: Запрошенный формат изображения
+    
+    Returns:
+        ApiResult с qr_id и изображением QR-кода в запрошенном формате
+    """
+    logger.info("generate_qr: запрос получен")
     try:
         # Проверяем переменные окружения ПЕРЕД началом работы
-        print(f"[API] generate_qr: проверка переменных окружения:")
-        print(f"[API] generate_qr: API_ID={config.API_ID} (тип: {type(config.API_ID)})")
-        print(f"[API] generate_qr: API_HASH установлен={bool(config.API_HASH)}, длина={len(config.API_HASH) if config.API_HASH else 0}")
+        logger.debug(f"generate_qr: проверка переменных окружения:")
+        logger.debug(f"generate_qr: API_ID={config.API_ID} (тип: {type(config.API_ID)})")
+        logger.debug(f"generate_qr: API_HASH установлен={bool(config.API_HASH)}, длина={len(config.API_HASH) if config.API_HASH else 0}")
         
         if not config.API_ID or config.API_ID == 0 or not config.API_HASH or config.API_HASH == "":
             error_msg = "API_ID или API_HASH не установлены в переменных окружения Render!"
-            print(f"[API] generate_qr: ОШИБКА КОНФИГУРАЦИИ - {error_msg}")
-            print(f"[API] generate_qr: API_ID={config.API_ID}, API_HASH установлен={bool(config.API_HASH)}")
-            return jsonify({
+            logger.error(f"generate_qr: ОШИБКА КОНФИГУРАЦИИ - {error_msg}")
+            logger.info(f"generate_qr: API_ID={config.API_ID}, API_HASH установлен={bool(config.API_HASH)}")
+            return ApiResult({
                 'success': False,
                 'error': error_msg
-            }), 500
+            }, 500)
         
-        print(f"[API] generate_qr: переменные окружения валидны!")
+        logger.debug(f"generate_qr: переменные окружения валидны!")
         
         # Если уже авторизован, возвращаем сообщение
-        if auth_manager.is_authorized():
-            print("[API] generate_qr: пользователь уже авторизован")
-            return jsonify({
+        if await run_blocking(auth_manager.is_authorized, session_id):
+            logger.info("generate_qr: пользователь уже авторизован")
+            return ApiResult({
                 'success': False,
                 'error': 'Already authorized'
-            }), 400
+            }, 400)
         
-        print("[API] generate_qr: начинаем генерацию QR-кода")
-        print(f"[API] generate_qr: переменные окружения OK, API_ID={config.API_ID}")
+        if qr_format not in QR_FORMATS:
+            return ApiResult({
+                'success': False,
+                'error': f"Unknown format '{qr_format}', expected one of: {', '.join(QR_FORMATS)}"
+            }, 400)
         
-        # Генерируем QR-код
-        qr_id, qr_image = auth_manager.generate_qr_code()
-        print(f"[API] generate_qr: QR-код успешно сгенерирован, qr_id: {qr_id}")
-        return jsonify({
+        logger.debug("generate_qr: начинаем генерацию QR-кода")
+        logger.debug(f"generate_qr: переменные окружения OK, API_ID={config.API_ID}")
+        
+        # Генерируем QR-код (с супервизором ботов - вызовом через его сокет)
+        if supervisor is None:
+            qr_id, qr_payload = await auth_manager.generate_qr_code_async(session_id, qr_format)
+        else:
+            qr_id, qr_payload = await run_blocking(auth_manager.generate_qr_code, session_id, qr_format)
+        logger.info(f"generate_qr: QR-код успешно сгенерирован, qr_id: {qr_id}, формат: {qr_format}")
+        response = {
             'success': True,
             'qr_id': qr_id,
-            'qr_image': qr_image
-        })
+            'qr_version': 1
+        }
+        response.update(qr_payload)
+        return ApiResult(response)
+    except QRCapacityError as e:
+        logger.warning(f"generate_qr: {e}")
+        return qr_capacity_result(e)
     except TimeoutError as e:
         error_msg = f"Таймаут при генерации QR-кода: {e}"
-        print(f"[API] generate_qr: ТАЙМАУТ - {error_msg}")
-        return jsonify({
+        logger.error(f"generate_qr: ТАЙМАУТ - {error_msg}")
+        return ApiResult({
             'success': False,
             'error': error_msg
-        }), 504  # Gateway Timeout
+        }, 504)  # Gateway Timeout
     except Exception as e:
-        print(f"[API] generate_qr: ошибка: {type(e).__name__}: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({
+        logger.exception(f"generate_qr: ошибка: {type(e).__name__}: {e}")
+        return ApiResult({
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500)
+
+
+@app.route('/api/generate_qr', methods=['POST'])
+def generate_qr():
+    """
+    Генерирует новый QR-код для авторизации
+    
+    Body (JSON, необязательно):
+        format: png (по умолчанию), png1, svg или matrix
+    
+    Returns:
+        JSON с qr_id и изображением QR-кода в запрошенном формате
+    """
+    qr_format = requested_qr_format(request.get_json(silent=True), request.args.get('format'))
+    return run_route(generate_qr_result(get_session_id(), qr_format), GENERATE_QR_TIMEOUT)
 
 
 @app.route('/api/generate_qr_url', methods=['POST'])
@@ -131,49 +513,85 @@ def generate_qr_url():
         JSON с qr_id и URL на изображение QR-кода
     """
     try:
+        session_id = get_session_id()
         # Если уже авторизован, возвращаем сообщение
-        if auth_manager.is_authorized():
+        if auth_manager.is_authorized(session_id):
             return jsonify({
                 'success': False,
                 'error': 'Already authorized'
             }), 400
         
-        qr_id, qr_url = auth_manager.generate_qr_code_url()
+        qr_id, qr_url = auth_manager.generate_qr_code_url(session_id)
         return jsonify({
             'success': True,
             'qr_id': qr_id,
             'qr_url': qr_url
         })
+    except QRCapacityError as e:
+        logger.warning(f"generate_qr_url: {e}")
+        return to_flask_response(qr_capacity_result(e))
     except Exception as e:
-        print(f"[API] generate_qr_url: ошибка: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"generate_qr_url: ошибка: {e}")
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
 
-@app.route('/api/check_status/<qr_id>')
-def check_status(qr_id):
+@app.route('/api/qr_image/<qr_id>.png')
+def qr_image(qr_id):
     """
-    Проверяет статус авторизации
+    Отдает изображение QR-кода из хранилища в памяти (или опубликованное другим воркером)
     
     Args:
         qr_id: ID QR-кода
-        
+    
+    Query:
+        v: Версия токена (URL из generate_qr_url и обновлений уже содержит ее)
+    
     Returns:
-        JSON с информацией о статусе авторизации
+        PNG изображение или 404, если QR-код истек или уже не нужен
+    """
+    # Изображение отдается только владельцу QR-кода
+    image = auth_manager.get_qr_image(qr_id, get_session_id())
+    if image is None:
+        response = Response(status=404)
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    
+    response = Response(image.data, mimetype=image.mimetype)
+    response.set_etag(f"{qr_id}-{image.version}")
+    if request.args.get('v', type=int) == image.version:
+        # Изображение версии не меняется - кешируем до истечения токена
+        max_age = max(0, int(image.expires_at - time.time()))
+        response.headers['Cache-Control'] = f'private, max-age={max_age}, immutable'
+    else:
+        # Без версии (или со старой версией) URL всегда показывает текущий токен
+        response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
+def check_status_result(session_id: str, qr_id: str, known_version: Optional[int]) -> ApiResult:
+    """
+    Проверяет статус авторизации (читает общее состояние - из корутины вызывается через run_blocking)
+    
+    Args:
+        session_id: ID пользователя
+        qr_id: ID QR-кода
+        known_version: Версия токена, которая уже есть у браузера (параметр v)
+    
+    Returns:
+        ApiResult с информацией о статусе авторизации
     """
     try:
-        print(f"[API] check_status вызван для qr_id: {qr_id}")
+        poll_logger.info(f"check_status вызван для qr_id: {qr_id}")
         
         # Проверяем, авторизован ли пользователь
-        if auth_manager.is_authorized():
-            print(f"[API] check_status: уже авторизован")
-            user_data = auth_manager.get_user_data()
-            bot_active = userbot_manager.is_bot_active('main')
-            return jsonify({
+        if auth_manager.is_authorized(session_id):
+            poll_logger.info(f"check_status: уже авторизован")
+            user_data = auth_manager.get_user_data(session_id)
+            bot_active = bot_control.is_bot_active(session_id)
+            return ApiResult({
                 'success': True,
                 'authorized': True,
                 'user_data': user_data,
@@ -181,281 +599,227 @@ def check_status(qr_id):
             })
         
         # Проверяем валидность QR-кода
-        if not auth_manager.is_qr_valid(qr_id):
-            print(f"[API] check_status: QR-код невалиден или истек")
-            return jsonify({
+        if not auth_manager.is_qr_valid(qr_id, session_id):
+            poll_logger.info(f"check_status: QR-код невалиден или истек")
+            return ApiResult({
                 'success': False,
                 'qr_expired': True
             })
         
         # Проверяем статус авторизации
-        user_data = auth_manager.check_authorization_status(qr_id)
+        user_data = auth_manager.check_authorization_status(qr_id, session_id)
         
         if user_data:
             # Проверяем, требуется ли пароль
             if user_data.get("needs_password"):
-                print(f"[API] check_status: требуется пароль")
-                return jsonify({
+                poll_logger.info(f"check_status: требуется пароль")
+                return ApiResult({
                     'success': True,
                     'needs_password': True
                 })
             
-            # Если авторизация прошла успешно, запускаем юзербота в отдельном потоке
-            print(f"[API] check_status: авторизован, запускаем бота")
-            if not userbot_manager.is_bot_active("main"):
-                print(f"[API] check_status: запускаем бота в потоке")
-                def start_bot_thread():
-                    try:
-                        print(f"[BOT] Запускаем бота в потоке {threading.current_thread().name}")
-                        # Получаем клиент из QR вместе с event loop
-                        qr_data = auth_manager.active_qr_codes.get(qr_id)
-                        client = None
-                        if qr_data:
-                            client = qr_data.get("qr_client")
-                            if not client:
-                                print(f"[BOT] Предупреждение: клиент из QR не найден, создаем новый из сессии")
-                        
-                        # Если клиент из QR не найден, создаем новый из постоянной сессии
-                        if not client:
-                            print(f"[BOT] Создаем клиента из постоянной сессии")
-                            session_path = auth_manager.get_session_path()
-                            from telethon import TelegramClient
-                            client = TelegramClient(str(session_path), config.API_ID, config.API_HASH)
-                            # Подключаемся синхронно в новом loop
-                            async def connect_client():
-                                await client.connect()
-                                return client
-                            loop = asyncio.new_event_loop()
-                            asyncio.set_event_loop(loop)
-                            try:
-                                loop.run_until_complete(connect_client())
-                                print(f"[BOT] Клиент подключен из сессии")
-                            except Exception as e:
-                                print(f"[BOT] Ошибка при подключении клиента: {e}")
-                                loop.close()
-                                return
-                        
-                        if client:
-                            print(f"[BOT] Получили клиент, регистрируем бота")
-                            # Используем вспомогательную функцию для запуска бота (qr_loop игнорируется)
-                            start_bot_with_client(client, None)
-                        else:
-                            print(f"[BOT] Ошибка: не удалось получить клиент")
-                    except Exception as e:
-                        print(f"[BOT] Ошибка в потоке бота: {e}")
-                        import traceback
-                        traceback.print_exc()
-                threading.Thread(target=start_bot_thread, daemon=True).start()
-                # Небольшая задержка чтобы бот успел запуститься
-                time.sleep(1)
+            # Бот уже запущен на клиенте QR-кода в момент входа (auth_manager передает его сам)
+            poll_logger.info(f"check_status: авторизован")
             
-            bot_active = userbot_manager.is_bot_active('main')
-            return jsonify({
+            bot_active = bot_control.is_bot_active(session_id)
+            return ApiResult({
                 'success': True,
                 'authorized': True,
                 'user_data': user_data,
                 'bot_active': bot_active
             })
         else:
-            print(f"[API] check_status: не авторизован")
-            return jsonify({
+            poll_logger.info(f"check_status: не авторизован")
+            response = {
                 'success': True,
                 'authorized': False
-            })
+            }
+            # Если токен обновился, отдаем только новое изображение (без нового QR-логина)
+            if known_version is not None:
+                refresh = auth_manager.get_qr_refresh(qr_id, session_id, known_version)
+                if refresh:
+                    response.update(refresh)
+            return ApiResult(response)
             
     except Exception as e:
-        print(f"[API] check_status: ошибка: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({
+        poll_logger.exception(f"check_status: ошибка: {e}")
+        return ApiResult({
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500)
+
+
+@app.route('/api/check_status/<qr_id>')
+def check_status(qr_id):
+    """
+    Проверяет статус авторизации
+    
+    Args:
+        qr_id: ID QR-кода
+        
+    Returns:
+        JSON с информацией о статусе авторизации
+    """
+    return to_flask_response(check_status_result(get_session_id(), qr_id, request.args.get('v', type=int)))
 
 
 @app.route('/api/user_photo')
 def user_photo():
     """
-    Отдает фото пользователя из Telegram
+    Отдает фото пользователя из Telegram (через кеш по photo_id)
+    
+    Query:
+        size: small (160x160), big (640x640, по умолчанию) или размер в пикселях (16-640)
     
     Returns:
-        Файл изображения
+        Файл изображения или 304, если у браузера уже есть это фото
     """
     try:
-        print(f"[API] user_photo вызван")
+        logger.debug(f"user_photo вызван")
+        session_id = get_session_id()
         
-        if not auth_manager.is_authorized():
-            print(f"[API] user_photo: пользователь не авторизован")
+        if not auth_manager.is_authorized(session_id):
+            logger.info(f"user_photo: пользователь не авторизован")
             return '', 404
         
-        # Пытаемся получить фото через активного бота, если он есть
-        bot_client = userbot_manager.get_client("main")
-        if bot_client:
-            print(f"[API] user_photo: используем клиент активного бота")
-            try:
-                # Получаем фото через клиент бота в его event loop
-                async def get_photo_from_bot():
-                    try:
-                        user = await bot_client.get_me()
-                        if user and user.photo:
-                            photo_data = await bot_client.download_profile_photo(user, file=bytes)
-                            return photo_data
-                        return None
-                    except Exception as e:
-                        print(f"[API] user_photo: ошибка при загрузке фото через бота: {e}")
-                        return None
-                
-                # Получаем event loop бота
-                if "main" in userbot_manager.bot_loops:
-                    bot_loop = userbot_manager.bot_loops["main"]
-                    if bot_loop and not bot_loop.is_closed():
-                        try:
-                            if bot_loop.is_running():
-                                # Loop запущен - используем run_coroutine_threadsafe
-                                future = asyncio.run_coroutine_threadsafe(get_photo_from_bot(), bot_loop)
-                                photo_data = future.result(timeout=10)
-                            else:
-                                # Loop не запущен - используем run_until_complete
-                                photo_data = bot_loop.run_until_complete(get_photo_from_bot())
-                            
-                            if photo_data:
-                                from io import BytesIO
-                                print(f"[API] user_photo: отправляем фото через бота, размер: {len(photo_data)}")
-                                return send_file(BytesIO(photo_data), mimetype='image/jpeg')
-                        except Exception as e:
-                            print(f"[API] user_photo: ошибка при использовании loop бота: {e}, используем fallback")
-                
-                # Если не получилось через bot_loop, пробуем через auth_manager
-                print(f"[API] user_photo: пытаемся загрузить фото через auth_manager (fallback)")
-            except Exception as e:
-                print(f"[API] user_photo: ошибка при работе с клиентом бота: {e}, используем fallback")
+        try:
+            size = parse_photo_size(request.args.get('size'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        # Фото того же photo_id не меняется - отвечаем 304 без обращения к Telegram
+        etag = auth_manager.get_photo_etag(session_id, size)
+        if etag and request.if_none_match.contains(etag):
+            logger.debug(f"user_photo: фото не изменилось (304)")
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
         
-        # Если бот не активен или не удалось получить фото через бота - используем auth_manager
-        photo_data = auth_manager.get_user_photo(client=None)
+        # При промахе кеша фото загружается через клиент активного бота, если он есть
+        photo_data = bot_control.get_user_photo(session_id, size)
         
         if photo_data:
-            from io import BytesIO
-            print(f"[API] user_photo: отправляем фото, размер: {len(photo_data)}")
-            return send_file(BytesIO(photo_data), mimetype='image/jpeg')
+            logger.debug(f"user_photo: отправляем фото, размер: {len(photo_data)}")
+            response = Response(photo_data, mimetype='image/jpeg')
+            # photo_id мог стать известен только при загрузке
+            etag = auth_manager.get_photo_etag(session_id, size)
+            if etag:
+                response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
         
-        print(f"[API] user_photo: фото не найдено")
+        logger.error(f"user_photo: фото не найдено")
         return '', 404
             
     except Exception as e:
-        print(f"[API] user_photo: ошибка: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"user_photo: ошибка: {e}")
         return '', 404
 
 
-@app.route('/api/submit_password/<qr_id>', methods=['POST'])
-def submit_password(qr_id):
+def _qr_served_elsewhere(qr_id: str, session_id: str) -> bool:
     """
-    Отправляет пароль 2FA
+    Проверяет, что действующий QR-код пользователя обслуживает другой воркер (ввести пароль можно только там)
+    """
+    return not auth_manager.is_authorized(session_id) and not auth_manager.owns_qr(qr_id) \
+        and auth_manager.is_qr_valid(qr_id, session_id)
+
+
+async def submit_password_result(session_id: str, qr_id: str, password: Optional[str]) -> ApiResult:
+    """
+    Отправляет пароль 2FA (корутина в общем event loop)
     
     Args:
-        qr_id: ID сессии
-        
+        session_id: ID пользователя
+        qr_id: ID QR-кода
+        password: Пароль из тела запроса
+    
     Returns:
-        JSON с результатом операции
+        ApiResult с результатом операции
     """
     try:
-        print(f"[API] submit_password вызван для qr_id: {qr_id}")
-        data = request.get_json()
-        password = data.get('password')
+        logger.info(f"submit_password вызван для qr_id: {qr_id}")
         
         if not password:
-            print(f"[API] submit_password: пароль не указан")
-            return jsonify({
+            logger.info(f"submit_password: пароль не указан")
+            return ApiResult({
                 'success': False,
                 'error': 'Password required'
-            }), 400
+            }, 400)
         
-        print(f"[API] submit_password: отправляем пароль в auth_manager")
-        user_data = auth_manager.submit_password(qr_id, password)
+        if await run_blocking(_qr_served_elsewhere, qr_id, session_id):
+            logger.warning(f"submit_password: QR {qr_id} обслуживает другой воркер")
+            return ApiResult({
+                'success': False,
+                'error': 'QR code is served by another worker'
+            }, 409)
+        
+        logger.debug(f"submit_password: отправляем пароль в auth_manager")
+        if supervisor is None:
+            user_data = await auth_manager.submit_password_async(qr_id, session_id, password)
+        else:
+            user_data = await run_blocking(auth_manager.submit_password, qr_id, session_id, password)
         
         if user_data:
-            print(f"[API] submit_password: пользователь авторизован: {user_data}")
-            
-            # Запускаем юзербота используя клиент из QR в отдельном потоке
-            if not userbot_manager.is_bot_active("main"):
-                print(f"[API] submit_password: запускаем бота в потоке")
-                def start_bot_thread():
-                    try:
-                        print(f"[BOT] Запускаем бота в потоке {threading.current_thread().name}")
-                        # Получаем клиент из QR вместе с event loop
-                        qr_data = auth_manager.active_qr_codes.get(qr_id)
-                        client = None
-                        if qr_data:
-                            client = qr_data.get("qr_client")
-                            if not client:
-                                print(f"[BOT] Предупреждение: клиент из QR не найден, создаем новый из сессии")
-                        
-                        # Если клиент из QR не найден, создаем новый из постоянной сессии
-                        if not client:
-                            print(f"[BOT] Создаем клиента из постоянной сессии")
-                            session_path = auth_manager.get_session_path()
-                            from telethon import TelegramClient
-                            client = TelegramClient(str(session_path), config.API_ID, config.API_HASH)
-                            # Подключаемся синхронно в новом loop
-                            async def connect_client():
-                                await client.connect()
-                                return client
-                            loop = asyncio.new_event_loop()
-                            asyncio.set_event_loop(loop)
-                            try:
-                                loop.run_until_complete(connect_client())
-                                print(f"[BOT] Клиент подключен из сессии")
-                            except Exception as e:
-                                print(f"[BOT] Ошибка при подключении клиента: {e}")
-                                loop.close()
-                                return
-                        
-                        if client:
-                            print(f"[BOT] Получили клиент, регистрируем бота")
-                            # Используем вспомогательную функцию для запуска бота (qr_loop игнорируется)
-                            start_bot_with_client(client, None)
-                        else:
-                            print(f"[BOT] Ошибка: не удалось получить клиент")
-                    except Exception as e:
-                        print(f"[BOT] Ошибка в потоке бота: {e}")
-                        import traceback
-                        traceback.print_exc()
-                threading.Thread(target=start_bot_thread, daemon=True).start()
-                # Небольшая задержка чтобы бот успел запуститься
-                time.sleep(1)
+            logger.info(f"submit_password: пользователь авторизован: {user_data}")
             
-            bot_active = userbot_manager.is_bot_active('main')
-            return jsonify({
+            # Бот уже запущен на клиенте QR-кода при входе (без переподключения)
+            bot_active = await run_blocking(bot_control.is_bot_active, session_id)
+            return ApiResult({
                 'success': True,
                 'authorized': True,
                 'user_data': user_data,
                 'bot_active': bot_active
             })
         else:
-            print(f"[API] submit_password: неверный пароль")
-            return jsonify({
+            logger.info(f"submit_password: неверный пароль")
+            return ApiResult({
                 'success': False,
                 'error': 'Invalid password'
-            }), 401
+            }, 401)
             
     except Exception as e:
-        print(f"[API] submit_password: ошибка: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({
+        logger.exception(f"submit_password: ошибка: {e}")
+        return ApiResult({
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500)
 
 
-# Кеш для состояния бота (для предотвращения колебаний)
-_bot_state_cache = {
-    'active': False,
-    'timestamp': 0
-}
+@app.route('/api/submit_password/<qr_id>', methods=['POST'])
+def submit_password(qr_id):
+    """
+    Отправляет пароль 2FA
+    
+    Args:
+        qr_id: ID сессии
+        
+    Returns:
+        JSON с результатом операции
+    """
+    data = request.get_json(silent=True)
+    password = data.get('password') if isinstance(data, dict) else None
+    return run_route(submit_password_result(get_session_id(), qr_id, password), SUBMIT_PASSWORD_TIMEOUT)
+
+
+# Кеш для состояния бота (для предотвращения колебаний): {session_id: {'active', 'timestamp'}}
+_bot_state_cache = {}
 BOT_STATE_CACHE_TTL = 5  # Кеш действителен 5 секунд
 
+
+def _set_bot_state_cache(session_id: str, active: bool):
+    """
+    Обновляет кеш состояния бота пользователя
+    
+    Args:
+        session_id: ID пользователя
+        active: Активен ли бот
+    """
+    _bot_state_cache[session_id] = {'active': active, 'timestamp': time.time()}
+
 @app.route('/api/active_sessions')
 def active_sessions():
     """
@@ -464,54 +828,53 @@ def active_sessions():
     Returns:
         JSON со списком активных сессий и статусом бота
     """
-    global _bot_state_cache
-    
     try:
-        print(f"[API] active_sessions вызван")
+        poll_logger.info(f"active_sessions вызван")
+        session_id = get_session_id()
         
         # Получаем текущее состояние бота
-        current_bot_active = userbot_manager.is_bot_active('main')
+        current_bot_active = bot_control.is_bot_active(session_id)
         current_time = time.time()
+        bot_state = _bot_state_cache.setdefault(session_id, {'active': False, 'timestamp': 0})
         
         # Если кеш устарел или состояние изменилось на True (активация важнее деактивации) - обновляем кеш
-        cache_age = current_time - _bot_state_cache['timestamp']
-        if cache_age > BOT_STATE_CACHE_TTL or current_bot_active != _bot_state_cache['active']:
+        cache_age = current_time - bot_state['timestamp']
+        if cache_age > BOT_STATE_CACHE_TTL or current_bot_active != bot_state['active']:
             # Обновляем кеш только если:
             # 1. Кеш устарел ИЛИ
             # 2. Бот активировался (переход с False на True) - это важное событие
             # 3. Или бот деактивировался (переход с True на False) И кеш устарел больше чем на TTL
-            if current_bot_active != _bot_state_cache['active']:
+            if current_bot_active != bot_state['active']:
                 # Состояние изменилось - обновляем кеш немедленно
-                print(f"[API] active_sessions: состояние бота изменилось: {_bot_state_cache['active']} -> {current_bot_active}")
-                _bot_state_cache['active'] = current_bot_active
-                _bot_state_cache['timestamp'] = current_time
+                poll_logger.info(f"active_sessions: состояние бота изменилось: {bot_state['active']} -> {current_bot_active}")
+                bot_state['active'] = current_bot_active
+                bot_state['timestamp'] = current_time
             elif cache_age > BOT_STATE_CACHE_TTL:
                 # Кеш устарел - обновляем его
-                print(f"[API] active_sessions: кеш устарел ({cache_age:.1f}с), обновляем состояние: {current_bot_active}")
-                _bot_state_cache['active'] = current_bot_active
-                _bot_state_cache['timestamp'] = current_time
+                poll_logger.info(f"active_sessions: кеш устарел ({cache_age:.1f}с), обновляем состояние: {current_bot_active}")
+                bot_state['active'] = current_bot_active
+                bot_state['timestamp'] = current_time
         
         # Используем кешированное значение для стабильности
-        bot_active = _bot_state_cache['active']
-        print(f"[API] active_sessions: проверка состояния бота: текущее={current_bot_active}, кеш={bot_active}, возраст_кеша={cache_age:.1f}с")
+        bot_active = bot_state['active']
+        poll_logger.info(f"active_sessions: проверка состояния бота: текущее={current_bot_active}, кеш={bot_active}, возраст_кеша={cache_age:.1f}с")
         
-        sessions = auth_manager.get_active_sessions()
-        print(f"[API] active_sessions: sessions={sessions}, bot_active={bot_active}")
+        sessions = auth_manager.get_active_sessions(session_id)
+        poll_logger.info(f"active_sessions: sessions={sessions}, bot_active={bot_active}")
         
-        # Если sessions пуст, но файл сессии существует - это может означать что после перезапуска
-        # _user_data потерян, но сессия валидна
+        # Если sessions пуст, но сессия сохранена - это может означать что после перезапуска
+        # user_data потерян, но сессия валидна
         if not sessions or len(sessions) == 0:
-            session_path = auth_manager.get_session_path()
-            if Path(session_path).exists():
-                print(f"[API] active_sessions: файл сессии существует, но sessions пуст - проверяем валидность")
+            if auth_manager.has_session(session_id):
+                poll_logger.info(f"active_sessions: сессия сохранена, но sessions пуст - проверяем валидность")
                 # Быстрая проверка через check_session_status (не вызываем напрямую, чтобы не было рекурсии)
                 # Вместо этого просто возвращаем пустой список, фронтенд сам проверит через check_session_status
-                print(f"[API] active_sessions: файл сессии существует, но _user_data потерян (вероятно после перезапуска)")
+                poll_logger.info(f"active_sessions: сессия сохранена, но user_data потерян (вероятно после перезапуска)")
         
         # ВАЖНО: Если бот активен, то сессия точно валидна, даже если sessions пуст
         # Это предотвращает переключение toggle когда бот работает
         if bot_active and (not sessions or len(sessions) == 0):
-            print(f"[API] active_sessions: бот активен, но sessions пуст - это нормально после перезапуска")
+            poll_logger.info(f"active_sessions: бот активен, но sessions пуст - это нормально после перезапуска")
         
         # НЕ запускаем бота автоматически в active_sessions - только при явной авторизации
         return jsonify({
@@ -520,9 +883,7 @@ def active_sessions():
             'bot_active': bot_active  # Возвращаем кешированное значение для стабильности
         })
     except Exception as e:
-        print(f"[API] active_sessions: ошибка: {e}")
-        import traceback
-        traceback.print_exc()
+        poll_logger.exception(f"active_sessions: ошибка: {e}")
         return jsonify({
             'success': False,
             'error': str(e)
@@ -535,103 +896,53 @@ def check_session_status():
     Проверяет статус активной сессии и возвращает её валидность
     """
     try:
-        print(f"[API] check_session_status вызван")
+        poll_logger.info(f"check_session_status вызван")
+        session_id = get_session_id()
         
         # Приоритет 1: Проверяем, активен ли бот - если бот активен, сессия точно валидна
-        bot_active = userbot_manager.is_bot_active('main')
+        bot_active = bot_control.is_bot_active(session_id)
         if bot_active:
-            print(f"[API] check_session_status: бот активен, сессия валидна")
+            poll_logger.info(f"check_session_status: бот активен, сессия валидна")
             return jsonify({
                 'success': True,
                 'session_valid': True
             })
         
-        # Приоритет 2: Проверяем _user_data (если он есть, сессия точно валидна)
-        if auth_manager.is_authorized():
-            print(f"[API] check_session_status: _user_data установлен, сессия валидна")
+        # Приоритет 2: Проверяем user_data пользователя (если он есть, сессия точно валидна)
+        if auth_manager.is_authorized(session_id):
+            poll_logger.info(f"check_session_status: user_data установлен, сессия валидна")
             return jsonify({
                 'success': True,
                 'session_valid': True
             })
         
-        # Приоритет 3: Проверяем файл сессии и его валидность через Telegram API
-        session_path = auth_manager.get_session_path()
-        if Path(session_path).exists():
-            # Файл сессии существует - проверяем его валидность через быстрое подключение
-            print(f"[API] check_session_status: файл сессии существует, проверяем валидность...")
+        # Приоритет 3: Проверяем сохраненную сессию и ее валидность через Telegram API
+        # (ответ кешируется, одновременные запросы ждут одну проверку)
+        if auth_manager.has_session(session_id):
+            poll_logger.info(f"check_session_status: сессия сохранена, проверяем валидность...")
             try:
-                from telethon import TelegramClient
-                from telethon.errors import AuthKeyUnregisteredError, SessionRevokedError, UnauthorizedError
-                
-                async def check_session_file():
-                    """Быстрая проверка валидности файла сессии"""
-                    client = TelegramClient(str(session_path), config.API_ID, config.API_HASH)
-                    try:
-                        await asyncio.wait_for(client.connect(), timeout=5)
-                        is_authorized = await client.is_user_authorized()
-                        await client.disconnect()
-                        return is_authorized
-                    except (AuthKeyUnregisteredError, SessionRevokedError, UnauthorizedError):
-                        print(f"[API] check_session_status: сессия невалидна (отозвана/удалена)")
-                        try:
-                            await client.disconnect()
-                        except:
-                            pass
-                        return False
-                    except Exception as e:
-                        error_name = type(e).__name__
-                        error_msg = str(e)
-                        print(f"[API] check_session_status: ошибка при проверке файла сессии: {error_name}: {error_msg}")
-                        # Для ошибок I/O (disk I/O error, database is locked, readonly database) считаем сессию потенциально валидной
-                        # Это временные проблемы Render, сессия может быть валидна
-                        if ("disk I/O error" in error_msg.lower() or 
-                            "database is locked" in error_msg.lower() or 
-                            "readonly database" in error_msg.lower() or
-                            "attempt to write a readonly database" in error_msg.lower()):
-                            print(f"[API] check_session_status: временная ошибка I/O/readonly, считаем сессию валидной")
-                            try:
-                                await client.disconnect()
-                            except:
-                                pass
-                            return True  # Считаем сессию валидной при временных ошибках
-                        try:
-                            await client.disconnect()
-                        except:
-                            pass
-                        return False
-                
-                # Используем новый event loop для быстрой проверки
-                result, loop = auth_manager._run_async_in_new_loop(check_session_file(), timeout=10)
-                if result:
-                    print(f"[API] check_session_status: файл сессии валиден")
-                    return jsonify({
-                        'success': True,
-                        'session_valid': True
-                    })
-                else:
-                    print(f"[API] check_session_status: файл сессии невалиден")
-                    return jsonify({
-                        'success': True,
-                        'session_valid': False
-                    })
+                result = auth_manager.is_session_valid(session_id)
+                poll_logger.info(f"check_session_status: сессия {'валидна' if result else 'невалидна'}")
+                return jsonify({
+                    'success': True,
+                    'session_valid': result
+                })
             except Exception as e:
-                print(f"[API] check_session_status: ошибка при проверке файла сессии: {e}")
+                poll_logger.error(f"check_session_status: ошибка при проверке сессии: {type(e).__name__}: {e}")
                 # При ошибке считаем сессию невалидной для безопасности
                 return jsonify({
                     'success': True,
                     'session_valid': False
                 })
         else:
-            # Нет файла сессии - сессия невалидна
-            print(f"[API] check_session_status: файл сессии не существует")
+            # Нет сохраненной сессии - сессия невалидна
+            poll_logger.error(f"check_session_status: сессия не найдена")
             return jsonify({
                 'success': True,
                 'session_valid': False
             })
     except Exception as e:
-        print(f"[API] check_session_status: ошибка: {e}")
-        import traceback
-        traceback.print_exc()
+        poll_logger.exception(f"check_session_status: ошибка: {e}")
         return jsonify({
             'success': False,
             'error': str(e)
@@ -641,108 +952,50 @@ def check_session_status():
 @app.route('/api/restore_session')
 def restore_session():
     """
-    Восстанавливает user_data из файла сессии (вызывается когда _user_data потерян после перезапуска)
+    Восстанавливает user_data из файла сессии (вызывается когда данные потеряны после перезапуска)
     
     Returns:
         JSON с user_data и статусом бота
     """
     try:
-        print(f"[API] restore_session вызван")
+        logger.debug(f"restore_session вызван")
+        session_id = get_session_id()
         
         # Если уже есть user_data - возвращаем его
-        if auth_manager.is_authorized():
-            print(f"[API] restore_session: _user_data уже установлен")
-            user_data = auth_manager.get_user_data()
-            bot_active = userbot_manager.is_bot_active('main')
+        if auth_manager.is_authorized(session_id):
+            logger.info(f"restore_session: user_data уже установлен")
+            user_data = auth_manager.get_user_data(session_id)
+            bot_active = bot_control.is_bot_active(session_id)
             return jsonify({
                 'success': True,
                 'user_data': user_data,
                 'bot_active': bot_active
             })
         
-        # Проверяем файл сессии
-        session_path = auth_manager.get_session_path()
-        if not Path(session_path).exists():
-            print(f"[API] restore_session: файл сессии не существует")
+        # Проверяем сохраненную сессию
+        if not auth_manager.has_session(session_id):
+            logger.error(f"restore_session: сессия не найдена")
             return jsonify({
                 'success': False,
                 'error': 'Session file not found'
             }), 404
         
-        print(f"[API] restore_session: файл сессии существует, восстанавливаем user_data...")
+        logger.info(f"restore_session: сессия найдена, восстанавливаем user_data...")
         
-        # Восстанавливаем сессию (это обновит _user_data)
-        auth_manager.restore_sessions()
+        # Восстанавливаем сессию пользователя (это обновит его user_data)
+        auth_manager.restore_sessions([session_id])
         
         # Проверяем, восстановились ли данные
-        if auth_manager.is_authorized():
-            print(f"[API] restore_session: сессия успешно восстановлена")
-            user_data = auth_manager.get_user_data()
-            bot_active = userbot_manager.is_bot_active('main')
+        if auth_manager.is_authorized(session_id):
+            logger.info(f"restore_session: сессия успешно восстановлена")
+            user_data = auth_manager.get_user_data(session_id)
+            bot_active = bot_control.is_bot_active(session_id)
             
-            # Если бот не активен, но сессия валидна - запускаем бота
+            # Если бот не активен, но сессия валидна - запускаем бота и ждем, пока он реально запустится
             if not bot_active:
-                print(f"[API] restore_session: бот не активен, запускаем бота...")
-                def start_bot_thread():
-                    try:
-                        print(f"[BOT] Запускаем бота из restore_session в потоке {threading.current_thread().name}")
-                        async def init_bot():
-                            try:
-                                await asyncio.sleep(1)
-                                print(f"[BOT] init_bot: создаем клиента из сессии")
-                                from telethon import TelegramClient
-                                client = TelegramClient(str(session_path), config.API_ID, config.API_HASH)
-                                print(f"[BOT] init_bot: подключаемся к клиенту")
-                                await client.connect()
-                                print(f"[BOT] init_bot: клиент подключен, регистрируем бота")
-                                await userbot_manager.start_bot("main", client)
-                                print(f"[BOT] init_bot: бот зарегистрирован")
-                                return client
-                            except Exception as e:
-                                print(f"[BOT] init_bot: ошибка: {e}")
-                                import traceback
-                                traceback.print_exc()
-                                raise
-                        
-                        # Создаем новый event loop для бота
-                        bot_loop = asyncio.new_event_loop()
-                        
-                        def run_bot_in_thread():
-                            try:
-                                # Устанавливаем loop для этого потока
-                                asyncio.set_event_loop(bot_loop)
-                                
-                                # Сохраняем loop в userbot_manager ДО запуска бота
-                                userbot_manager.bot_loops['main'] = bot_loop
-                                
-                                # Запускаем бота
-                                print(f"[BOT] Запускаем бота в новом event loop")
-                                bot_loop.run_until_complete(init_bot())
-                                print(f"[BOT] Бот зарегистрирован, запускаем event loop с run_forever...")
-                                
-                                # Теперь запускаем loop бесконечно для обработки событий
-                                bot_loop.run_forever()
-                            except Exception as e:
-                                print(f"[BOT] Ошибка в run_bot_in_thread: {e}")
-                                import traceback
-                                traceback.print_exc()
-                                # Удаляем loop из словаря при ошибке
-                                if 'main' in userbot_manager.bot_loops:
-                                    del userbot_manager.bot_loops['main']
-                        
-                        # Запускаем поток для бота
-                        bot_thread = threading.Thread(target=run_bot_in_thread, daemon=True)
-                        bot_thread.start()
-                        print(f"[BOT] Поток бота запущен, event loop будет работать в фоне")
-                    except Exception as e:
-                        print(f"[BOT] Ошибка в потоке бота: {e}")
-                        import traceback
-                        traceback.print_exc()
-                
-                threading.Thread(target=start_bot_thread, daemon=True).start()
-                # Небольшая задержка
-                time.sleep(1)
-                bot_active = userbot_manager.is_bot_active('main')
+                logger.info(f"restore_session: бот не активен, запускаем бота...")
+                bot_control.start_bot(session_id, config.BOT_TRANSITION_TIMEOUT)
+                bot_active = bot_control.is_bot_active(session_id)
             
             return jsonify({
                 'success': True,
@@ -750,16 +1003,14 @@ def restore_session():
                 'bot_active': bot_active
             })
         else:
-            print(f"[API] restore_session: не удалось восстановить сессию")
+            logger.error(f"restore_session: не удалось восстановить сессию")
             return jsonify({
                 'success': False,
                 'error': 'Failed to restore session'
             }), 400
             
     except Exception as e:
-        print(f"[API] restore_session: ошибка: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"restore_session: ошибка: {e}")
         return jsonify({
             'success': False,
             'error': str(e)
@@ -774,44 +1025,29 @@ def logout():
     Returns:
         JSON с результатом операции
     """
-    global _bot_state_cache
-    
     try:
-        print(f"[API] logout вызван")
+        logger.debug(f"logout вызван")
+        session_id = get_session_id()
         # Останавливаем юзербота
-        if userbot_manager.is_bot_active("main"):
-            print(f"[API] logout: останавливаем бота")
-            async def stop_bot():
-                await userbot_manager.stop_bot("main")
-                # Обновляем кеш после остановки
-                _bot_state_cache['active'] = False
-                _bot_state_cache['timestamp'] = time.time()
-                print(f"[API] logout: кеш состояния бота обновлен (остановлен)")
-            # Создаем новый event loop для остановки бота
-            result, _ = auth_manager._run_async_in_new_loop(stop_bot(), timeout=5)
-            print(f"[API] logout: бот остановлен")
+        if bot_control.is_bot_active(session_id):
+            logger.info(f"logout: останавливаем бота")
+            bot_control.stop_bot(session_id, config.BOT_TRANSITION_TIMEOUT)
+            logger.info(f"logout: бот остановлен")
         else:
-            print(f"[API] logout: бот не был активен")
-            # Даже если бот не был активен, обновляем кеш для согласованности
-            _bot_state_cache['active'] = False
-            _bot_state_cache['timestamp'] = time.time()
+            logger.info(f"logout: бот не был активен")
+        # Обновляем кеш состояния бота (и если бот не был активен - для согласованности)
+        _set_bot_state_cache(session_id, False)
         
-        # Очищаем активные QR коды перед выходом
-        print(f"[API] logout: очищаем активные QR коды")
-        auth_manager.active_qr_codes.clear()
-        
-        # Выходим из аккаунта
-        auth_manager.logout()
-        print(f"[API] logout: успешно завершен")
+        # Выходим из аккаунта (QR-коды пользователя очищаются там же)
+        auth_manager.logout(session_id)
+        logger.info(f"logout: успешно завершен")
         
         return jsonify({
             'success': True
         })
         
     except Exception as e:
-        print(f"[API] logout: ошибка: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"logout: ошибка: {e}")
         return jsonify({
             'success': False,
             'error': str(e)
@@ -826,19 +1062,17 @@ def toggle_bot():
     Returns:
         JSON с результатом операции
     """
-    global _bot_state_cache
-    
     try:
-        print(f"[API] toggle_bot вызван")
+        logger.debug(f"toggle_bot вызван")
+        session_id = get_session_id()
         
-        # Проверяем авторизацию: бот активен, файл сессии существует, или _user_data установлен
-        bot_active = userbot_manager.is_bot_active('main')
-        session_path = auth_manager.get_session_path()
-        session_exists = Path(session_path).exists()
-        has_user_data = auth_manager.is_authorized()
+        # Проверяем авторизацию: бот активен, сессия сохранена, или user_data установлен
+        bot_active = bot_control.is_bot_active(session_id)
+        session_exists = auth_manager.has_session(session_id)
+        has_user_data = auth_manager.is_authorized(session_id)
         
         if not bot_active and not session_exists and not has_user_data:
-            print(f"[API] toggle_bot: пользователь не авторизован (бот не активен, файла сессии нет, _user_data нет)")
+            logger.info(f"toggle_bot: пользователь не авторизован (бот не активен, сессии нет, user_data нет)")
             return jsonify({
                 'success': False,
                 'error': 'Not authorized'
@@ -849,97 +1083,30 @@ def toggle_bot():
         
         if enabled:
             # Включаем бота (если еще не активен)
-            if not userbot_manager.is_bot_active("main"):
-                print(f"[API] toggle_bot: запускаем бота")
-                def start_bot_thread():
-                    try:
-                        print(f"[BOT] Запускаем бота в потоке {threading.current_thread().name}")
-                        async def init_bot():
-                            try:
-                                await asyncio.sleep(1)
-                                print(f"[BOT] init_bot: получаем путь к сессии")
-                                session_path = auth_manager.get_session_path()
-                                print(f"[BOT] init_bot: создаем клиента")
-                                from telethon import TelegramClient
-                                client = TelegramClient(str(session_path), config.API_ID, config.API_HASH)
-                                print(f"[BOT] init_bot: подключаемся к клиенту")
-                                await client.connect()
-                                print(f"[BOT] init_bot: клиент подключен, регистрируем бота")
-                                await userbot_manager.start_bot("main", client)
-                                print(f"[BOT] init_bot: бот зарегистрирован")
-                                return client
-                            except Exception as e:
-                                print(f"[BOT] init_bot: ошибка: {e}")
-                                import traceback
-                                traceback.print_exc()
-                                raise
-                        
-                        # Создаем новый event loop для бота
-                        bot_loop = asyncio.new_event_loop()
-                        
-                        def run_bot_in_thread():
-                            try:
-                                # Устанавливаем loop для этого потока
-                                asyncio.set_event_loop(bot_loop)
-                                
-                                # Сохраняем loop в userbot_manager ДО запуска бота
-                                userbot_manager.bot_loops['main'] = bot_loop
-                                
-                                # Запускаем бота
-                                print(f"[BOT] Запускаем бота в новом event loop")
-                                bot_loop.run_until_complete(init_bot())
-                                print(f"[BOT] Бот зарегистрирован, запускаем event loop с run_forever...")
-                                
-                                # Теперь запускаем loop бесконечно для обработки событий
-                                bot_loop.run_forever()
-                            except Exception as e:
-                                print(f"[BOT] Ошибка в run_bot_in_thread: {e}")
-                                import traceback
-                                traceback.print_exc()
-                                # Удаляем loop из словаря при ошибке
-                                if 'main' in userbot_manager.bot_loops:
-                                    del userbot_manager.bot_loops['main']
-                        
-                        # Запускаем поток для бота
-                        bot_thread = threading.Thread(target=run_bot_in_thread, daemon=True)
-                        bot_thread.start()
-                        print(f"[BOT] Поток бота запущен, event loop будет работать в фоне")
-                    except Exception as e:
-                        print(f"[BOT] Ошибка в потоке бота: {e}")
-                        import traceback
-                        traceback.print_exc()
-                threading.Thread(target=start_bot_thread, daemon=True).start()
-                # Небольшая задержка чтобы бот успел запуститься, затем проверяем реальное состояние
-                time.sleep(1.5)
+            if not bot_control.is_bot_active(session_id):
+                logger.info(f"toggle_bot: запускаем бота")
+                # Ответ уходит, как только бот запущен (или истек дедлайн)
+                bot_control.start_bot(session_id, config.BOT_TRANSITION_TIMEOUT)
             else:
-                print(f"[API] toggle_bot: бот уже активен")
+                logger.info(f"toggle_bot: бот уже активен")
         else:
             # Выключаем бота
-            if userbot_manager.is_bot_active("main"):
-                print(f"[API] toggle_bot: останавливаем бота")
-                async def stop_bot():
-                    await userbot_manager.stop_bot("main")
-                    # Обновляем кеш после остановки
-                    _bot_state_cache['active'] = False
-                    _bot_state_cache['timestamp'] = time.time()
-                    print(f"[API] toggle_bot: кеш состояния бота обновлен (остановлен)")
-                # Создаем новый event loop для остановки бота
-                result, _ = auth_manager._run_async_in_new_loop(stop_bot(), timeout=10)
-                print(f"[API] toggle_bot: бот остановлен")
+            if bot_control.is_bot_active(session_id):
+                logger.info(f"toggle_bot: останавливаем бота")
+                bot_control.stop_bot(session_id, config.BOT_TRANSITION_TIMEOUT)
+                logger.info(f"toggle_bot: бот остановлен")
             else:
-                print(f"[API] toggle_bot: бот не был активен")
+                logger.info(f"toggle_bot: бот не был активен")
                 # Даже если бот не был активен, обновляем кеш для согласованности
-                _bot_state_cache['active'] = False
-                _bot_state_cache['timestamp'] = time.time()
+                _set_bot_state_cache(session_id, False)
         
         # Проверяем реальное состояние бота после операции и возвращаем его
-        actual_bot_active = userbot_manager.is_bot_active('main')
-        print(f"[API] toggle_bot: реальное состояние бота после операции: {actual_bot_active}")
+        actual_bot_active = bot_control.is_bot_active(session_id)
+        logger.debug(f"toggle_bot: реальное состояние бота после операции: {actual_bot_active}")
         
         # Обновляем кеш состояния бота сразу после операции
-        _bot_state_cache['active'] = actual_bot_active
-        _bot_state_cache['timestamp'] = time.time()
-        print(f"[API] toggle_bot: кеш состояния бота обновлен: {actual_bot_active}")
+        _set_bot_state_cache(session_id, actual_bot_active)
+        logger.debug(f"toggle_bot: кеш состояния бота обновлен: {actual_bot_active}")
         
         return jsonify({
             'success': True,
@@ -947,110 +1114,19 @@ def toggle_bot():
         })
         
     except Exception as e:
-        print(f"[API] toggle_bot: ошибка: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"toggle_bot: ошибка: {e}")
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
 
-def start_bot_with_client(client, qr_loop=None):
-    """
-    Запускает бота с клиентом и запускает event loop в фоне для обработки событий
-    
-    Args:
-        client: TelegramClient с подключенным клиентом
-        qr_loop: Опциональный существующий event loop (игнорируется, всегда создаем новый для надежности)
-    
-    Returns:
-        bool: True если бот успешно запущен
-    """
-    global _bot_state_cache
-    
-    try:
-        async def init_bot():
-            try:
-                print(f"[BOT] init_bot: регистрируем бота")
-                await userbot_manager.start_bot("main", client)
-                print(f"[BOT] init_bot: бот зарегистрирован")
-                
-                # Обновляем кеш состояния бота после успешного запуска
-                _bot_state_cache['active'] = True
-                _bot_state_cache['timestamp'] = time.time()
-                print(f"[BOT] init_bot: кеш состояния бота обновлен (активен)")
-                
-                return client
-            except Exception as e:
-                print(f"[BOT] init_bot: ошибка: {e}")
-                import traceback
-                traceback.print_exc()
-                raise
-        
-        # Всегда создаем новый event loop для бота для надежности
-        # Использование существующего loop может привести к проблемам с закрытием или состоянием
-        print(f"[BOT] Создаем новый event loop для бота (qr_loop игнорируется для надежности)")
-        bot_loop = asyncio.new_event_loop()
-        
-        # Запускаем бота в отдельном потоке с выбранным loop
-        def run_bot_in_thread():
-            try:
-                # Устанавливаем loop для этого потока
-                asyncio.set_event_loop(bot_loop)
-                
-                # Сохраняем loop в userbot_manager ДО запуска бота
-                userbot_manager.bot_loops['main'] = bot_loop
-                
-                # Запускаем бота
-                print(f"[BOT] Запускаем бота в event loop")
-                bot_loop.run_until_complete(init_bot())
-                print(f"[BOT] Бот зарегистрирован, запускаем event loop с run_forever...")
-                
-                # Теперь запускаем loop бесконечно для обработки событий
-                bot_loop.run_forever()
-            except Exception as e:
-                print(f"[BOT] Ошибка в run_bot_in_thread: {e}")
-                import traceback
-                traceback.print_exc()
-                # Удаляем loop из словаря при ошибке
-                if 'main' in userbot_manager.bot_loops:
-                    del userbot_manager.bot_loops['main']
-        
-        # Запускаем поток для бота
-        bot_thread = threading.Thread(target=run_bot_in_thread, daemon=True)
-        bot_thread.start()
-        print(f"[BOT] Поток бота запущен, event loop будет работать в фоне")
-        
-        # Даем немного времени для запуска бота
-        time.sleep(1)
-        
-        return True
-    except Exception as e:
-        print(f"[BOT] Ошибка при запуске бота: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
-
-
-def cleanup_expired_qr_periodically():
-    """Периодически очищает истекшие QR-коды"""
-    print("[APP] Поток очистки QR-кодов запущен")
-    while True:
-        time.sleep(60)  # Проверка каждую минуту
-        try:
-            print("[APP] Запуск очистки истекших QR-кодов")
-            auth_manager.cleanup_expired_qr()
-        except Exception as e:
-            print(f"[APP] Ошибка при очистке истекших QR: {e}")
-
-
 def setup_keepalive():
     """Настраивает периодические запросы для поддержания сервиса активным (только для разработки)"""
     try:
         import requests
     except ImportError:
-        print("[KEEPALIVE] requests не установлен, keepalive отключен")
+        keepalive_logger.info("requests не установлен, keepalive отключен")
         return
     
     def ping_health():
@@ -1059,9 +1135,9 @@ def setup_keepalive():
             port = os.getenv('PORT', '5000')
             url = f'http://localhost:{port}/health'
             requests.get(url, timeout=5)
-            print("[KEEPALIVE] Health check sent")
+            keepalive_logger.debug("Health check sent")
         except Exception as e:
-            print(f"[KEEPALIVE] Error: {e}")
+            keepalive_logger.error(f"Error: {e}")
     
     # Запускаем ping каждые 50 секунд (меньше чем таймаут бездействия Render ~60 секунд)
     def keepalive_loop():
@@ -1070,17 +1146,7 @@ def setup_keepalive():
             ping_health()
     
     threading.Thread(target=keepalive_loop, daemon=True).start()
-    print("[KEEPALIVE] Keepalive thread started (only for local development)")
-
-
-def handle_user_logout():
-    """
-    Callback для вызова когда пользователь завершает сессию в Telegram
-    """
-    print(f"[APP] handle_user_logout вызван - пользователь завершил сессию в Telegram")
-    # Выполняем logout через auth_manager
-    auth_manager.logout()
-    print(f"[APP] handle_user_logout: данные очищены")
+    keepalive_logger.info("Keepalive thread started (only for local development)")
 
 
 if __name__ == '__main__':
@@ -1088,97 +1154,14 @@ if __name__ == '__main__':
     Path('templates').mkdir(exist_ok=True)
     Path('static').mkdir(exist_ok=True)
     
-    # Устанавливаем callback для logout
-    userbot_manager.set_logout_callback(handle_user_logout)
-    
-    # Очищаем temp файлы при старте
-    auth_manager.cleanup_temp_files()
-    
-    # Восстанавливаем сессии при запуске в отдельном потоке
-    def restore_and_start_bot():
-        """Восстанавливает сессию и запускает бота если сессия валидна"""
-        try:
-            # Ждем немного чтобы сервер запустился
-            time.sleep(2)
-            
-            # Восстанавливаем сессию
-            auth_manager.restore_sessions()
-            
-            # Если сессия восстановлена и бот не активен - запускаем бота
-            if auth_manager.is_authorized() and not userbot_manager.is_bot_active('main'):
-                print(f"[APP] Восстановлена сессия, запускаем бота...")
-                session_path = auth_manager.get_session_path()
-                if Path(session_path).exists():
-                    def start_bot_from_session():
-                        try:
-                            print(f"[BOT] Запускаем бота из восстановленной сессии")
-                            async def init_bot():
-                                try:
-                                    await asyncio.sleep(1)
-                                    print(f"[BOT] init_bot: создаем клиента из сессии")
-                                    from telethon import TelegramClient
-                                    client = TelegramClient(str(session_path), config.API_ID, config.API_HASH)
-                                    print(f"[BOT] init_bot: подключаемся к клиенту")
-                                    await client.connect()
-                                    print(f"[BOT] init_bot: клиент подключен, регистрируем бота")
-                                    await userbot_manager.start_bot("main", client)
-                                    print(f"[BOT] init_bot: бот зарегистрирован")
-                                    return client
-                                except Exception as e:
-                                    print(f"[BOT] init_bot: ошибка: {e}")
-                                    import traceback
-                                    traceback.print_exc()
-                                    raise
-                            
-                            # Создаем новый event loop для бота
-                            bot_loop = asyncio.new_event_loop()
-                            
-                            def run_bot_in_thread():
-                                try:
-                                    # Устанавливаем loop для этого потока
-                                    asyncio.set_event_loop(bot_loop)
-                                    
-                                    # Сохраняем loop в userbot_manager ДО запуска бота
-                                    userbot_manager.bot_loops['main'] = bot_loop
-                                    
-                                    # Запускаем бота
-                                    print(f"[BOT] Запускаем бота в новом event loop")
-                                    bot_loop.run_until_complete(init_bot())
-                                    print(f"[BOT] Бот зарегистрирован, запускаем event loop с run_forever...")
-                                    
-                                    # Теперь запускаем loop бесконечно для обработки событий
-                                    bot_loop.run_forever()
-                                except Exception as e:
-                                    print(f"[BOT] Ошибка в run_bot_in_thread: {e}")
-                                    import traceback
-                                    traceback.print_exc()
-                                    # Удаляем loop из словаря при ошибке
-                                    if 'main' in userbot_manager.bot_loops:
-                                        del userbot_manager.bot_loops['main']
-                            
-                            # Запускаем поток для бота
-                            bot_thread = threading.Thread(target=run_bot_in_thread, daemon=True)
-                            bot_thread.start()
-                            print(f"[BOT] Поток бота запущен, event loop будет работать в фоне")
-                        except Exception as e:
-                            print(f"[BOT] Ошибка при запуске бота из сессии: {e}")
-                            import traceback
-                            traceback.print_exc()
-                    
-                    threading.Thread(target=start_bot_from_session, daemon=True).start()
-                else:
-                    print(f"[APP] Файл сессии не найден, бот не запускается")
-            else:
-                print(f"[APP] Сессия не восстановлена или бот уже активен")
-        except Exception as e:
-            print(f"[APP] Ошибка при восстановлении и запуске бота: {e}")
-            import traceback
-            traceback.print_exc()
-    
-    threading.Thread(target=restore_and_start_bot, daemon=True).start()
+    if supervisor is None:
+        # Очищаем temp файлы, оставшиеся от прежних запусков (новые temp сессии живут в памяти)
+        auth_manager.cleanup_temp_files()
+        # Восстанавливаем сессии всех пользователей и запускаем их ботов в отдельном потоке
+        # (с супервизором это делает он сам)
+        threading.Thread(target=bot_control.restore_and_start_bots, daemon=True).start()
     
-    # Запускаем периодическую очистку истекших QR
-    threading.Thread(target=cleanup_expired_qr_periodically, daemon=True).start()
+    # Истекшие QR удаляет планировщик дедлайнов auth_manager (см. expiry_scheduler.py)
     
     # Запускаем keepalive для бесплатного тарифа Render (только если не в production через gunicorn)
     if os.getenv('GUNICORN_WORKERS') is None:  # Значит запущен через python app.py
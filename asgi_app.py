@@ -0,0 +1,304 @@
+"""
+ASGI вариант веб-приложения: маршруты и логика ответов общие с app.py
+
+Горячие маршруты (/api/generate_qr, /api/check_status, /api/submit_password, /api/events) -
+корутины: работа с Telegram ждется в общем event loop (async_runtime) через asyncio.wrap_future,
+чтение общего состояния - в его потоке, а поток /api/events ждет событий в event loop сервера.
+Ни один из них не занимает поток на время запроса. Остальные (редкие) маршруты обслуживает
+то же Flask приложение через адаптер asgiref
+
+Запуск: uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+"""
+import re
+import json
+import time
+import asyncio
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.http import dump_cookie
+from app import (
+    app as flask_app, auth_manager, bot_control, supervisor, ApiResult, POLL_ENDPOINTS,
+    GENERATE_QR_TIMEOUT, SUBMIT_PASSWORD_TIMEOUT, SSE_KEEPALIVE_INTERVAL, SSE_RETRY, SSE_KEEPALIVE,
+    resolve_session_id, request_id_from_header, requested_qr_format, run_blocking, bot_status_event,
+    generate_qr_result, check_status_result, submit_password_result,
+)
+from async_runtime import async_runtime
+from event_bus import event_bus, format_sse
+from metrics import HTTP_REQUESTS, HTTP_REQUEST_DURATION
+from tracing import tracer
+from log_pipeline import log_pipeline, get_logger
+
+logger = get_logger("APP")
+api_logger = get_logger("API")
+
+# Максимальный размер тела запроса горячих маршрутов (JSON с форматом или паролем)
+MAX_BODY_SIZE = 64 * 1024
+
+
+class Request:
+    """
+    Разобранный запрос горячего маршрута: параметры пути и query, тело и ID пользователя из cookie
+    """
+
+    def __init__(self, scope: dict, body: bytes, params: Dict[str, str]):
+        self.method = scope["method"]
+        self.params = params
+        self.query = {key: values[0] for key, values in parse_qs(scope.get("query_string", b"").decode("latin-1")).items()}
+        self.headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope.get("headers", ())}
+        self.body = body
+        self.session_id, created = resolve_session_id(self._cookie_session_id())
+        # Новому пользователю ID записывается в ту же подписанную cookie, что выдает Flask
+        self.set_cookie = _session_cookie(self.session_id) if created else None
+
+    def json(self):
+        """
+        Тело запроса как JSON (None, если тело пустое или не JSON)
+        """
+        try:
+            return json.loads(self.body) if self.body else None
+        except ValueError:
+            return None
+
+    def query_int(self, name: str) -> Optional[int]:
+        try:
+            return int(self.query[name])
+        except (KeyError, ValueError):
+            return None
+
+    def _cookie_session_id(self) -> Optional[str]:
+        interface = flask_app.session_interface
+        name = interface.get_cookie_name(flask_app)
+        cookies = {}
+        for part in self.headers.get("cookie", "").split(";"):
+            key, _, value = part.strip().partition("=")
+            cookies.setdefault(key, value)
+        if not cookies.get(name):
+            return None
+        try:
+            data = interface.get_signing_serializer(flask_app).loads(
+                cookies[name], max_age=int(flask_app.permanent_session_lifetime.total_seconds())
+            )
+        except Exception:
+            return None
+        return data.get("session_id") if isinstance(data, dict) else None
+
+
+def _session_cookie(session_id: str) -> str:
+    """
+    Заголовок Set-Cookie постоянной сессии Flask с ID пользователя
+    """
+    interface = flask_app.session_interface
+    value = interface.get_signing_serializer(flask_app).dumps({"_permanent": True, "session_id": session_id})
+    return dump_cookie(
+        interface.get_cookie_name(flask_app),
+        value,
+        max_age=flask_app.permanent_session_lifetime,
+        path=interface.get_cookie_path(flask_app),
+        domain=interface.get_cookie_domain(flask_app),
+        secure=interface.get_cookie_secure(flask_app),
+        httponly=interface.get_cookie_httponly(flask_app),
+        samesite=interface.get_cookie_samesite(flask_app),
+    )
+
+
+async def in_runtime(coro, timeout: float) -> ApiResult:
+    """
+    Ждет корутину маршрута в общем event loop, не занимая поток (504 при таймауте)
+    """
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(async_runtime.submit(coro)), timeout)
+    except asyncio.TimeoutError:
+        error = f"Таймаут при выполнении операции ({timeout} секунд)"
+        api_logger.error(f"Маршрут: {error}")
+        return ApiResult({"success": False, "error": error}, 504)
+
+
+class AsgiApp:
+    """
+    ASGI приложение: горячие маршруты - корутины, остальные - Flask приложение, lifespan запускает ботов
+    """
+
+    def __init__(self):
+        self._wsgi = WsgiToAsgi(flask_app)
+        self._started = False
+        # (метод, шаблон пути для метрик, регулярное выражение, обработчик, имя маршрута Flask)
+        self._routes: List[Tuple[str, str, re.Pattern, Callable, str]] = [
+            ("POST", "/api/generate_qr", re.compile(r"/api/generate_qr"), self.generate_qr, "generate_qr"),
+            ("GET", "/api/check_status/<qr_id>", re.compile(r"/api/check_status/(?P<qr_id>[^/]+)"),
+             self.check_status, "check_status"),
+            ("POST", "/api/submit_password/<qr_id>", re.compile(r"/api/submit_password/(?P<qr_id>[^/]+)"),
+             self.submit_password, "submit_password"),
+            ("GET", "/api/events", re.compile(r"/api/events"), self.events, "events"),
+        ]
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] == "http":
+            for method, rule, pattern, handler, endpoint in self._routes:
+                match = pattern.fullmatch(scope["path"])
+                if match and scope["method"] == method:
+                    await self.dispatch(scope, receive, send, rule, handler, endpoint, match.groupdict())
+                    return
+        # Остальные маршруты: Flask приложение, каждый запрос в своем потоке
+        # (без отдельного контекста asgiref выполнял бы все запросы в одном общем потоке)
+        async with ThreadSensitiveContext():
+            await self._wsgi(scope, receive, send)
+
+    async def dispatch(self, scope: dict, receive: Callable, send: Callable, rule: str,
+                       handler: Callable, endpoint: str, params: Dict[str, str]):
+        """
+        Выполняет горячий маршрут с теми же метриками, спаном запроса и выборкой логов, что и в Flask
+        """
+        started_at = time.perf_counter()
+        span = None
+        if tracer.enabled:
+            request_id = request_id_from_header(_header(scope, b"x-request-id"))
+            span = tracer.start_span(f"HTTP {scope['method']} {rule}", request_id=request_id)
+        if endpoint in POLL_ENDPOINTS:
+            log_pipeline.sample_poll_request()
+        status = 500
+        error = None
+        try:
+            body = await _read_body(receive) if scope["method"] == "POST" else b""
+            request = Request(scope, body, params)
+
+            async def start_response(code: int, content_type: str, headers: Optional[Dict[str, str]] = None):
+                nonlocal status
+                status = code
+                HTTP_REQUEST_DURATION.observe(time.perf_counter() - started_at, route=rule, method=request.method)
+                HTTP_REQUESTS.inc(route=rule, method=request.method, status=str(code))
+                raw = [(b"content-type", content_type.encode())]
+                raw += [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+                if request.set_cookie:
+                    raw.append((b"set-cookie", request.set_cookie.encode("latin-1")))
+                if span is not None:
+                    span.set(status=code)
+                    raw.append((b"x-request-id", span.request_id.encode()))
+                await send({"type": "http.response.start", "status": code, "headers": raw})
+
+            result = await handler(request, start_response, receive, send)
+            if result is not None:
+                await start_response(result.status, "application/json", result.headers)
+                await send({"type": "http.response.body",
+                            "body": json.dumps(result.payload, ensure_ascii=False).encode("utf-8")})
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if span is not None:
+                tracer.end_span(span, error if not isinstance(error, asyncio.CancelledError) else None)
+
+    async def generate_qr(self, request: Request, *_) -> ApiResult:
+        qr_format = requested_qr_format(request.json(), request.query.get("format"))
+        return await in_runtime(generate_qr_result(request.session_id, qr_format), GENERATE_QR_TIMEOUT)
+
+    async def check_status(self, request: Request, *_) -> ApiResult:
+        # Только чтение общего состояния (результат задачи ожидания QR-кода) - в его потоке
+        return await run_blocking(
+            check_status_result, request.session_id, request.params["qr_id"], request.query_int("v")
+        )
+
+    async def submit_password(self, request: Request, *_) -> ApiResult:
+        data = request.json()
+        password = data.get("password") if isinstance(data, dict) else None
+        return await in_runtime(
+            submit_password_result(request.session_id, request.params["qr_id"], password), SUBMIT_PASSWORD_TIMEOUT
+        )
+
+    async def events(self, request: Request, start_response: Callable, receive: Callable, send: Callable):
+        """
+        Поток Server-Sent Events: ждет событий в event loop сервера, поток не занимается
+        """
+        session_id = request.session_id
+        subscriber = event_bus.subscribe_async(session_id)
+        api_logger.debug(f"events: новый подписчик, всего: {event_bus.subscriber_count()}")
+        disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+
+        async def send_chunk(chunk: str):
+            await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+
+        try:
+            await start_response(200, "text/event-stream; charset=utf-8",
+                                 {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+            await send_chunk(SSE_RETRY)
+            # Сразу отдаем текущее состояние бота
+            await send_chunk(format_sse("bot_status", await run_blocking(bot_status_event, session_id)))
+            while True:
+                next_event = asyncio.ensure_future(subscriber.get())
+                done, _ = await asyncio.wait(
+                    {next_event, disconnected}, timeout=SSE_KEEPALIVE_INTERVAL, return_when=asyncio.FIRST_COMPLETED
+                )
+                if next_event not in done:
+                    next_event.cancel()
+                if disconnected in done:
+                    break
+                await send_chunk(format_sse(*next_event.result()) if next_event in done else SSE_KEEPALIVE)
+        finally:
+            disconnected.cancel()
+            event_bus.unsubscribe(session_id, subscriber)
+            api_logger.debug(f"events: подписчик отключен, осталось: {event_bus.subscriber_count()}")
+
+    async def lifespan(self, receive: Callable, send: Callable):
+        """
+        Старт и остановка сервера: при старте восстанавливаются сессии и запускаются боты
+        """
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def startup(self):
+        """
+        То же, что делает python app.py при запуске (с супервизором ботов это делает он сам)
+        """
+        if self._started or supervisor is not None:
+            return
+        self._started = True
+        # Очищаем temp файлы, оставшиеся от прежних запусков
+        auth_manager.cleanup_temp_files()
+        threading.Thread(target=bot_control.restore_and_start_bots, name="restore-bots", daemon=True).start()
+        logger.info("ASGI приложение запущено")
+
+
+def _header(scope: dict, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", ()):
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def _read_body(receive: Callable) -> bytes:
+    """
+    Читает тело запроса (сверх MAX_BODY_SIZE - обрезается, такой JSON все равно не разберется)
+    """
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunk = message.get("body", b"")
+        if size < MAX_BODY_SIZE:
+            chunks.append(chunk)
+            size += len(chunk)
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+async def _wait_disconnect(receive: Callable):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+# Глобальное ASGI приложение для uvicorn
+app = AsgiApp()
@@ -0,0 +1,133 @@
+"""
+Общий asyncio runtime: один долгоживущий event loop в фоновом потоке
+"""
+import asyncio
+import threading
+import concurrent.futures
+from typing import Optional
+from log_pipeline import get_logger
+from tracing import tracer
+
+logger = get_logger("RUNTIME")
+
+
+class AsyncRuntime:
+    """
+    Класс для выполнения корутин в едином фоновом event loop
+    Все TelegramClient (QR, бот, проверки сессии) живут в этом loop,
+    поэтому loop не создается на каждый запрос и не утекает вместе с селектором
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """
+        Возвращает общий event loop, запуская его при первом обращении
+
+        Returns:
+            asyncio.AbstractEventLoop: Запущенный event loop
+        """
+        if self._loop is None or self._loop.is_closed():
+            self.start()
+        return self._loop
+
+    def start(self):
+        """
+        Запускает фоновый поток с event loop (повторный вызов ничего не делает)
+        """
+        with self._lock:
+            if self._loop is not None and not self._loop.is_closed():
+                return
+
+            loop = asyncio.new_event_loop()
+            started = threading.Event()
+
+            def run_loop():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(started.set)
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=run_loop, name="async-runtime", daemon=True)
+            self._thread.start()
+            started.wait()
+            self._loop = loop
+            logger.info(f"Общий event loop запущен в потоке {self._thread.name}")
+
+    def is_running(self) -> bool:
+        """
+        Проверяет, запущен ли общий event loop
+
+        Returns:
+            bool: True если loop работает
+        """
+        return self._loop is not None and self._loop.is_running()
+
+    def in_runtime_thread(self) -> bool:
+        """
+        Проверяет, выполняется ли код внутри потока общего event loop
+
+        Returns:
+            bool: True если вызов сделан из потока runtime
+        """
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """
+        Отправляет корутину в общий loop без ожидания результата
+
+        Args:
+            coro: Корутина для выполнения
+
+        Returns:
+            concurrent.futures.Future: Future с результатом корутины
+        """
+        # Текущий спан запроса продолжается внутри корутины в потоке loop
+        return asyncio.run_coroutine_threadsafe(tracer.bind_coroutine(coro), self.loop)
+
+    def run(self, coro, timeout=60):
+        """
+        Выполняет корутину в общем loop и блокирует вызывающий поток до результата
+
+        Args:
+            coro: Корутина для выполнения
+            timeout: Таймаут в секундах
+
+        Returns:
+            Результат выполнения корутины
+        """
+        if self.in_runtime_thread():
+            coro.close()
+            raise RuntimeError("AsyncRuntime.run() нельзя вызывать из потока общего event loop")
+
+        future = asyncio.run_coroutine_threadsafe(
+            asyncio.wait_for(tracer.bind_coroutine(coro), timeout=timeout), self.loop
+        )
+        try:
+            # Небольшой запас сверх wait_for, чтобы таймаут сработал внутри loop
+            return future.result(timeout=timeout + 5 if timeout else None)
+        except (asyncio.TimeoutError, concurrent.futures.TimeoutError):
+            future.cancel()
+            raise TimeoutError(f"Таймаут при выполнении операции ({timeout} секунд)")
+
+    def stop(self):
+        """
+        Останавливает общий event loop и дожидается завершения потока
+        """
+        with self._lock:
+            loop = self._loop
+            if loop is None or loop.is_closed():
+                return
+            loop.call_soon_threadsafe(loop.stop)
+            if self._thread is not None:
+                self._thread.join(timeout=5)
+            loop.close()
+            self._loop = None
+            self._thread = None
+
+
+# Глобальный экземпляр общего runtime
+async_runtime = AsyncRuntime()
@@ -4,755 +4,993 @@
 import time
 import uuid
 import asyncio
-from pathlib import Path
-from typing import Optional, Dict, List
+from contextlib import contextmanager
+from typing import Optional, Dict, List, Callable, Awaitable
 from telethon import TelegramClient
-from telethon.errors import SessionPasswordNeededError
-import qrcode
-import io
+from telethon.tl.types import InputPeerPhotoFileLocation, InputPeerSelf
+from telethon.errors import (
+    SessionPasswordNeededError, AuthKeyUnregisteredError, SessionRevokedError, UnauthorizedError
+)
 import base64
-from PIL import Image, ImageDraw
 import config
+from async_runtime import async_runtime
+from client_pool import qr_client_pool
+from event_bus import event_bus
+from qr_image_store import QRImage, qr_image_store
+from expiry_scheduler import ExpiryScheduler
+from qr_registry import QRRegistry, QRCapacityError
+from session_store import session_store
+from session_validity import session_validity
+from metrics import QR_GENERATE_PHASE
+from tracing import tracer
+from photo_cache import photo_cache, source_variant, downscale_photo, DEFAULT_PHOTO_SIZE
+from profile_cache import profile_cache
+from shared_state import shared_state
+from qr_renderer import (
+    render_qr_image, render_qr_png1, render_qr_svg, render_qr_modules, encode_png, QR_FORMATS,
+    DEFAULT_QR_FORMAT
+)
+from log_pipeline import get_logger
+
+logger = get_logger("AUTH")
+
+
+@contextmanager
+def qr_phase(phase: str):
+    """
+    Фаза генерации QR-кода: гистограмма qr_generate_phase_seconds и спан qr.<фаза>
+    """
+    with QR_GENERATE_PHASE.time(phase=phase), tracer.span(f"qr.{phase}"):
+        yield
+
+# Запас в секундах после истечения токена, пока он обновляется через recreate()
+QR_REFRESH_GRACE = 10
 
 
 class AuthManager:
     """
     Класс для управления авторизацией через QR-код
-    Однопользовательская система - одна сессия для всего приложения
+    Несколько пользователей в одном процессе: у каждого свой session_id и своя сохраненная сессия
+    (см. tenants.py), все клиенты живут в общем event loop без потоков на пользователя
     """
     
     def __init__(self):
-        # Словарь для хранения активных QR-кодов
-        # Каждый QR-код хранит: qr_login, qr_client, event_loop, expires_at, temp_session
-        self.active_qr_codes: Dict[str, dict] = {}
-        # Постоянный путь к единственной сессии (одна сессия на весь проекта)
-        self.session_path = config.SESSIONS_DIR / "user.session"
-        # Данные текущего пользователя
-        self._user_data: Optional[Dict] = None
+        # Реестр активных QR-кодов всех пользователей: {qr_id: qr_data} в порядке последнего опроса
+        # Каждый QR-код хранит: session_id, qr_login, qr_client, expires_at, temp_session
+        # Все клиенты живут в общем event loop из async_runtime
+        self.active_qr_codes = QRRegistry(config.QR_MAX_PENDING, config.QR_IDLE_EVICT_AFTER)
+        # Авторизованные пользователи хранятся в shared_state (видны всем воркерам), профили - в profile_cache
+        # Async callback(session_id, client): забирает подключенный клиент после входа (запуск бота)
+        self._authorized_callback: Optional[Callable[[str, TelegramClient], Awaitable[bool]]] = None
+        # Дедлайны QR-кодов: запись удаляется ровно в момент истечения, без периодического обхода
+        self._qr_expiry = ExpiryScheduler(self._on_qr_deadline, name="qr-expiry")
     
-    def _run_async_in_new_loop(self, coro, timeout=60):
+    def _run_async(self, coro, timeout=60):
         """
-        Запускает async функцию в новом event loop (для каждого запроса)
-        Это более надежный подход для Render на бесплатном тарифе
+        Выполняет async функцию в общем event loop приложения
         
         Args:
             coro: Корутина для выполнения
             timeout: Таймаут в секундах
             
         Returns:
-            tuple: (результат, event_loop) - результат выполнения и loop для сохранения
+            Результат выполнения корутины
         """
-        print(f"[AUTH] _run_async_in_new_loop: создаем новый event loop для выполнения корутины")
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
         try:
-            print(f"[AUTH] _run_async_in_new_loop: запускаем корутину с таймаутом {timeout} секунд...")
-            result = loop.run_until_complete(asyncio.wait_for(coro, timeout=timeout))
-            print(f"[AUTH] _run_async_in_new_loop: корутина завершена успешно")
-            return result, loop
-        except asyncio.TimeoutError:
-            print(f"[AUTH] _run_async_in_new_loop: ТАЙМАУТ при выполнении корутины (timeout={timeout})")
-            loop.close()
-            raise TimeoutError(f"Таймаут при выполнении операции ({timeout} секунд)")
+            return async_runtime.run(coro, timeout=timeout)
+        except TimeoutError:
+            logger.warning(f"_run_async: ТАЙМАУТ при выполнении корутины (timeout={timeout})")
+            raise
+        except QRCapacityError:
+            # Ожидаемый отказ (ответ 429) - не ошибка
+            raise
         except Exception as e:
-            print(f"[AUTH] _run_async_in_new_loop: ОШИБКА при выполнении корутины: {type(e).__name__}: {e}")
-            import traceback
-            traceback.print_exc()
-            loop.close()
+            logger.exception(f"_run_async: ОШИБКА при выполнении корутины: {type(e).__name__}: {e}")
             raise
     
-    def _run_async_in_existing_loop(self, coro, loop, timeout=None):
+    def set_authorized_callback(self, callback: Callable[[str, TelegramClient], Awaitable[bool]]):
         """
-        Запускает async функцию в существующем event loop
+        Устанавливает async callback, которому передается авторизованный клиент QR-кода
+        Вызывается в общем event loop сразу после входа: клиент уже подключен, переподключение не нужно
         
         Args:
-            coro: Корутина для выполнения
-            loop: Существующий event loop
-            timeout: Таймаут в секундах
-            
-        Returns:
-            Результат выполнения корутины
+            callback: Корутина callback(session_id, client) -> bool
         """
-        print(f"[AUTH] _run_async_in_existing_loop: используем существующий event loop")
-        try:
-            if loop.is_closed():
-                raise RuntimeError("Event loop закрыт!")
-            
-            if loop.is_running():
-                # Loop уже запущен в другом потоке - используем run_coroutine_threadsafe
-                print(f"[AUTH] _run_async_in_existing_loop: loop запущен, используем run_coroutine_threadsafe")
-                future = asyncio.run_coroutine_threadsafe(coro, loop)
-                result = future.result(timeout=timeout or 60)
-            else:
-                # Loop не запущен - запускаем синхронно
-                print(f"[AUTH] _run_async_in_existing_loop: loop не запущен, запускаем run_until_complete")
-                if timeout:
-                    result = loop.run_until_complete(asyncio.wait_for(coro, timeout=timeout))
-                else:
-                    result = loop.run_until_complete(coro)
-            
-            print(f"[AUTH] _run_async_in_existing_loop: корутина завершена успешно")
-            return result
-        except Exception as e:
-            print(f"[AUTH] _run_async_in_existing_loop: ОШИБКА: {type(e).__name__}: {e}")
-            import traceback
-            traceback.print_exc()
-            raise
+        self._authorized_callback = callback
     
-    def is_authorized(self) -> bool:
+    def is_authorized(self, session_id: str) -> bool:
         """
-        Проверяет, авторизован ли пользователь
+        Проверяет, авторизован ли пользователь (сессия сохранена; видно всем воркерам)
+        
+        Args:
+            session_id: ID пользователя
         
         Returns:
             bool: True если авторизован
         """
-        return self._user_data is not None
+        return shared_state.is_authorized(session_id)
     
-    def get_user_data(self) -> Optional[Dict]:
+    def get_user_data(self, session_id: str) -> Optional[Dict]:
         """
-        Возвращает данные текущего пользователя
+        Возвращает данные пользователя из кеша профилей (без обращения к Telegram)
+        
+        Args:
+            session_id: ID пользователя
         
         Returns:
             Dict или None
         """
-        return self._user_data
+        if not self.is_authorized(session_id):
+            return None
+        return profile_cache.get(session_id)
+    
+    def _get_qr(self, qr_id: str, session_id: str) -> Optional[dict]:
+        """
+        Возвращает запись QR-кода, только если она принадлежит этому пользователю
+        QR-код другого воркера возвращается снимком из shared_state (без клиента)
         
-    def generate_qr_code_url(self) -> tuple[str, str]:
+        Args:
+            qr_id: ID QR-кода
+            session_id: ID пользователя
+            
+        Returns:
+            dict или None
+        """
+        qr_data = self.active_qr_codes.get(qr_id)
+        if qr_data is None:
+            snapshot = shared_state.get_qr(qr_id)
+            if snapshot is None or snapshot.get("session_id") != session_id:
+                return None
+            return snapshot
+        if qr_data.get("session_id") != session_id:
+            return None
+        # Любое обращение браузера к QR-коду - это опрос: запись не будет вытеснена как брошенная
+        self.active_qr_codes.touch(qr_id)
+        return qr_data
+    
+    def owns_qr(self, qr_id: str) -> bool:
         """
-        Генерирует новый QR-код для авторизации и сохраняет как файл
+        Проверяет, живет ли клиент QR-кода в этом воркере (нужно для ввода пароля 2FA)
         
+        Args:
+            qr_id: ID QR-кода
+            
         Returns:
-            tuple: (qr_id, qr_url) - ID QR-кода и URL на изображение
+            bool: True если запись QR-кода в реестре этого воркера
         """
-        # Если уже авторизован, не генерируем новый QR
-        if self.is_authorized():
-            raise Exception("Already authorized")
+        return qr_id in self.active_qr_codes
+    
+    def _publish_qr(self, qr_id: str, qr_data: dict):
+        """
+        Публикует состояние QR-кода (и изображение из хранилища) для других воркеров
         
-        # Удаляем все старые temp файлы перед генерацией нового QR
-        self.cleanup_temp_files()
+        Args:
+            qr_id: ID QR-кода
+            qr_data: Запись QR-кода
+        """
+        image = qr_image_store.get(qr_id) if qr_data.get("status") == "pending" else None
+        # Запись в SQLite - в потоке общего состояния (снимок полей берется сейчас)
+        shared_state.post(shared_state.put_qr, qr_id, dict(qr_data), image.data if image else None)
+    
+    def _admit_qr(self, session_id: str):
+        """
+        Освобождает место под новый QR-код пользователя: удаляет его прежние QR-коды
+        и занимает слот в реестре (вытесняя самый давно опрошенный брошенный QR-код)
+        После регистрации QR-кода слот нужно вернуть через active_qr_codes.release()
         
-        try:
-            # Генерируем уникальный ID для QR-кода
-            qr_id = str(uuid.uuid4())
-            
-            # Создаем временную сессию для этого QR-кода
-            temp_session = config.SESSIONS_DIR / f"temp_{qr_id}.session"
-            
-            # Создаем клиент для QR авторизации
-            qr_client = TelegramClient(str(temp_session), config.API_ID, config.API_HASH)
-            
-            # Получаем QR-код для авторизации
-            async def get_qr_login():
-                await qr_client.connect()
-                if not await qr_client.is_user_authorized():
-                    qr_login = await qr_client.qr_login()
-                    return qr_login
-                else:
-                    await qr_client.disconnect()
-                    raise Exception("Client already authorized")
-            
-            # Используем новый event loop для каждого запроса
-            result, qr_loop = self._run_async_in_new_loop(get_qr_login(), timeout=60)
-            qr_login = result
-            qr_url = qr_login.url
-            
-            # Сохраняем информацию о QR-коде вместе с event loop
-            self.active_qr_codes[qr_id] = {
-                "qr_login": qr_login,
-                "qr_client": qr_client,
-                "event_loop": qr_loop,
-                "expires_at": time.time() + config.QR_CODE_TIMEOUT,
-                "temp_session": str(temp_session),
-            }
-            
-            # Генерируем QR-код
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(qr_url)
-            qr.make(fit=True)
-            
-            # Создаем изображение в RGB режиме для четких квадратов
-            img = qr.make_image(fill_color="black", back_color="white")
-            # Конвертируем в RGB если изображение в другом режиме (например, '1' для монохромного)
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Добавляем логотип в центр QR-кода
-            width, height = img.size
-            
-            # Загружаем логотип
-            logo_path = Path(config.SESSIONS_DIR.parent) / 'static' / 'img' / 'tg_icon.png'
-            if logo_path.exists():
-                logo = Image.open(str(logo_path))
-                
-                # Конвертируем в RGBA для сохранения прозрачности
-                if logo.mode != 'RGBA':
-                    if logo.mode == 'P' and 'transparency' in logo.info:
-                        logo = logo.convert('RGBA')
-                    else:
-                        logo = logo.convert('RGBA')
-                
-                # Размер логотипа: примерно 15% от размера QR-кода
-                logo_size = int(min(width, height) * 0.15)
-                logo = logo.resize((logo_size, logo_size), Image.Resampling.LANCZOS)
-                
-                # Вычисляем центр QR-кода
-                center_x = width // 2
-                center_y = height // 2
-                
-                # Вычисляем радиус белой круглой зоны: логотип + 5px с каждой стороны (итого +10px диаметра)
-                # Радиус = (логотип + 10px) / 2
-                white_zone_radius = (logo_size + 10) // 2
-                
-                # Создаем белую круглую зону в центре QR-кода
-                draw = ImageDraw.Draw(img)
-                # Рисуем белый круг
-                draw.ellipse(
-                    [
-                        center_x - white_zone_radius,
-                        center_y - white_zone_radius,
-                        center_x + white_zone_radius,
-                        center_y + white_zone_radius
-                    ],
-                    fill='white'
-                )
-                
-                # Вычисляем позицию для размещения логотипа (по центру белой зоны)
-                logo_position_x = center_x - logo_size // 2
-                logo_position_y = center_y - logo_size // 2
-                
-                # Вставляем логотип с сохранением прозрачности
-                img.paste(logo, (logo_position_x, logo_position_y), logo)
-            
-            # Создаем директорию для QR-кодов если её нет
-            qr_dir = Path(config.SESSIONS_DIR.parent) / 'static' / 'qr'
-            qr_dir.mkdir(parents=True, exist_ok=True)
-            
-            # Сохраняем QR-код как файл
-            qr_filename = f"{qr_id}.png"
-            qr_filepath = qr_dir / qr_filename
-            img.save(qr_filepath, 'PNG')
-            
-            # Сохраняем путь к файлу в данных QR-кода
-            self.active_qr_codes[qr_id]['qr_file'] = str(qr_filepath)
-            
-            # Возвращаем URL
-            qr_url_path = f"/static/qr/{qr_filename}"
-            
-            return qr_id, qr_url_path
+        Args:
+            session_id: ID пользователя
             
-        except Exception as e:
-            print(f"[AUTH] Ошибка при генерации QR-кода: {e}")
-            import traceback
-            traceback.print_exc()
-            raise
+        Raises:
+            QRCapacityError: Лимит ожидающих QR-логинов достигнут
+        """
+        # Очищаем старые QR-коды этого пользователя и отключаем их клиентов в фоне
+        for qr_id, qr_data in self.active_qr_codes.items():
+            if qr_data.get("session_id") == session_id:
+                self._discard_qr(qr_id)
+        
+        for qr_id, qr_data in self.active_qr_codes.reserve():
+            logger.info(f"Лимит QR-логинов достигнут, вытесняем давно не опрашиваемый QR: {qr_id}")
+            self._set_qr_status(qr_id, qr_data, "expired")
+            self._discard_qr(qr_id, qr_data)
+        
+    def generate_qr_code_url(self, session_id: str) -> tuple[str, str]:
+        """
+        Генерирует новый QR-код для авторизации и кладет изображение в хранилище в памяти
+        
+        Args:
+            session_id: ID пользователя
+        
+        Returns:
+            tuple: (qr_id, qr_url) - ID QR-кода и URL на изображение
+        """
+        return self._run_async(self.generate_qr_code_url_async(session_id), timeout=90)
+    
+    async def generate_qr_code_url_async(self, session_id: str) -> tuple[str, str]:
+        """
+        То же, что generate_qr_code_url(), для вызова из корутины в общем event loop
+        
+        Args:
+            session_id: ID пользователя
+        
+        Returns:
+            tuple: (qr_id, qr_url) - ID QR-кода и URL на изображение
+        """
+        return await self._create_qr(session_id, output="store")
     
-    def generate_qr_code(self) -> tuple[str, str]:
+    def generate_qr_code(self, session_id: str, qr_format: str = DEFAULT_QR_FORMAT) -> tuple[str, Dict]:
         """
         Генерирует новый QR-код для авторизации
         
+        Args:
+            session_id: ID пользователя
+            qr_format: Формат ответа: png, png1, svg или matrix (см. qr_renderer.QR_FORMATS)
+        
         Returns:
-            tuple: (qr_id, base64_image) - ID QR-кода и изображение в base64
+            tuple: (qr_id, qr_payload) - ID QR-кода и поля ответа с изображением в нужном формате
         """
-        # Если уже авторизован, не генерируем новый QR
-        if self.is_authorized():
-            raise Exception("Already authorized. Logout first.")
+        if qr_format not in QR_FORMATS:
+            raise ValueError(f"Неизвестный формат QR-кода: {qr_format}")
+        return self._run_async(self.generate_qr_code_async(session_id, qr_format), timeout=90)
+    
+    async def generate_qr_code_async(self, session_id: str, qr_format: str = DEFAULT_QR_FORMAT) -> tuple[str, Dict]:
+        """
+        То же, что generate_qr_code(), для вызова из корутины в общем event loop
         
-        # Удаляем все старые temp файлы перед генерацией нового QR
-        self.cleanup_temp_files()
+        Args:
+            session_id: ID пользователя
+            qr_format: Формат ответа: png, png1, svg или matrix (см. qr_renderer.QR_FORMATS)
         
-        # Очищаем старые QR-коды из памяти
-        for qr_id, qr_data in list(self.active_qr_codes.items()):
-            # Отключаем клиентов старых QR-кодов
-            client = qr_data.get("qr_client")
-            event_loop = qr_data.get("event_loop")
-            if client and event_loop:
-                try:
-                    async def disconnect():
-                        await client.disconnect()
-                    self._run_async_in_existing_loop(disconnect(), event_loop, timeout=5)
-                except Exception as e:
-                    print(f"[AUTH] Ошибка при отключении клиента {qr_id}: {e}")
-                finally:
-                    # Закрываем event loop
-                    try:
-                        if event_loop and not event_loop.is_closed():
-                            event_loop.close()
-                    except:
-                        pass
-            # Удаляем temp сессии
-            temp_session = qr_data.get("temp_session")
-            if temp_session:
-                temp_session_file = Path(temp_session)
-                if temp_session_file.exists():
-                    try:
-                        temp_session_file.unlink()
-                        print(f"[AUTH] Удален старый temp файл: {temp_session}")
-                    except Exception as e:
-                        print(f"[AUTH] Ошибка при удалении {temp_session}: {e}")
+        Returns:
+            tuple: (qr_id, qr_payload) - ID QR-кода и поля ответа с изображением в нужном формате
+        """
+        if qr_format not in QR_FORMATS:
+            raise ValueError(f"Неизвестный формат QR-кода: {qr_format}")
+        return await self._create_qr(session_id, output="base64", qr_format=qr_format)
+    
+    async def _create_qr(self, session_id: str, output: str, qr_format: str = DEFAULT_QR_FORMAT):
+        """
+        Создает QR-логин на клиенте из пула, регистрирует его и рисует первое изображение
         
-        self.active_qr_codes.clear()
+        Args:
+            session_id: ID пользователя
+            output: Как отдавать изображение: "base64" (в ответе) или "store" (URL на хранилище)
+            qr_format: Формат изображения для output="base64"
         
-        # Создаем уникальный ID для QR-кода
-        qr_id = str(uuid.uuid4())
+        Returns:
+            tuple: (qr_id, qr_payload) для "base64" или (qr_id, qr_url) для "store"
+        """
+        if not config.API_ID or not config.API_HASH:
+            raise ValueError("API_ID или API_HASH не установлены в переменных окружения!")
         
-        # Создаем временную сессию для QR
-        temp_session = config.SESSIONS_DIR / f"temp_{qr_id}.session"
+        # Если уже авторизован, не генерируем новый QR
+        if await shared_state.run(self.is_authorized, session_id):
+            raise Exception("Already authorized")
+        
+        # Удаляем старые QR-коды пользователя и занимаем место под новый
+        self._admit_qr(session_id)
+        qr_id = str(uuid.uuid4())
         
         async def create_qr_login():
-            """Внутренняя async функция для создания QR-логина"""
-            print(f"[AUTH] create_qr_login: ФУНКЦИЯ ЗАПУЩЕНА! Начинаем создание QR-логина")
-            print(f"[AUTH] create_qr_login: API_ID={config.API_ID}, API_HASH установлен={bool(config.API_HASH)}")
-            
-            # Проверяем что переменные окружения установлены
-            if not config.API_ID or not config.API_HASH:
-                error_msg = "API_ID или API_HASH не установлены в переменных окружения!"
-                print(f"[AUTH] create_qr_login: ОШИБКА - {error_msg}")
-                raise ValueError(error_msg)
-            
-            # Используем временную сессию для QR
-            print(f"[AUTH] create_qr_login: создаем TelegramClient с временной сессией: {temp_session}")
-            client = TelegramClient(str(temp_session), config.API_ID, config.API_HASH)
+            # Берем уже подключенный клиент на временной сессии из пула
+            # (если пул пуст - клиент подключается напрямую с таймаутом 30 секунд)
             try:
-                print(f"[AUTH] create_qr_login: подключаемся к Telegram с таймаутом 30 секунд...")
-                # Увеличиваем таймаут подключения до 30 секунд
-                await asyncio.wait_for(client.connect(), timeout=30)
-                print(f"[AUTH] create_qr_login: подключение успешно, создаем QR-логин...")
-                # Используем встроенный метод qr_login с таймаутом
-                qr_login = await asyncio.wait_for(client.qr_login(), timeout=30)
-                print(f"[AUTH] create_qr_login: QR-логин успешно создан")
-                return qr_login, client  # Возвращаем и клиента тоже
+                with qr_phase("connect"):
+                    client, temp_session = await qr_client_pool.acquire()
             except asyncio.TimeoutError as e:
-                error_msg = f"Таймаут при подключении к Telegram или создании QR-логина: {e}"
-                print(f"[AUTH] create_qr_login: ОШИБКА ТАЙМАУТ - {error_msg}")
-                try:
-                    await client.disconnect()
-                except:
-                    pass
-                raise TimeoutError(error_msg) from e
-            except Exception as e:
-                print(f"[AUTH] create_qr_login: ОШИБКА: {type(e).__name__}: {e}")
-                import traceback
-                traceback.print_exc()
-                # В случае ошибки пытаемся отключиться
+                raise TimeoutError(f"Таймаут при подключении к Telegram: {e}") from e
+            try:
+                with qr_phase("qr_login"):
+                    qr_login = await asyncio.wait_for(client.qr_login(), timeout=30)
+                # Регистрируем QR сразу в loop, чтобы wait() начался до сканирования
+                self._register_qr(qr_id, session_id, qr_login, client, temp_session,
+                                  output=output, qr_format=qr_format)
+            except BaseException as e:
                 try:
                     await client.disconnect()
-                except:
-                    pass
+                except Exception as disconnect_error:
+                    logger.debug(f"create_qr_login: ошибка при отключении клиента {temp_session}: {disconnect_error}")
+                if isinstance(e, asyncio.TimeoutError):
+                    raise TimeoutError(f"Таймаут при создании QR-логина: {e}") from e
                 raise
         
         try:
-            print(f"[AUTH] generate_qr_code: начинаем создание QR-логина через async функцию")
-            print(f"[AUTH] generate_qr_code: проверяем переменные окружения перед вызовом create_qr_login")
-            print(f"[AUTH] generate_qr_code: API_ID={config.API_ID}, API_HASH={'установлен' if config.API_HASH else 'НЕ УСТАНОВЛЕН'}")
-            
             # Создаем QR-логин с общим таймаутом 60 секунд
-            # Используем новый event loop для каждого запроса - это надежнее для Render
-            print(f"[AUTH] generate_qr_code: вызываем create_qr_login() через новый event loop...")
-            try:
-                # _run_async_in_new_loop возвращает (результат, loop)
-                # create_qr_login возвращает (qr_login, qr_client)
-                # Итого: ((qr_login, qr_client), loop)
-                result, qr_loop = self._run_async_in_new_loop(create_qr_login(), timeout=60)
-                qr_login, qr_client = result
-                print(f"[AUTH] generate_qr_code: create_qr_login завершился, получили результат и event loop")
-            except Exception as e:
-                print(f"[AUTH] generate_qr_code: ОШИБКА при вызове create_qr_login: {type(e).__name__}: {e}")
-                import traceback
-                traceback.print_exc()
-                raise
-            
-            print(f"[AUTH] generate_qr_code: QR-логин получен, получаем URL...")
-            
-            # Получаем URL для QR-кода
-            qr_url = qr_login.url
-            print(f"[AUTH] generate_qr_code: QR URL получен: {qr_url[:50]}...")
-            
-            # Сохраняем информацию о QR-коде вместе с event loop
-            self.active_qr_codes[qr_id] = {
-                "qr_login": qr_login,
-                "qr_client": qr_client,  # Сохраняем клиента чтобы использовать wait()
-                "event_loop": qr_loop,  # Сохраняем event loop для последующего использования
-                "expires_at": time.time() + config.QR_CODE_TIMEOUT,
-                "temp_session": str(temp_session),
-            }
-            print(f"[AUTH] generate_qr_code: информация о QR сохранена, начинаем генерацию изображения...")
-            
-            # Генерируем QR-код
-            print(f"[AUTH] generate_qr_code: генерируем QR-код из URL...")
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(qr_url)
-            qr.make(fit=True)
-            
-            # Создаем изображение в RGB режиме для четких квадратов
-            img = qr.make_image(fill_color="black", back_color="white")
-            # Конвертируем в RGB если изображение в другом режиме (например, '1' для монохромного)
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Добавляем логотип в центр QR-кода
-            width, height = img.size
-            
-            # Загружаем логотип
-            logo_path = Path(config.SESSIONS_DIR.parent) / 'static' / 'img' / 'tg_icon.png'
-            if logo_path.exists():
-                logo = Image.open(str(logo_path))
-                
-                # Конвертируем в RGBA для сохранения прозрачности
-                if logo.mode != 'RGBA':
-                    if logo.mode == 'P' and 'transparency' in logo.info:
-                        logo = logo.convert('RGBA')
-                    else:
-                        logo = logo.convert('RGBA')
-                
-                # Размер логотипа: примерно 15% от размера QR-кода
-                logo_size = int(min(width, height) * 0.15)
-                logo = logo.resize((logo_size, logo_size), Image.Resampling.LANCZOS)
-                
-                # Вычисляем центр QR-кода
-                center_x = width // 2
-                center_y = height // 2
-                
-                # Вычисляем радиус белой круглой зоны: логотип + 5px с каждой стороны (итого +10px диаметра)
-                # Радиус = (логотип + 10px) / 2
-                white_zone_radius = (logo_size + 10) // 2
-                
-                # Создаем белую круглую зону в центре QR-кода
-                draw = ImageDraw.Draw(img)
-                # Рисуем белый круг
-                draw.ellipse(
-                    [
-                        center_x - white_zone_radius,
-                        center_y - white_zone_radius,
-                        center_x + white_zone_radius,
-                        center_y + white_zone_radius
-                    ],
-                    fill='white'
-                )
-                
-                # Вычисляем позицию для размещения логотипа (по центру белой зоны)
-                logo_position_x = center_x - logo_size // 2
-                logo_position_y = center_y - logo_size // 2
-                
-                # Вставляем логотип с сохранением прозрачности
-                img.paste(logo, (logo_position_x, logo_position_y), logo)
-            
-            # Конвертируем в base64
-            print(f"[AUTH] generate_qr_code: конвертируем изображение в base64...")
-            buffer = io.BytesIO()
-            img.save(buffer, format='PNG')
-            img_str = base64.b64encode(buffer.getvalue()).decode()
-            print(f"[AUTH] generate_qr_code: QR-код успешно сгенерирован и конвертирован, размер base64: {len(img_str)} символов")
+            await asyncio.wait_for(create_qr_login(), timeout=60)
             
-            return qr_id, img_str
+            # Рисуем QR-код и отдаем его в нужном виде
+            qr_output = await self._render_new_qr(qr_id)
+            logger.info(f"QR-код {qr_id} сгенерирован ({output}, {qr_format})")
+            return qr_id, qr_output
             
         except Exception as e:
-            print(f"[AUTH] Ошибка при генерации QR-кода: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"Ошибка при генерации QR-кода: {type(e).__name__}: {e}")
             raise
+        finally:
+            self.active_qr_codes.release()
     
-    def is_qr_valid(self, qr_id: str) -> bool:
+    async def _render_new_qr(self, qr_id: str):
         """
-        Проверяет, действителен ли QR-код
+        Рисует первый QR-код записи вне event loop и публикует его для других воркеров
         
         Args:
             qr_id: ID QR-кода
             
         Returns:
-            bool: True если QR-код действителен
+            Dict или str: поля ответа с изображением или URL изображения в хранилище
         """
-        if qr_id not in self.active_qr_codes:
-            return False
+        qr_data = self.active_qr_codes[qr_id]
+        loop = asyncio.get_running_loop()
+        qr_output = await loop.run_in_executor(None, tracer.bind(self._render_qr_output), qr_id, qr_data)
+        self._publish_qr(qr_id, qr_data)
+        return qr_output
+    
+    def _render_qr_output(self, qr_id: str, qr_data: dict, version: Optional[int] = None):
+        """
+        Рисует QR-код для текущего токена записи и сохраняет результат в нужном виде:
+        поля ответа в qr_data["qr_payload"] или PNG в хранилище изображений
         
-        # Проверяем время истечения
-        expires_at = self.active_qr_codes[qr_id].get("expires_at", 0)
-        return time.time() < expires_at
+        Args:
+            qr_id: ID QR-кода
+            qr_data: Запись QR-кода
+            version: Версия токена для изображения (по умолчанию текущая версия записи)
+            
+        Returns:
+            Dict или str: поля ответа с изображением или URL изображения в хранилище
+        """
+        qr_url = qr_data["qr_login"].url
+        
+        # Фазы для метрик: render - построение матрицы/изображения, encode - PNG и base64
+        if qr_data.get("output") == "store":
+            if version is None:
+                version = qr_data["version"]
+            with qr_phase("render"):
+                image = render_qr_image(qr_url)
+            with qr_phase("encode"):
+                png = encode_png(image)
+            qr_image_store.put(
+                qr_id,
+                png,
+                "image/png",
+                version,
+                self._token_expires_at(qr_data["qr_login"]),
+            )
+            return self._qr_image_url(qr_id, version)
+        
+        qr_format = qr_data.get("format", DEFAULT_QR_FORMAT)
+        qr_payload = {"qr_format": qr_format}
+        if qr_format == "svg":
+            with qr_phase("render"):
+                qr_payload["qr_svg"] = render_qr_svg(qr_url)
+        elif qr_format == "matrix":
+            # Браузер рисует QR сам: отдаем только модули и URL логина
+            with qr_phase("render"):
+                qr_payload["qr_modules"] = render_qr_modules(qr_url)
+            qr_payload["qr_login_url"] = qr_url
+        elif qr_format == "png1":
+            # 1-битный PNG рисуется и кодируется одной функцией
+            with qr_phase("render"):
+                png = render_qr_png1(qr_url)
+            with qr_phase("encode"):
+                qr_payload["qr_image"] = base64.b64encode(png).decode()
+        else:
+            with qr_phase("render"):
+                image = render_qr_image(qr_url)
+            with qr_phase("encode"):
+                qr_payload["qr_image"] = base64.b64encode(encode_png(image)).decode()
+        qr_data["qr_payload"] = qr_payload
+        return qr_payload
     
-    def check_authorization_status(self, qr_id: str) -> Optional[Dict]:
+    @staticmethod
+    def _qr_image_url(qr_id: str, version: int) -> str:
         """
-        Проверяет статус авторизации по QR-коду
+        Возвращает URL изображения QR-кода в хранилище для заданной версии токена
         
         Args:
             qr_id: ID QR-кода
+            version: Версия токена
             
         Returns:
-            Dict или None: Данные пользователя если авторизован, иначе None
+            str: URL изображения
+        """
+        return f"/api/qr_image/{qr_id}.png?v={version}"
+    
+    def _register_qr(self, qr_id: str, session_id: str, qr_login, client: TelegramClient, temp_session: str,
+                     output: str = "base64", qr_format: str = DEFAULT_QR_FORMAT) -> dict:
         """
-        print(f"[AUTH] check_authorization_status для qr_id: {qr_id}")
+        Сохраняет QR-код и запускает фоновую задачу ожидания авторизации
+        Вызывается внутри общего event loop
         
-        # Если уже авторизован, возвращаем данные
-        if self.is_authorized():
-            print(f"[AUTH] check_authorization_status: уже авторизован")
-            return self._user_data
+        Args:
+            qr_id: ID QR-кода
+            session_id: ID пользователя, которому принадлежит QR-код
+            qr_login: QRLogin от Telethon
+            client: Клиент, на котором создан QR-логин
+            temp_session: Имя temp сессии клиента (для логов)
+            output: Как отдавать изображение: "base64" (в ответе) или "store" (URL на хранилище)
+            qr_format: Формат изображения для output="base64"
+            
+        Returns:
+            dict: Запись QR-кода
+        """
+        qr_data = {
+            "session_id": session_id,
+            "qr_login": qr_login,
+            "qr_client": client,  # Сохраняем клиента - он нужен боту после авторизации
+            "created_at": time.time(),
+            "expires_at": self._token_expires_at(qr_login),
+            "temp_session": str(temp_session),
+            "output": output,
+            "format": qr_format,
+            # Номер токена: увеличивается при каждом обновлении через recreate()
+            "version": 1,
+            # Результат ожидания: pending, authorized, needs_password, expired, error
+            "status": "pending",
+            "user_data": None,
+            "error": None,
+        }
+        self.active_qr_codes[qr_id] = qr_data
+        qr_data["watch_task"] = asyncio.ensure_future(self._watch_qr_login(qr_id, qr_data))
+        self._schedule_qr_expiry(qr_id, qr_data)
+        return qr_data
+    
+    async def _watch_qr_login(self, qr_id: str, qr_data: dict):
+        """
+        Один раз ожидает завершения QR-авторизации и записывает результат в запись QR-кода
         
-        if not self.is_qr_valid(qr_id):
-            print(f"[AUTH] check_authorization_status: QR невалиден")
-            return None
+        Args:
+            qr_id: ID QR-кода
+            qr_data: Запись QR-кода
+        """
+        qr_login = qr_data["qr_login"]
+        try:
+            while True:
+                try:
+                    # Без таймаута wait() ждет до реального истечения токена
+                    # и возвращает авторизованного пользователя
+                    user = await qr_login.wait()
+                    break
+                except asyncio.TimeoutError:
+                    if time.time() - qr_data["created_at"] >= config.QR_LOGIN_MAX_AGE:
+                        raise
+                    # Токен истек - обновляем его на том же клиенте без переподключения
+                    await self._refresh_qr_token(qr_id, qr_data)
+            logger.info(f"_watch_qr_login: QR {qr_id} отсканирован")
+            # Задача наблюдения создана в запросе генерации QR - спан попадает в его трассу
+            with tracer.span("auth.qr_authorized", qr_id=qr_id):
+                user_data = await self._complete_authorization(qr_data, user)
+                if user_data:
+                    qr_data["user_data"] = user_data
+                    # Бот запускается до события authorized, чтобы браузер сразу увидел его активным
+                    await self._hand_off_client(qr_id, qr_data)
+                    self._set_qr_status(qr_id, qr_data, "authorized")
+                else:
+                    qr_data["error"] = "Not authorized after QR login"
+                    self._set_qr_status(qr_id, qr_data, "error")
+        except asyncio.TimeoutError:
+            logger.info(f"_watch_qr_login: QR {qr_id} истек")
+            self._set_qr_status(qr_id, qr_data, "expired")
+        except SessionPasswordNeededError:
+            logger.info(f"_watch_qr_login: для QR {qr_id} требуется пароль 2FA")
+            self._set_qr_status(qr_id, qr_data, "needs_password")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"_watch_qr_login: ошибка для QR {qr_id}: {type(e).__name__}: {e}")
+            qr_data["error"] = str(e)
+            self._set_qr_status(qr_id, qr_data, "error")
+    
+    @staticmethod
+    def _token_expires_at(qr_login) -> float:
+        """
+        Возвращает время истечения токена QR-логина
         
-        qr_data = self.active_qr_codes[qr_id]
-        temp_session = qr_data.get("temp_session")
+        Args:
+            qr_login: QRLogin от Telethon
+            
+        Returns:
+            float: Unix timestamp истечения токена
+        """
+        try:
+            return qr_login.expires.timestamp()
+        except Exception:
+            return time.time() + config.QR_CODE_TIMEOUT
+    
+    async def _refresh_qr_token(self, qr_id: str, qr_data: dict):
+        """
+        Получает новый токен через recreate() на том же клиенте и перерисовывает QR-код
+        
+        Args:
+            qr_id: ID QR-кода
+            qr_data: Запись QR-кода
+        """
+        qr_login = qr_data["qr_login"]
+        await qr_login.recreate()
+        # Рисуем изображение вне event loop, чтобы не задерживать другие клиенты
+        loop = asyncio.get_running_loop()
+        qr_payload = await loop.run_in_executor(
+            None, tracer.bind(self._render_qr_output), qr_id, qr_data, qr_data["version"] + 1
+        )
+        qr_data["expires_at"] = self._token_expires_at(qr_login)
+        qr_data["version"] += 1
+        self._schedule_qr_expiry(qr_id, qr_data)
+        self._publish_qr(qr_id, qr_data)
+        logger.info(f"_refresh_qr_token: токен QR {qr_id} обновлен, версия {qr_data['version']}")
+        
+        event_data = {"qr_id": qr_id, "version": qr_data["version"]}
+        if qr_data.get("output") == "store":
+            event_data["qr_url"] = qr_payload
+        else:
+            event_data.update(qr_payload)
+        event_bus.publish("qr_refreshed", event_data, session_id=qr_data["session_id"])
+    
+    def _set_qr_status(self, qr_id: str, qr_data: dict, status: str):
+        """
+        Меняет статус QR-кода и публикует событие для SSE
+        
+        Args:
+            qr_id: ID QR-кода
+            qr_data: Запись QR-кода
+            status: Новый статус
+        """
+        qr_data["status"] = status
+        if status != "pending":
+            # QR больше не нужно показывать - изображение в хранилище не держим
+            qr_image_store.remove(qr_id)
+        # Статус меняет срок жизни записи (истекшие удаляются сразу, 2FA ждет пароль)
+        if qr_id in self.active_qr_codes:
+            self._schedule_qr_expiry(qr_id, qr_data)
+            self._publish_qr(qr_id, qr_data)
+        event_data = {"qr_id": qr_id, "status": status}
+        if status == "authorized":
+            event_data["user_data"] = qr_data.get("user_data")
+        event_bus.publish("qr_status", event_data, session_id=qr_data["session_id"])
+    
+    async def _complete_authorization(self, qr_data: dict, user=None) -> Optional[Dict]:
+        """
+        Завершает авторизацию: сохраняет сессию и профиль пользователя
+        Клиент НЕ отключается - он будет передан боту
+        
+        Args:
+            qr_data: Запись QR-кода
+            user: Пользователь из результата входа (QRLogin.wait() или sign_in()); если None - get_me()
+            
+        Returns:
+            Dict или None: Данные пользователя если авторизован
+        """
+        client = qr_data.get("qr_client")
+        session_id = qr_data["session_id"]
+        
+        if user is None:
+            user = await client.get_me()
+            if user is None:
+                logger.info(f"_complete_authorization: пользователь не авторизован")
+                return None
+        logger.info(f"_complete_authorization: пользователь авторизован: {user.first_name}")
+        
+        # Хранилище сессий и общее состояние пишутся вне event loop
+        user_data = await shared_state.run(self._save_authorization, session_id, client.session, user)
+        session_validity.set(session_id, True)
+        return user_data
+    
+    @staticmethod
+    def _save_authorization(session_id: str, client_session, user) -> Dict:
+        """
+        Сохраняет сессию, профиль и отметку авторизации (блокирующий вызов, в потоке общего состояния)
         
-        # Пытаемся завершить авторизацию через wait()
-        print(f"[AUTH] check_authorization_status: проверяем wait()")
+        Args:
+            session_id: ID пользователя
+            client_session: Сессия авторизованного клиента
+            user: Пользователь из результата входа
+            
+        Returns:
+            Dict: Данные пользователя
+        """
+        # Сохраняем temp сессию из памяти как постоянную (атомарно)
+        session_store.promote(session_id, client_session)
+        logger.debug(f"_complete_authorization: сессия сохранена в хранилище")
+        
+        # Профиль заполняется один раз при входе, дальше его обновляют события бота
+        profile_cache.set_user(session_id, user)
+        shared_state.set_authorized(session_id)
+        return profile_cache.get(session_id)
+    
+    async def _hand_off_client(self, qr_id: str, qr_data: dict) -> bool:
+        """
+        Передает подключенный авторизованный клиент QR-кода в callback (бот) в том же event loop
+        Запись QR-кода удаляется, клиент не отключается - новый handshake не нужен
+        (если бот не принял клиент, он отключается здесь)
+        
+        Args:
+            qr_id: ID QR-кода
+            qr_data: Запись QR-кода
+            
+        Returns:
+            bool: True если клиент принят
+        """
+        if self._authorized_callback is None:
+            return False
+        client = self.get_qr_client_and_clear(qr_id)
+        if client is None:
+            return False
+        session_id = qr_data["session_id"]
+        started = False
         try:
-            qr_login = qr_data.get("qr_login")
+            with tracer.span("auth.hand_off", session_id=session_id):
+                started = await self._authorized_callback(session_id, client)
+            logger.info(f"_hand_off_client: клиент QR {qr_id} передан боту {session_id}: {started}")
+            return started
+        except Exception as e:
+            logger.error(f"_hand_off_client: ошибка при передаче клиента: {type(e).__name__}: {e}")
+            return False
+        finally:
+            # Запись QR-кода уже удалена - не принятый ботом клиент больше никто не отключит
+            if not started:
+                try:
+                    await client.disconnect()
+                except Exception as e:
+                    logger.debug(f"_hand_off_client: ошибка при отключении клиента: {e}")
+    
+    def _is_qr_expired(self, qr_data: dict, now: Optional[float] = None) -> bool:
+        """
+        Проверяет, истек ли QR-код с учетом фонового обновления токена
+        
+        Args:
+            qr_data: Запись QR-кода
+            now: Текущее время (по умолчанию time.time())
             
-            async def check_auth():
-                print(f"[AUTH] check_auth: используем сохраненного клиента")
-                # Используем сохраненного клиента
-                client = qr_data.get("qr_client")
-                
+        Returns:
+            bool: True если запись можно удалять
+        """
+        now = now or time.time()
+        return now >= self._qr_deadline(qr_data)
+    
+    @staticmethod
+    def _qr_deadline(qr_data: dict) -> float:
+        """
+        Возвращает время, после которого запись QR-кода можно удалять
+        
+        Args:
+            qr_data: Запись QR-кода
+            
+        Returns:
+            float: Unix timestamp дедлайна (0 - удалять сразу)
+        """
+        status = qr_data.get("status")
+        if status in ("expired", "error"):
+            return 0
+        # QR уже отсканирован - ждем ввода пароля до общего лимита жизни QR-логина
+        if status == "needs_password":
+            return qr_data.get("created_at", 0) + config.QR_LOGIN_MAX_AGE
+        # Пока токен обновляется через recreate(), даем небольшой запас после истечения
+        return qr_data.get("expires_at", 0) + QR_REFRESH_GRACE
+    
+    def _schedule_qr_expiry(self, qr_id: str, qr_data: dict):
+        """
+        Назначает (или переносит) удаление записи QR-кода на ее дедлайн
+        
+        Args:
+            qr_id: ID QR-кода
+            qr_data: Запись QR-кода
+        """
+        self._qr_expiry.schedule(qr_id, self._qr_deadline(qr_data))
+    
+    def _on_qr_deadline(self, qr_id: str):
+        """
+        Вызывается планировщиком в дедлайн QR-кода: удаляет запись, если она истекла
+        
+        Args:
+            qr_id: ID QR-кода
+        """
+        qr_data = self.active_qr_codes.get(qr_id)
+        if qr_data is None:
+            return
+        if not self._is_qr_expired(qr_data):
+            # Дедлайн успел сдвинуться (токен обновлен) - ждем новый
+            self._schedule_qr_expiry(qr_id, qr_data)
+            return
+        logger.info(f"Очистка истекшего QR: {qr_id}")
+        self._discard_qr(qr_id)
+    
+    def _discard_qr(self, qr_id: str, qr_data: Optional[dict] = None) -> Optional[dict]:
+        """
+        Удаляет запись QR-кода и его изображение, а клиента отключает в фоне
+        (temp сессия клиента живет в памяти и исчезает вместе с ним)
+        
+        Args:
+            qr_id: ID QR-кода
+            qr_data: Запись, уже убранная из реестра (например, вытесненная)
+            
+        Returns:
+            dict или None: Удаленная запись
+        """
+        self._qr_expiry.cancel(qr_id)
+        qr_image_store.remove(qr_id)
+        shared_state.post(shared_state.delete_qr, qr_id)
+        qr_data = self.active_qr_codes.pop(qr_id, None) or qr_data
+        if qr_data is None:
+            return None
+        client = qr_data.get("qr_client")
+        watch_task = qr_data.get("watch_task")
+        
+        async def disconnect():
+            # Останавливаем фоновое ожидание авторизации
+            if watch_task:
+                watch_task.cancel()
+            if client:
                 try:
-                    # Ожидаем завершения авторизации через wait() с небольшим таймаутом
-                    try:
-                        print(f"[AUTH] check_auth: вызываем wait()")
-                        await asyncio.wait_for(qr_login.wait(), timeout=2)
-                        print(f"[AUTH] check_auth: wait() завершен")
-                    except asyncio.TimeoutError:
-                        print(f"[AUTH] check_auth: таймаут wait()")
-                        return None
-                    except SessionPasswordNeededError as e:
-                        print(f"[AUTH] Password needed: {type(e).__name__}")
-                        return {"needs_password": True}
-                    except Exception as e:
-                        print(f"[AUTH] Ошибка при wait(): {type(e).__name__}: {e}")
-                        return None
-                    
-                    # Проверяем авторизацию
-                    if await client.is_user_authorized():
-                        user = await client.get_me()
-                        print(f"[AUTH] check_auth: пользователь авторизован: {user.first_name}")
-                        
-                        user_data = {
-                            "id": user.id,
-                            "first_name": user.first_name,
-                            "last_name": user.last_name or "",
-                            "username": user.username or "",
-                            "phone": user.phone or "",
-                        }
-                        
-                        # Копируем temp сессию в постоянную
-                        import shutil
-                        shutil.copy(str(temp_session), str(self.session_path))
-                        print(f"[AUTH] check_auth: сессия скопирована в постоянную")
-                        
-                        # Удаляем файл QR-кода если он есть
-                        qr_file = qr_data.get("qr_file")
-                        if qr_file:
-                            qr_file_path = Path(qr_file)
-                            if qr_file_path.exists():
-                                try:
-                                    qr_file_path.unlink()
-                                    print(f"[AUTH] Удален файл QR-кода после авторизации: {qr_file}")
-                                except Exception as e:
-                                    print(f"[AUTH] Ошибка при удалении файла QR-кода {qr_file}: {e}")
-                        
-                        # НЕ отключаем клиента - он нужен боту
-                        return user_data
-                    
-                    print(f"[AUTH] check_auth: пользователь не авторизован")
-                    return None
+                    await client.disconnect()
+                    logger.debug(f"Клиент для {qr_id} отключен")
                 except Exception as e:
-                    print(f"[AUTH] check_auth: ошибка: {e}")
-                    raise
+                    logger.error(f"Ошибка при отключении клиента {qr_id}: {e}")
+        
+        async_runtime.submit(disconnect())
+        return qr_data
+    
+    def is_qr_valid(self, qr_id: str, session_id: str) -> bool:
+        """
+        Проверяет, действителен ли QR-код
+        
+        Args:
+            qr_id: ID QR-кода
+            session_id: ID пользователя
             
-            # Используем сохраненный event loop для этого QR-кода
-            qr_loop = qr_data.get("event_loop")
-            if not qr_loop:
-                print(f"[AUTH] check_authorization_status: event loop не найден для qr_id {qr_id}")
-                return None
+        Returns:
+            bool: True если QR-код действителен
+        """
+        qr_data = self._get_qr(qr_id, session_id)
+        if not qr_data:
+            return False
+        return not self._is_qr_expired(qr_data)
+    
+    def get_qr_image(self, qr_id: str, session_id: str) -> Optional[QRImage]:
+        """
+        Возвращает изображение QR-кода пользователя: из хранилища этого воркера
+        или опубликованное воркером-владельцем
+        
+        Args:
+            qr_id: ID QR-кода
+            session_id: ID пользователя
             
-            user_data = self._run_async_in_existing_loop(check_auth(), qr_loop, timeout=5)
+        Returns:
+            QRImage или None
+        """
+        qr_data = self._get_qr(qr_id, session_id)
+        if not qr_data or self._is_qr_expired(qr_data):
+            return None
+        if qr_id in self.active_qr_codes:
+            return qr_image_store.get(qr_id)
+        shared = shared_state.get_qr_image(qr_id)
+        if shared is None:
+            return None
+        data, version = shared
+        return QRImage(data, "image/png", version, qr_data["expires_at"])
+    
+    def get_qr_refresh(self, qr_id: str, session_id: str, known_version: int) -> Optional[Dict]:
+        """
+        Возвращает новое изображение QR-кода, если токен обновился после known_version
+        
+        Args:
+            qr_id: ID QR-кода
+            session_id: ID пользователя
+            known_version: Версия токена, которая уже есть у браузера
             
-            if user_data:
-                # Проверяем, требуется ли пароль
-                if user_data.get("needs_password"):
-                    return {"needs_password": True}
-                
-                # Удаляем temp сессию
-                temp_session_file = Path(temp_session)
-                if temp_session_file.exists():
-                    try:
-                        temp_session_file.unlink()
-                        print(f"[AUTH] Удален temp файл: {temp_session}")
-                    except Exception as e:
-                        print(f"[AUTH] Ошибка при удалении temp файла: {e}")
-                
-                # Сохраняем данные пользователя
-                self._user_data = user_data
-                # НЕ очищаем QR-коды и НЕ отключаем клиент - он будет передан боту
-                # self.active_qr_codes.clear() - оставляем клиент для бота
-                print(f"[AUTH] check_authorization_status: успешно завершен, клиент сохранен для бота")
-                return user_data
-                
-        except Exception as e:
-            print(f"[AUTH] Ошибка при проверке авторизации: {type(e).__name__}: {e}")
-            import traceback
-            traceback.print_exc()
+        Returns:
+            Dict или None: {"qr_version", поля изображения или "qr_url"} если есть обновление
+        """
+        qr_data = self._get_qr(qr_id, session_id)
+        if not qr_data or qr_data.get("version", 1) <= known_version:
+            return None
+        
+        refresh = {"qr_version": qr_data["version"]}
+        if qr_data.get("output") == "store":
+            refresh["qr_url"] = self._qr_image_url(qr_id, qr_data["version"])
+        else:
+            refresh.update(qr_data.get("qr_payload") or {})
+        return refresh
+    
+    def check_authorization_status(self, qr_id: str, session_id: str) -> Optional[Dict]:
+        """
+        Проверяет статус авторизации по QR-коду
+        Только читает результат фоновой задачи ожидания, не обращаясь к event loop
+        
+        Args:
+            qr_id: ID QR-кода
+            session_id: ID пользователя
+            
+        Returns:
+            Dict или None: Данные пользователя если авторизован, иначе None
+        """
+        # Если уже авторизован, возвращаем данные
+        if self.is_authorized(session_id):
+            return self.get_user_data(session_id)
+        
+        qr_data = self._get_qr(qr_id, session_id)
+        if not qr_data:
+            return None
         
+        status = qr_data.get("status")
+        if status == "authorized":
+            return qr_data.get("user_data")
+        if status == "needs_password":
+            return {"needs_password": True}
         return None
     
-    def submit_password(self, qr_id: str, password: str) -> Optional[Dict]:
+    def submit_password(self, qr_id: str, session_id: str, password: str) -> Optional[Dict]:
         """
         Отправляет пароль 2FA для завершения авторизации
         
         Args:
             qr_id: ID QR-кода
+            session_id: ID пользователя
             password: Пароль 2FA
             
         Returns:
             Dict или None: Данные пользователя если успешно
         """
-        print(f"[AUTH] submit_password вызван для qr_id: {qr_id}")
+        return self._run_async(self.submit_password_async(qr_id, session_id, password), timeout=40)
+    
+    async def submit_password_async(self, qr_id: str, session_id: str, password: str) -> Optional[Dict]:
+        """
+        То же, что submit_password(), для вызова из корутины в общем event loop
+        
+        Args:
+            qr_id: ID QR-кода
+            session_id: ID пользователя
+            password: Пароль 2FA
+            
+        Returns:
+            Dict или None: Данные пользователя если успешно
+        """
+        logger.debug(f"submit_password вызван для qr_id: {qr_id}")
         
         # Если уже авторизован, возвращаем данные
-        if self.is_authorized():
-            print(f"[AUTH] submit_password: уже авторизован")
-            return self._user_data
+        if await shared_state.run(self.is_authorized, session_id):
+            logger.info(f"submit_password: уже авторизован")
+            return await shared_state.run(self.get_user_data, session_id)
         
-        if qr_id not in self.active_qr_codes:
-            print(f"[AUTH] submit_password: qr_id не найден")
+        qr_data = await shared_state.run(self._get_qr, qr_id, session_id)
+        if qr_data is None:
+            logger.error(f"submit_password: qr_id не найден")
+            return None
+        if "qr_client" not in qr_data:
+            # Клиент QR-кода живет в другом воркере - пароль можно ввести только там
+            logger.warning(f"submit_password: QR {qr_id} обслуживает другой воркер")
             return None
         
         try:
-            qr_data = self.active_qr_codes[qr_id]
-            temp_session = qr_data.get("temp_session")
             
             async def sign_in_with_password():
-                print(f"[AUTH] submit_password: используем сохраненного клиента")
+                logger.debug(f"submit_password: используем сохраненного клиента")
                 # Используем сохраненного клиента
                 client = qr_data.get("qr_client")
                 try:
-                    print(f"[AUTH] submit_password: отправляем пароль")
-                    await client.sign_in(password=password)
-                    print(f"[AUTH] submit_password: пароль принят")
-                    
-                    if await client.is_user_authorized():
-                        user = await client.get_me()
-                        print(f"[AUTH] submit_password: пользователь авторизован: {user.first_name}")
-                        
-                        user_data = {
-                            "id": user.id,
-                            "first_name": user.first_name,
-                            "last_name": user.last_name or "",
-                            "username": user.username or "",
-                            "phone": user.phone or "",
-                        }
-                        
-                        # Копируем temp сессию в постоянную
-                        import shutil
-                        shutil.copy(str(temp_session), str(self.session_path))
-                        print(f"[AUTH] submit_password: сессия скопирована в постоянную")
-                        
-                        # Удаляем файл QR-кода если он есть
-                        qr_file = qr_data.get("qr_file")
-                        if qr_file:
-                            qr_file_path = Path(qr_file)
-                            if qr_file_path.exists():
-                                try:
-                                    qr_file_path.unlink()
-                                    print(f"[AUTH] Удален файл QR-кода после авторизации через пароль: {qr_file}")
-                                except Exception as e:
-                                    print(f"[AUTH] Ошибка при удалении файла QR-кода {qr_file}: {e}")
-                        
-                        # НЕ отключаем клиента - он нужен боту
-                        return user_data
-                    
-                    print(f"[AUTH] submit_password: пользователь не авторизован")
-                    return None
+                    logger.debug(f"submit_password: отправляем пароль")
+                    user = await client.sign_in(password=password)
+                    logger.debug(f"submit_password: пароль принят")
+                    user_data = await self._complete_authorization(qr_data, user)
+                    if user_data:
+                        qr_data["user_data"] = user_data
+                        await self._hand_off_client(qr_id, qr_data)
+                        self._set_qr_status(qr_id, qr_data, "authorized")
+                    return user_data
                 except Exception as e:
-                    print(f"[AUTH] submit_password: ошибка в sign_in_with_password: {e}")
+                    logger.error(f"submit_password: ошибка в sign_in_with_password: {e}")
                     raise
             
-            # Используем сохраненный event loop для этого QR-кода
-            qr_loop = qr_data.get("event_loop")
-            if not qr_loop:
-                print(f"[AUTH] submit_password: event loop не найден для qr_id {qr_id}")
-                return None
-            
-            user_data = self._run_async_in_existing_loop(sign_in_with_password(), qr_loop, timeout=30)
+            user_data = await asyncio.wait_for(sign_in_with_password(), timeout=30)
             
             if user_data:
-                # Удаляем temp сессию
-                temp_session_file = Path(temp_session)
-                if temp_session_file.exists():
-                    try:
-                        temp_session_file.unlink()
-                        print(f"[AUTH] Удален temp файл: {temp_session}")
-                    except Exception as e:
-                        print(f"[AUTH] Ошибка при удалении temp файла: {e}")
-                
-                # Сохраняем данные пользователя
-                self._user_data = user_data
                 # НЕ очищаем QR-коды и НЕ отключаем клиент - он будет передан боту
                 # self.active_qr_codes.clear() - оставляем клиент для бота
-                print(f"[AUTH] submit_password: успешно завершен, клиент сохранен для бота")
+                logger.info(f"submit_password: успешно завершен, клиент сохранен для бота")
                 return user_data
             
-            print(f"[AUTH] submit_password: не удалось получить данные пользователя")
+            logger.error(f"submit_password: не удалось получить данные пользователя")
                 
         except Exception as e:
-            print(f"[AUTH] Ошибка при вводе пароля: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"Ошибка при вводе пароля: {e}")
         
         return None
     
-    def logout(self) -> bool:
+    def logout(self, session_id: str) -> bool:
         """
-        Выход из аккаунта и очистка сессии
+        Выход из аккаунта и очистка сессии пользователя
+        
+        Args:
+            session_id: ID пользователя
         
         Returns:
             bool: True если успешно
         """
         try:
-            print(f"[AUTH] logout вызван")
+            logger.debug(f"logout вызван для {session_id}")
             
             # Бот отключается сам через userbot_manager
             
-            # Удаляем все файлы сессии (включая journal и другие)
-            import glob
-            session_files = list(config.SESSIONS_DIR.glob("user.session*"))
-            print(f"[AUTH] Найдено файлов сессии для удаления: {len(session_files)}")
-            for session_file in session_files:
-                try:
-                    session_file.unlink()
-                    print(f"[AUTH] Удален файл сессии: {session_file.name}")
-                except Exception as e:
-                    print(f"[AUTH] Ошибка при удалении файла сессии {session_file.name}: {e}")
+            # Удаляем сохраненную сессию пользователя
+            session_store.delete(session_id)
             
-            # Очищаем данные
-            self._user_data = None
-            self.active_qr_codes.clear()
+            # Очищаем данные пользователя, его фото, ответ о валидности сессии и его QR-коды
+            self._forget_user(session_id)
+            session_validity.invalidate(session_id)
+            for qr_id, qr_data in list(self.active_qr_codes.items()):
+                if qr_data.get("session_id") == session_id:
+                    self._discard_qr(qr_id)
             
-            print(f"[AUTH] logout успешен")
+            event_bus.publish("logout", {"session_id": session_id}, session_id=session_id)
+            logger.info(f"logout успешен")
             return True
             
         except Exception as e:
-            print(f"[AUTH] Ошибка при выходе: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"Ошибка при выходе: {e}")
             return False
     
-    def get_session_path(self) -> str:
+    @staticmethod
+    def _forget_user(session_id: str):
+        """
+        Снимает отметку авторизации и удаляет профиль и фото пользователя (блокирующий вызов)
+        
+        Args:
+            session_id: ID пользователя
+        """
+        shared_state.clear_authorized(session_id)
+        photo_ref = profile_cache.get_photo_ref(session_id)
+        if photo_ref is not None:
+            photo_cache.remove(photo_ref[0])
+        profile_cache.remove(session_id)
+    
+    def has_session(self, session_id: str) -> bool:
         """
-        Получает путь к файлу сессии
+        Проверяет, есть ли у пользователя сохраненная сессия
+        
+        Args:
+            session_id: ID пользователя
         
         Returns:
-            str: Путь к сессии
+            bool: True если сессия есть в хранилище
         """
-        return str(self.session_path)
+        return session_store.exists(session_id)
+    
+    def is_session_valid(self, session_id: str) -> bool:
+        """
+        Проверяет через Telegram API, что сохраненная сессия пользователя не отозвана
+        Ответ кешируется на SESSION_VALIDITY_TTL секунд, одновременные запросы ждут одну проверку
+        
+        Args:
+            session_id: ID пользователя
+        
+        Returns:
+            bool: True если сессия валидна
+        """
+        return session_validity.check(session_id, lambda: self._probe_session(session_id))
+    
+    async def _probe_session(self, session_id: str) -> bool:
+        """
+        Подключается к Telegram с сохраненной сессией и проверяет авторизацию
+        
+        Args:
+            session_id: ID пользователя
+        
+        Returns:
+            bool: True если сессия валидна
+        """
+        session = await shared_state.run(session_store.open_session, session_id)
+        if session is None:
+            return False
+        logger.debug(f"_probe_session: проверяем сессию {session_id} через Telegram API")
+        client = TelegramClient(session, config.API_ID, config.API_HASH)
+        try:
+            await asyncio.wait_for(client.connect(), timeout=5)
+            return await client.is_user_authorized()
+        except (AuthKeyUnregisteredError, SessionRevokedError, UnauthorizedError):
+            logger.warning(f"_probe_session: сессия {session_id} невалидна (отозвана/удалена)")
+            return False
+        finally:
+            try:
+                await client.disconnect()
+            except Exception:
+                pass
     
     def get_client(self) -> Optional[TelegramClient]:
         """
@@ -763,206 +1001,252 @@ class AuthManager:
         """
         return None
     
-    def get_user_photo(self, client=None) -> Optional[bytes]:
+    def get_photo_etag(self, session_id: str, size: str = DEFAULT_PHOTO_SIZE) -> Optional[str]:
+        """
+        Возвращает ETag фото профиля нужного размера без обращения к Telegram
+        
+        Args:
+            session_id: ID пользователя
+            size: Нормализованный размер (см. photo_cache.parse_photo_size)
+        
+        Returns:
+            str или None: ETag, если фото профиля известно
+        """
+        photo_ref = profile_cache.get_photo_ref(session_id)
+        if photo_ref is None:
+            return None
+        return f"{photo_ref[0]}-{size}"
+    
+    def get_user_photo(self, session_id: str, size: str = DEFAULT_PHOTO_SIZE, client=None) -> Optional[bytes]:
         """
-        Получает фото профиля пользователя
+        Получает фото профиля пользователя из кеша по photo_id, загружая из Telegram только при промахе
         
         Args:
-            client: Опциональный клиент для использования (если None - создает новый)
+            session_id: ID пользователя
+            size: Нормализованный размер: small, big или число пикселей
+            client: Опциональный подключенный клиент (например, бота); если None - создает временный
         
         Returns:
             bytes или None
         """
-        print(f"[AUTH] get_user_photo вызван")
+        logger.debug(f"get_user_photo вызван для {session_id}, размер {size}")
+        
+        photo_ref = self._photo_ref(session_id)
+        if photo_ref is None:
+            return None
+        cached = photo_cache.get(photo_ref[0], size)
+        if cached is not None:
+            return cached
+        return self._run_async(self.get_user_photo_async(session_id, size, client), timeout=40)
+    
+    def _photo_ref(self, session_id: str) -> Optional[tuple]:
+        """
+        Возвращает (photo_id, dc_id) текущего фото авторизованного пользователя
+        """
+        if not self.is_authorized(session_id):
+            logger.info(f"get_user_photo: пользователь не авторизован")
+            return None
+        # Текущее фото известно из кеша профилей; нет фото - нечего загружать
+        return profile_cache.get_photo_ref(session_id)
+    
+    async def get_user_photo_async(self, session_id: str, size: str = DEFAULT_PHOTO_SIZE,
+                                   client=None) -> Optional[bytes]:
+        """
+        То же, что get_user_photo(), для вызова из корутины в общем event loop
+        (уменьшение фото выполняется вне event loop)
+        
+        Args:
+            session_id: ID пользователя
+            size: Нормализованный размер: small, big или число пикселей
+            client: Опциональный подключенный клиент (например, бота); если None - создает временный
         
-        if not self.is_authorized():
-            print(f"[AUTH] get_user_photo: пользователь не авторизован")
+        Returns:
+            bytes или None
+        """
+        photo_ref = await shared_state.run(self._photo_ref, session_id)
+        if photo_ref is None:
             return None
+        photo_id, dc_id = photo_ref
+        cached = await photo_cache.get_async(photo_id, size)
+        if cached is not None:
+            return cached
+        
+        variant = source_variant(size)
         
         async def download_photo(provided_client):
             # Используем переданного клиента или создаем временного
             use_provided_client = provided_client is not None
             if not use_provided_client:
-                provided_client = TelegramClient(str(self.session_path), config.API_ID, config.API_HASH)
+                session = await shared_state.run(session_store.open_session, session_id)
+                if session is None:
+                    return None
+                provided_client = TelegramClient(session, config.API_ID, config.API_HASH)
                 await provided_client.connect()
             
             try:
-                user = await provided_client.get_me()
-                if user is None:
-                    print(f"[AUTH] get_user_photo: get_me() вернул None - клиент не авторизован")
-                    if not use_provided_client:
-                        await provided_client.disconnect()
-                    return None
-                if user.photo:
-                    photo_data = await provided_client.download_profile_photo(user, file=bytes)
-                    if not use_provided_client:
-                        await provided_client.disconnect()
-                    return photo_data
-                if not use_provided_client:
-                    await provided_client.disconnect()
-                return None
+                location = InputPeerPhotoFileLocation(
+                    peer=InputPeerSelf(), photo_id=photo_id, big=(variant == "big")
+                )
+                return await provided_client.download_file(location, bytes, dc_id=dc_id)
             except Exception as e:
-                print(f"[AUTH] get_user_photo: ошибка при загрузке: {e}")
+                logger.error(f"get_user_photo: ошибка при загрузке: {e}")
+                return None
+            finally:
                 if not use_provided_client:
                     try:
                         await provided_client.disconnect()
-                    except:
+                    except Exception:
                         pass
+        
+        source = await photo_cache.get_async(photo_id, variant)
+        if source is None:
+            try:
+                source = await asyncio.wait_for(download_photo(client), timeout=30)
+            except Exception as e:
+                logger.error(f"get_user_photo: ошибка: {e}")
+                return None
+            if not source:
                 return None
+            photo_cache.put(photo_id, variant, source)
+            logger.info(f"get_user_photo: фото {photo_id} ({variant}) загружено из Telegram, размер: {len(source)}")
         
-        try:
-            # Используем новый event loop для каждого запроса
-            result, _ = self._run_async_in_new_loop(download_photo(client), timeout=30)
-            return result
-        except Exception as e:
-            print(f"[AUTH] get_user_photo: ошибка: {e}")
-            return None
+        if size == variant:
+            return source
+        # Уменьшаем на сервере и кешируем отдельно для этого размера
+        loop = asyncio.get_running_loop()
+        photo_data = await loop.run_in_executor(None, downscale_photo, source, size)
+        photo_cache.put(photo_id, size, photo_data)
+        return photo_data
     
-    def get_active_sessions(self) -> List[Dict]:
+    def get_active_sessions(self, session_id: str) -> List[Dict]:
         """
-        Возвращает список активных сессий (для однопользовательской системы - один пользователь)
+        Возвращает список активных сессий пользователя (у одного пользователя одна сессия)
+        
+        Args:
+            session_id: ID пользователя
         
         Returns:
-            List[Dict]: Список с данными текущего пользователя
+            List[Dict]: Список с данными пользователя
         """
-        if self.is_authorized():
-            return [{"user_data": self._user_data}]
+        if self.is_authorized(session_id):
+            return [{"user_data": self.get_user_data(session_id)}]
         return []
     
-    def restore_sessions(self):
+    def restore_sessions(self, session_ids: Optional[List[str]] = None) -> List[str]:
+        """
+        Восстанавливает данные пользователей из сохраненных сессий (при запуске сервера или после потери данных)
+        Сессии восстанавливаются параллельно в общем event loop, не больше
+        SESSION_RESTORE_CONCURRENCY одновременно - без потока на пользователя
+        
+        Args:
+            session_ids: ID пользователей (по умолчанию все, у кого есть сохраненная сессия)
+        
+        Returns:
+            List[str]: ID пользователей, чьи сессии восстановлены
         """
-        Восстанавливает активную сессию из файла при запуске сервера
+        if session_ids is None:
+            session_ids = session_store.list_ids()
+        else:
+            session_ids = [sid for sid in session_ids if session_store.exists(sid)]
+        logger.info(f"restore_sessions вызван, найдено сессий: {len(session_ids)}")
+        if not session_ids:
+            return []
+        
+        async def restore_all():
+            semaphore = asyncio.Semaphore(max(1, config.SESSION_RESTORE_CONCURRENCY))
+            
+            async def restore_one(session_id):
+                async with semaphore:
+                    return await self.restore_session_async(session_id)
+            
+            results = await asyncio.gather(*(restore_one(sid) for sid in session_ids))
+            return [sid for sid, restored in zip(session_ids, results) if restored]
+        
+        try:
+            restored = self._run_async(restore_all(), timeout=None)
+        except Exception as e:
+            logger.error(f"restore_sessions: ошибка при восстановлении: {e}")
+            return []
+        logger.info(f"restore_sessions: восстановлено сессий: {len(restored)} из {len(session_ids)}")
+        return restored
+    
+    async def restore_session_async(self, session_id: str) -> bool:
         """
-        print(f"[AUTH] restore_sessions вызван, путь: {self.session_path}")
-        if not self.session_path.exists():
-            print("[AUTH] restore_sessions: файл сессии не найден")
-            return
-        print(f"[AUTH] restore_sessions: файл сессии найден, начинаем восстановление")
+        Восстанавливает данные одного пользователя, для вызова из корутины в общем event loop
         
-        async def restore_session():
-            print(f"[AUTH] restore_session: создаем клиента")
-            await asyncio.sleep(1)  # Увеличиваем задержку для разблокировки БД
-            client = TelegramClient(str(self.session_path), config.API_ID, config.API_HASH)
-            max_retries = 3
-            retry_delay = 1
+        Args:
+            session_id: ID пользователя
             
-            for attempt in range(max_retries):
-                try:
-                    print(f"[AUTH] restore_session: попытка подключения {attempt + 1}/{max_retries}")
-                    await asyncio.wait_for(client.connect(), timeout=10)
-                    print(f"[AUTH] restore_session: клиент подключен, проверяем авторизацию")
-                    break
-                except Exception as e:
-                    if "database is locked" in str(e).lower() and attempt < max_retries - 1:
-                        print(f"[AUTH] restore_session: база данных заблокирована, ждем {retry_delay} секунд...")
-                        await asyncio.sleep(retry_delay)
-                        retry_delay *= 2  # Экспоненциальная задержка
-                        continue
-                    else:
-                        raise  # Повторно выбрасываем исключение если не удалось
+        Returns:
+            bool: True если сессия валидна и данные восстановлены
+        """
+        if not await shared_state.run(session_store.exists, session_id):
+            return False
+        try:
+            return await asyncio.wait_for(self._restore_session(session_id), timeout=30)
+        except Exception as e:
+            logger.error(f"restore_sessions: ошибка при восстановлении {session_id}: {type(e).__name__}: {e}")
+            return False
+    
+    async def _restore_session(self, session_id: str) -> bool:
+        """
+        Восстанавливает данные одного пользователя из сохраненной сессии
+        
+        Args:
+            session_id: ID пользователя
             
-            try:
-                
-                if await client.is_user_authorized():
+        Returns:
+            bool: True если сессия валидна и данные восстановлены
+        """
+        logger.debug(f"restore_session: создаем клиента для {session_id}")
+        session = await shared_state.run(session_store.open_session, session_id)
+        if session is None:
+            logger.error(f"restore_session: сессия {session_id} не найдена")
+            return False
+        # Клиент работает на StringSession в памяти - файл сессии не блокируется, ждать нечего
+        client = TelegramClient(session, config.API_ID, config.API_HASH)
+        try:
+            await asyncio.wait_for(client.connect(), timeout=10)
+            logger.debug(f"restore_session: клиент подключен, проверяем авторизацию")
+            if await client.is_user_authorized():
+                # Профиль сохранен при входе - get_me() нужен только если его нет
+                user_data = await shared_state.run(profile_cache.get, session_id)
+                if user_data is None:
                     user = await client.get_me()
-                    print(f"[AUTH] restore_sessions: восстановлена сессия для {user.first_name}")
-                    
-                    user_data = {
-                        "id": user.id,
-                        "first_name": user.first_name,
-                        "last_name": user.last_name or "",
-                        "username": user.username or "",
-                        "phone": user.phone or "",
-                    }
-                    
-                    # Сохраняем данные
-                    self._user_data = user_data
-                    print(f"[AUTH] restore_session: отключаем клиента")
-                    await client.disconnect()  # Отключаем, бот подключится сам
-                    print(f"[AUTH] restore_session: клиент отключен")
-                    return True
-                else:
-                    print(f"[AUTH] restore_session: пользователь не авторизован")
-                    await client.disconnect()
-                    return False
-            except asyncio.TimeoutError:
-                print(f"[AUTH] restore_session: таймаут подключения")
-                try:
-                    await client.disconnect()
-                except:
-                    pass
-                return False
-            except Exception as e:
-                print(f"[AUTH] restore_sessions: ошибка: {e}")
-                import traceback
-                traceback.print_exc()
-                try:
-                    await client.disconnect()
-                except:
-                    pass
+                    await shared_state.run(profile_cache.set_user, session_id, user)
+                    user_data = await shared_state.run(profile_cache.get, session_id)
+                logger.info(f"restore_session: восстановлена сессия {session_id} для {user_data['first_name']}")
+                
+                await shared_state.run(shared_state.set_authorized, session_id)
+                session_validity.set(session_id, True)
+                return True
+            else:
+                logger.info(f"restore_session: пользователь {session_id} не авторизован")
+                await shared_state.run(self._forget_user, session_id)
+                session_validity.set(session_id, False)
                 return False
-        
-        try:
-            # Используем новый event loop для восстановления сессии
-            self._run_async_in_new_loop(restore_session(), timeout=30)
+        except asyncio.TimeoutError:
+            logger.warning(f"restore_session: таймаут подключения")
+            return False
         except Exception as e:
-            print(f"[AUTH] restore_sessions: ошибка при восстановлении: {e}")
+            logger.exception(f"restore_session: ошибка: {e}")
+            return False
+        finally:
+            # Отключаем в любом случае, бот подключится сам
+            try:
+                await client.disconnect()
+            except Exception as e:
+                logger.debug(f"restore_session: ошибка при отключении клиента {session_id}: {e}")
     
     def cleanup_expired_qr(self):
         """
-        Очищает истекшие QR-коды из памяти и отключает их клиентов
+        Удаляет все истекшие QR-коды сразу (обычно это делает планировщик в дедлайн каждого QR)
         """
-        current_time = time.time()
-        expired_qr_ids = []
-        
-        for qr_id, qr_data in self.active_qr_codes.items():
-            expires_at = qr_data.get("expires_at", 0)
-            if current_time > expires_at:
-                expired_qr_ids.append(qr_id)
-        
-        for qr_id in expired_qr_ids:
-            print(f"[AUTH] Очистка истекшего QR: {qr_id}")
-            qr_data = self.active_qr_codes[qr_id]
-            # Отключаем клиента если он есть
-            client = qr_data.get("qr_client")
-            event_loop = qr_data.get("event_loop")
-            if client and event_loop:
-                try:
-                    async def disconnect():
-                        await client.disconnect()
-                    self._run_async_in_existing_loop(disconnect(), event_loop, timeout=5)
-                    print(f"[AUTH] Клиент для {qr_id} отключен")
-                except Exception as e:
-                    print(f"[AUTH] Ошибка при отключении клиента {qr_id}: {e}")
-                finally:
-                    # Закрываем event loop после отключения
-                    try:
-                        if not event_loop.is_closed():
-                            event_loop.close()
-                    except:
-                        pass
-            # Удаляем temp сессии
-            temp_session = qr_data.get("temp_session")
-            if temp_session:
-                temp_session_file = Path(temp_session)
-                if temp_session_file.exists():
-                    try:
-                        temp_session_file.unlink()
-                        print(f"[AUTH] Удален temp файл: {temp_session}")
-                    except Exception as e:
-                        print(f"[AUTH] Ошибка при удалении {temp_session}: {e}")
-            # Удаляем файл QR-кода если он есть
-            qr_file = qr_data.get("qr_file")
-            if qr_file:
-                qr_file_path = Path(qr_file)
-                if qr_file_path.exists():
-                    try:
-                        qr_file_path.unlink()
-                        print(f"[AUTH] Удален файл QR-кода: {qr_file}")
-                    except Exception as e:
-                        print(f"[AUTH] Ошибка при удалении файла QR-кода {qr_file}: {e}")
-            # Удаляем из словаря
-            del self.active_qr_codes[qr_id]
+        now = time.time()
+        for qr_id, qr_data in list(self.active_qr_codes.items()):
+            if self._is_qr_expired(qr_data, now):
+                logger.info(f"Очистка истекшего QR: {qr_id}")
+                self._discard_qr(qr_id)
     
     def get_qr_client_and_clear(self, qr_id: str) -> Optional[TelegramClient]:
         """
@@ -974,20 +1258,22 @@ class AuthManager:
         Returns:
             TelegramClient или None
         """
-        if qr_id not in self.active_qr_codes:
+        qr_data = self.active_qr_codes.pop(qr_id, None)
+        if qr_data is None:
             return None
-        qr_data = self.active_qr_codes[qr_id]
-        client = qr_data.get("qr_client")
-        # Очищаем QR-данные
-        del self.active_qr_codes[qr_id]
-        return client
+        # Очищаем QR-данные (клиент не отключаем - он уходит боту)
+        self._qr_expiry.cancel(qr_id)
+        qr_image_store.remove(qr_id)
+        shared_state.post(shared_state.delete_qr, qr_id)
+        return qr_data.get("qr_client")
     
     def cleanup_temp_files(self):
         """
-        Очищает все temp файлы сессий (вызывается при старте сервера и при генерации нового QR)
-        Удаляет все файлы начинающиеся с temp_* включая .session, .session.journal и другие
+        Очищает оставшиеся temp файлы сессий (вызывается при старте сервера)
+        Temp сессии теперь живут в памяти, на диске могут остаться только файлы прежних
+        версий (temp_*) и недописанные временные файлы файлового хранилища (.user*.session)
         """
-        print("[AUTH] cleanup_temp_files вызван")
+        logger.debug("cleanup_temp_files вызван")
         # Ищем все файлы начинающиеся с temp_
         temp_files = []
         # Ищем .session файлы
@@ -997,21 +1283,23 @@ class AuthManager:
         # Ищем любые другие файлы начинающиеся с temp_
         temp_files.extend([f for f in config.SESSIONS_DIR.iterdir() 
                           if f.is_file() and f.name.startswith("temp_")])
+        # Недописанные файлы атомарного сохранения сессий
+        temp_files.extend(config.SESSIONS_DIR.glob(".user*.session*"))
         
         # Убираем дубликаты
         temp_files = list(set(temp_files))
         
-        print(f"[AUTH] Найдено temp файлов: {len(temp_files)}")
+        logger.debug(f"Найдено temp файлов: {len(temp_files)}")
         deleted_count = 0
         for temp_file in temp_files:
             try:
                 if temp_file.exists():
                     temp_file.unlink()
                     deleted_count += 1
-                    print(f"[AUTH] Удален temp файл: {temp_file.name}")
+                    logger.debug(f"Удален temp файл: {temp_file.name}")
             except Exception as e:
-                print(f"[AUTH] Ошибка при удалении {temp_file.name}: {e}")
-        print(f"[AUTH] Удалено temp файлов: {deleted_count} из {len(temp_files)}")
+                logger.error(f"Ошибка при удалении {temp_file.name}: {e}")
+        logger.info(f"Удалено temp файлов: {deleted_count} из {len(temp_files)}")
 
 
 # Глобальный экземпляр менеджера авторизации
@@ -0,0 +1,116 @@
+"""
+Микро-бенчмарк отрисовки QR-кода: прежний путь через qrcode/PIL против qr_renderer
+
+Запуск:
+    python bench_qr_render.py [количество_итераций]
+"""
+import base64
+import io
+import json
+import os
+import sys
+import time
+import qrcode
+from PIL import Image, ImageDraw, ImageChops
+import qr_renderer
+
+
+def render_legacy(qr_url: str) -> Image.Image:
+    """
+    Прежняя отрисовка из auth_manager: qrcode.make_image, логотип открывается с диска каждый раз
+    """
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(qr_url)
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color="black", back_color="white")
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    width, height = img.size
+    logo_path = qr_renderer.LOGO_PATH
+    if logo_path.exists():
+        logo = Image.open(str(logo_path))
+        if logo.mode != 'RGBA':
+            logo = logo.convert('RGBA')
+        logo_size = int(min(width, height) * 0.15)
+        logo = logo.resize((logo_size, logo_size), Image.Resampling.LANCZOS)
+        center_x = width // 2
+        center_y = height // 2
+        white_zone_radius = (logo_size + 10) // 2
+        draw = ImageDraw.Draw(img)
+        draw.ellipse(
+            [
+                center_x - white_zone_radius,
+                center_y - white_zone_radius,
+                center_x + white_zone_radius,
+                center_y + white_zone_radius
+            ],
+            fill='white'
+        )
+        img.paste(logo, (center_x - logo_size // 2, center_y - logo_size // 2), logo)
+    return img
+
+
+def encode_png_base64(img: Image.Image) -> str:
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def random_login_url() -> str:
+    token = base64.urlsafe_b64encode(os.urandom(32)).decode().rstrip('=')
+    return f"tg://login?token={token}"
+
+
+def bench(name, render, urls):
+    # Прогрев (кеши логотипа и версии заполняются здесь)
+    render(urls[0])
+
+    start_cpu = time.process_time()
+    start_wall = time.perf_counter()
+    for url in urls:
+        render(url)
+    cpu_ms = (time.process_time() - start_cpu) / len(urls) * 1000
+    wall_ms = (time.perf_counter() - start_wall) / len(urls) * 1000
+    print(f"{name:<28} CPU {cpu_ms:7.3f} мс/QR   wall {wall_ms:7.3f} мс/QR")
+    return cpu_ms
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    urls = [random_login_url() for _ in range(iterations)]
+
+    # Проверяем, что новый путь рисует те же пиксели
+    diff = ImageChops.difference(render_legacy(urls[0]), qr_renderer.render_qr_image(urls[0]))
+    print(f"Изображения совпадают: {diff.getbbox() is None}")
+    print(f"Итераций: {iterations}")
+
+    legacy = bench("legacy: отрисовка", render_legacy, urls)
+    current = bench("qr_renderer: отрисовка", qr_renderer.render_qr_image, urls)
+    legacy_full = bench("legacy: + PNG base64", lambda url: encode_png_base64(render_legacy(url)), urls)
+    current_full = bench("qr_renderer: + PNG base64",
+                         lambda url: encode_png_base64(qr_renderer.render_qr_image(url)), urls)
+
+    print(f"Ускорение отрисовки: x{legacy / current:.1f}, с кодированием: x{legacy_full / current_full:.1f}")
+
+    # Форматы ответа /api/generate_qr: CPU на QR и размер поля в JSON
+    print()
+    formats = {
+        "png": lambda url: encode_png_base64(qr_renderer.render_qr_image(url)),
+        "png1": lambda url: base64.b64encode(qr_renderer.render_qr_png1(url)).decode(),
+        "svg": qr_renderer.render_qr_svg,
+        "matrix": lambda url: json.dumps(qr_renderer.render_qr_modules(url)) + json.dumps(url),
+    }
+    for qr_format, render in formats.items():
+        bench(f"format={qr_format}", render, urls)
+        print(f"{'':<28} размер в JSON: {len(render(urls[0]))} байт")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+"""
+Запуск и остановка ботов пользователей поверх auth_manager и userbot_manager
+Работает в процессе, которому принадлежат клиенты Telethon: в веб-воркере
+или в отдельном супервизоре ботов (bot_supervisor.py)
+"""
+import asyncio
+import threading
+from typing import List, Optional
+from telethon import TelegramClient
+import config
+from async_runtime import async_runtime
+from auth_manager import auth_manager
+from userbot_manager import userbot_manager
+from client_pool import qr_client_pool
+from session_store import session_store
+from shared_state import shared_state
+from metrics import MetricsRegistry
+from log_pipeline import get_logger
+
+logger = get_logger("BOT")
+
+
+class BotControl:
+    """
+    Класс с синхронными операциями над ботами для обработчиков запросов
+    Те же методы доступны веб-воркеру через IPC, когда боты живут в супервизоре
+    """
+
+    def __init__(self):
+        # Callbacks регистрируются один раз, при первом install()
+        self._installed = False
+        self._lock = threading.Lock()
+
+    def install(self):
+        """
+        Связывает менеджеры: авторизованный клиент QR-кода сразу передается боту,
+        а отзыв сессии в Telegram завершает ее на сервере
+        """
+        with self._lock:
+            if self._installed:
+                return
+            auth_manager.set_authorized_callback(self._start_bot)
+            userbot_manager.set_logout_callback(self._handle_user_logout)
+            self._installed = True
+
+    async def _start_bot(self, session_id: str, client: TelegramClient) -> bool:
+        """
+        Регистрирует бота пользователя на подключенном клиенте (выполняется в общем event loop)
+
+        Args:
+            session_id: ID пользователя
+            client: TelegramClient с подключенным клиентом
+
+        Returns:
+            bool: True если бот успешно запущен
+        """
+        logger.info(f"init_bot: регистрируем бота {session_id}")
+        started = await userbot_manager.start_bot(session_id, client)
+        if started:
+            logger.info(f"init_bot: бот {session_id} зарегистрирован")
+        return started
+
+    async def _start_bot_from_session(self, session_id: str) -> bool:
+        """
+        Подключает клиента из постоянной сессии пользователя и запускает бота (в общем event loop)
+
+        Args:
+            session_id: ID пользователя
+
+        Returns:
+            bool: True если бот успешно запущен
+        """
+        if (session_id not in userbot_manager.active_bots
+                and await shared_state.run(userbot_manager.is_bot_active, session_id)):
+            # Бот уже работает в другом воркере - второй экземпляр не нужен
+            logger.info(f"connect_client: бот {session_id} уже запущен в другом воркере")
+            return True
+        logger.debug(f"connect_client: создаем клиента из сессии {session_id}")
+        session = await shared_state.run(session_store.open_session, session_id)
+        if session is None:
+            logger.error(f"connect_client: сессия {session_id} не найдена")
+            return False
+        client = TelegramClient(session, config.API_ID, config.API_HASH)
+        started = False
+        try:
+            await asyncio.wait_for(client.connect(), timeout=10)
+            logger.debug(f"connect_client: клиент подключен")
+            if not await client.is_user_authorized():
+                logger.warning(f"connect_client: сессия {session_id} не авторизована, бот не запускается")
+                return False
+            started = await self._start_bot(session_id, client)
+            return started
+        finally:
+            # Клиент, не ставший ботом (ошибка, таймаут или отказ), отключаем
+            if not started:
+                try:
+                    await client.disconnect()
+                except Exception as e:
+                    logger.debug(f"connect_client: ошибка при отключении клиента {session_id}: {e}")
+
+    def start_bot_from_session(self, session_id: str):
+        """
+        Начинает запуск бота из постоянной сессии в общем event loop
+
+        Args:
+            session_id: ID пользователя
+
+        Returns:
+            concurrent.futures.Future: Завершается, когда бот запущен (True) или запуск не удался (False)
+        """
+        async def start():
+            return await asyncio.wait_for(self._start_bot_from_session(session_id), timeout=30)
+        return userbot_manager.run_transition(session_id, "start", start)
+
+    def start_bot(self, session_id: str, timeout: float = config.BOT_TRANSITION_TIMEOUT) -> Optional[bool]:
+        """
+        Запускает бота и ждет, пока он реально запустится, но не дольше timeout
+
+        Args:
+            session_id: ID пользователя
+            timeout: Дедлайн в секундах
+
+        Returns:
+            bool или None: Результат запуска или None, если дедлайн истек (запуск продолжается)
+        """
+        return userbot_manager.wait_transition(self.start_bot_from_session(session_id), timeout)
+
+    def stop_bot(self, session_id: str, timeout: float = config.BOT_TRANSITION_TIMEOUT) -> Optional[bool]:
+        """
+        Останавливает бота и ждет завершения остановки, но не дольше timeout
+
+        Args:
+            session_id: ID пользователя
+            timeout: Дедлайн в секундах
+
+        Returns:
+            bool или None: True если бот был остановлен, None если дедлайн истек
+        """
+        return userbot_manager.wait_transition(self._stop_transition(session_id), timeout)
+
+    def _stop_transition(self, session_id: str):
+        return userbot_manager.run_transition(session_id, "stop", lambda: userbot_manager.stop_bot(session_id))
+
+    def is_bot_active(self, session_id: str) -> bool:
+        return userbot_manager.is_bot_active(session_id)
+
+    def get_user_photo(self, session_id: str, size) -> Optional[bytes]:
+        """
+        Возвращает фото пользователя; при промахе кеша загружает его через клиент активного бота, если он есть
+
+        Args:
+            session_id: ID пользователя
+            size: Нормализованный размер (см. photo_cache.parse_photo_size)
+
+        Returns:
+            bytes или None
+        """
+        return auth_manager.get_user_photo(session_id, size, client=userbot_manager.get_client(session_id))
+
+    def start_bots_from_sessions(self, session_ids: List[str]) -> int:
+        """
+        Запускает ботов для многих пользователей сразу: все в общем event loop,
+        не больше SESSION_RESTORE_CONCURRENCY подключений одновременно и без потока на пользователя
+
+        Args:
+            session_ids: ID пользователей
+
+        Returns:
+            int: Сколько ботов запущено
+        """
+        async def start_all():
+            semaphore = asyncio.Semaphore(max(1, config.SESSION_RESTORE_CONCURRENCY))
+
+            async def start_one(session_id):
+                async with semaphore:
+                    try:
+                        # Через общий механизм переходов: параллельный toggle того же бота не запустит второй клиент
+                        return await asyncio.wrap_future(self.start_bot_from_session(session_id))
+                    except Exception as e:
+                        logger.error(f"Ошибка при запуске бота {session_id}: {type(e).__name__}: {e}")
+                        return False
+
+            results = await asyncio.gather(*(start_one(sid) for sid in session_ids))
+            return sum(1 for started in results if started)
+
+        if not session_ids:
+            return 0
+        return async_runtime.run(start_all(), timeout=None)
+
+    def restore_and_start_bots(self):
+        """
+        Восстанавливает сессии всех пользователей и запускает их ботов (при старте процесса)
+        """
+        try:
+            # Восстанавливаем сессии (параллельно в общем event loop, сервер для этого не нужен)
+            restored = auth_manager.restore_sessions()
+
+            # Запускаем ботов для восстановленных сессий, у которых бот еще не активен
+            to_start = [sid for sid in restored if not userbot_manager.is_bot_active(sid)]
+            if to_start:
+                logger.info(f"Восстановлено сессий: {len(restored)}, запускаем ботов: {len(to_start)}")
+                started = self.start_bots_from_sessions(to_start)
+                logger.info(f"Запущено ботов: {started} из {len(to_start)}")
+            else:
+                logger.info(f"Сессии не восстановлены или боты уже активны")
+        except Exception as e:
+            logger.exception(f"Ошибка при восстановлении и запуске бота: {e}")
+
+    def _handle_user_logout(self, session_id: str):
+        """
+        Callback для вызова когда пользователь завершает сессию в Telegram
+
+        Args:
+            session_id: ID пользователя
+        """
+        logger.info(f"handle_user_logout вызван - пользователь {session_id} завершил сессию в Telegram")
+        auth_manager.logout(session_id)
+        logger.info(f"handle_user_logout: данные очищены")
+
+    @staticmethod
+    def register_metrics(registry: MetricsRegistry):
+        """
+        Регистрирует метрики QR-кодов, клиентов и ботов процесса-владельца
+
+        Args:
+            registry: Реестр метрик процесса
+        """
+        registry.gauge("qr_records_active", "QR-коды в реестре", lambda: len(auth_manager.active_qr_codes))
+        registry.gauge("qr_records_waiting", "QR-логины, ожидающие пользователя",
+                       auth_manager.active_qr_codes.waiting_count)
+        registry.gauge("qr_client_pool_idle", "Готовые подключенные клиенты в пуле", qr_client_pool.size)
+        registry.gauge("event_loops_running", "Запущенные event loop (общий loop async_runtime)",
+                       lambda: 1 if async_runtime.is_running() else 0)
+        registry.gauge("bots_active", "Запущенные юзерботы", lambda: len(userbot_manager.active_bots))
+        registry.gauge("updates_pending", "Входящие обновления ботов, ожидающие обработки",
+                       userbot_manager.update_dispatcher.pending)
+        registry.gauge("update_workers_busy", "Воркеры, обрабатывающие обновления ботов",
+                       userbot_manager.update_dispatcher.busy)
+        registry.gauge("reply_queue_depth", "Ответы ботов, ожидающие отправки", userbot_manager.reply_queue_depth)
+        registry.gauge("reply_queues_parked", "Очереди ответов на паузе после FloodWaitError",
+                       userbot_manager.reply_queues_parked)
+        registry.gauge("bot_transitions_pending", "Незавершенные запуски и остановки ботов",
+                       lambda: {(kind,): count for kind, count in userbot_manager.pending_transitions().items()},
+                       ("kind",))
+
+
+# Глобальный экземпляр управления ботами
+bot_control = BotControl()
@@ -0,0 +1,258 @@
+"""
+IPC между веб-воркерами и супервизором ботов: сообщения JSON с длиной через Unix-сокет
+"""
+import json
+import time
+import base64
+import socket
+import struct
+import functools
+import threading
+from typing import Any, Callable, Dict, Optional, Sequence
+from event_bus import EventBus
+from qr_image_store import QRImage
+from qr_registry import QRCapacityError
+from tracing import tracer
+from log_pipeline import get_logger
+
+logger = get_logger("APP.IPC")
+
+# Заголовок сообщения: длина тела в байтах
+HEADER = struct.Struct("!I")
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+
+# Методы, которые веб-воркер может вызвать в супервизоре: {объект: методы}
+REMOTE_METHODS: Dict[str, Sequence[str]] = {
+    "auth": (
+        "generate_qr_code", "generate_qr_code_url", "check_authorization_status", "get_qr_refresh",
+        "get_qr_image", "is_qr_valid", "owns_qr", "submit_password", "logout", "is_authorized",
+        "get_user_data", "get_active_sessions", "has_session", "is_session_valid", "get_photo_etag",
+        "restore_sessions",
+    ),
+    "bot": ("start_bot", "stop_bot", "is_bot_active", "get_user_photo"),
+    "supervisor": ("ping", "metrics"),
+}
+
+# Восстановление типов результатов, которые JSON превращает в списки
+_RESULT_TYPES: Dict[tuple, Callable[[Any], Any]] = {
+    ("auth", "get_qr_image"): lambda value: QRImage(*value) if value else None,
+}
+
+
+class SupervisorError(RuntimeError):
+    """
+    Ошибка в супервизоре ботов или потеря связи с ним
+    """
+
+
+def _default(value):
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    raise TypeError(f"{type(value).__name__} не сериализуется в JSON")
+
+
+def _object_hook(value: dict):
+    if len(value) == 1 and "__bytes__" in value:
+        return base64.b64decode(value["__bytes__"])
+    return value
+
+
+def send_message(sock: socket.socket, message: dict):
+    """
+    Отправляет сообщение (bytes внутри передаются в base64)
+
+    Args:
+        sock: Подключенный Unix-сокет
+        message: Сообщение
+    """
+    body = json.dumps(message, default=_default, ensure_ascii=False).encode("utf-8")
+    sock.sendall(HEADER.pack(len(body)) + body)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> Optional[bytes]:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1024 * 1024))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_message(sock: socket.socket) -> Optional[dict]:
+    """
+    Читает одно сообщение
+
+    Args:
+        sock: Подключенный Unix-сокет
+
+    Returns:
+        dict или None: Сообщение или None, если соединение закрыто
+    """
+    header = _recv_exactly(sock, HEADER.size)
+    if header is None:
+        return None
+    (size,) = HEADER.unpack(header)
+    if size > MAX_MESSAGE_SIZE:
+        raise SupervisorError(f"Слишком большое сообщение IPC: {size} байт")
+    body = _recv_exactly(sock, size)
+    if body is None:
+        return None
+    return json.loads(body, object_hook=_object_hook)
+
+
+def encode_error(error: BaseException) -> dict:
+    """
+    Описывает исключение для ответа IPC (QRCapacityError восстанавливается на стороне веб-воркера)
+    """
+    data = {"type": type(error).__name__, "message": str(error)}
+    if isinstance(error, QRCapacityError):
+        data["retry_after"] = error.retry_after
+    return data
+
+
+def _decode_error(data: dict) -> Exception:
+    if data.get("type") == "QRCapacityError":
+        return QRCapacityError(data.get("retry_after", 1))
+    return SupervisorError(f"{data.get('type')}: {data.get('message')}")
+
+
+class RemoteProxy:
+    """
+    Объект с теми же методами, что у auth_manager или bot_control, но выполняющий их в супервизоре
+    """
+
+    def __init__(self, client: "SupervisorClient", target: str):
+        self._client = client
+        self._target = target
+
+    def __getattr__(self, name: str):
+        if name.startswith("_") or name not in REMOTE_METHODS[self._target]:
+            raise AttributeError(f"Метод {self._target}.{name} недоступен через супервизор ботов")
+        return functools.partial(self._client.call, self._target, name)
+
+
+class SupervisorClient:
+    """
+    Класс для вызова супервизора ботов из веб-воркера
+    У каждого потока запросов свое соединение, оно переиспользуется между запросами
+    """
+
+    def __init__(self, socket_path: str, timeout: float):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._relay_thread: Optional[threading.Thread] = None
+        self.auth_manager = RemoteProxy(self, "auth")
+        self.bot_control = RemoteProxy(self, "bot")
+
+    def _connect(self, timeout: Optional[float]) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _close_connection(self):
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def call(self, target: str, method: str, *args, **kwargs):
+        """
+        Выполняет метод в супервизоре и возвращает результат
+
+        Args:
+            target: Объект: "auth", "bot" или "supervisor"
+            method: Имя метода
+            *args, **kwargs: Аргументы (должны сериализоваться в JSON)
+
+        Returns:
+            Результат метода
+
+        Raises:
+            QRCapacityError: Лимит ожидающих QR-логинов достигнут
+            SupervisorError: Ошибка в супервизоре или он недоступен
+        """
+        message = {
+            "target": target,
+            "method": method,
+            "args": args,
+            "kwargs": kwargs,
+            "request_id": tracer.current_request_id(),
+        }
+        for attempt in range(2):
+            sock = getattr(self._local, "sock", None)
+            reused = sock is not None
+            try:
+                if sock is None:
+                    sock = self._local.sock = self._connect(self.timeout)
+                send_message(sock, message)
+            except OSError as e:
+                self._close_connection()
+                # Соединение могло устареть после перезапуска супервизора - запрос еще не ушел, повторяем
+                if reused and attempt == 0:
+                    continue
+                raise SupervisorError(f"Супервизор ботов недоступен: {e}") from e
+            try:
+                reply = recv_message(sock)
+            except (OSError, ValueError) as e:
+                self._close_connection()
+                raise SupervisorError(f"Ошибка связи с супервизором ботов: {e}") from e
+            if reply is None:
+                # Запрос ушел, но ответа нет - повторять нельзя, операция могла выполниться
+                self._close_connection()
+                raise SupervisorError("Супервизор ботов закрыл соединение")
+            if not reply.get("ok"):
+                raise _decode_error(reply.get("error") or {})
+            result = reply.get("result")
+            convert = _RESULT_TYPES.get((target, method))
+            return convert(result) if convert else result
+
+    def metrics(self, exclude: Sequence[str] = ()) -> str:
+        """
+        Возвращает метрики супервизора в формате Prometheus (без метрик с именами из exclude)
+        """
+        return self.call("supervisor", "metrics", list(exclude))
+
+    def relay_events(self, event_bus: EventBus):
+        """
+        Запускает поток, который пересылает события супервизора (статус QR-кода, бота, выход)
+        в шину событий веб-воркера для SSE (повторный вызов ничего не делает)
+
+        Args:
+            event_bus: Шина событий веб-воркера
+        """
+        if self._relay_thread is not None:
+            return
+
+        def relay_loop():
+            while True:
+                try:
+                    # Без таймаута: супервизор присылает keepalive, пока соединение живо
+                    sock = self._connect(None)
+                    try:
+                        send_message(sock, {"target": "supervisor", "method": "subscribe_events"})
+                        logger.info("Подписка на события супервизора ботов установлена")
+                        while True:
+                            message = recv_message(sock)
+                            if message is None:
+                                break
+                            if message.get("event"):
+                                event_bus.publish(message["event"], message.get("data"), message.get("session_id"))
+                    finally:
+                        sock.close()
+                except (OSError, ValueError, SupervisorError) as e:
+                    logger.warning(f"Нет связи с супервизором ботов для событий: {e}")
+                time.sleep(1)
+
+        self._relay_thread = threading.Thread(target=relay_loop, name="supervisor-events", daemon=True)
+        self._relay_thread.start()
@@ -0,0 +1,179 @@
+"""
+Супервизор ботов: отдельный процесс, которому принадлежат все клиенты Telethon и общий event loop
+Веб-воркеры управляют ботами и QR-кодами через Unix-сокет (BOT_SUPERVISOR_SOCKET) и могут
+перезапускаться и масштабироваться, не разрывая MTProto соединения
+
+Запуск: BOT_SUPERVISOR_SOCKET=/tmp/bots.sock python bot_supervisor.py
+"""
+import os
+import sys
+import queue
+import signal
+import socket
+import threading
+import socketserver
+from typing import Dict, Sequence
+import config
+from auth_manager import auth_manager
+from bot_control import bot_control
+from client_pool import qr_client_pool
+from event_bus import event_bus
+from metrics import registry as metrics_registry
+from qr_registry import QRCapacityError
+from tracing import tracer
+from bot_ipc import REMOTE_METHODS, send_message, recv_message, encode_error
+from log_pipeline import log_pipeline, get_logger
+
+logger = get_logger("APP.SUPERVISOR")
+
+# Интервал keepalive в потоке событий (секунды): по нему замечаем отключившиеся веб-воркеры
+EVENTS_KEEPALIVE_INTERVAL = 15
+# Сколько событий может ждать отправки одному веб-воркеру; медленный воркер теряет события, у браузера есть polling
+EVENTS_QUEUE_SIZE = 1000
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    """
+    Обслуживает одно соединение веб-воркера: вызовы методов по очереди или поток событий
+    """
+
+    def handle(self):
+        supervisor: "BotSupervisor" = self.server.supervisor
+        while True:
+            try:
+                message = recv_message(self.request)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ошибка чтения запроса IPC: {e}")
+                return
+            if message is None:
+                return
+            if message.get("target") == "supervisor" and message.get("method") == "subscribe_events":
+                supervisor.stream_events(self.request)
+                return
+            try:
+                send_message(self.request, supervisor.dispatch(message))
+            except OSError as e:
+                logger.warning(f"Веб-воркер отключился, не дождавшись ответа: {e}")
+                return
+
+
+class _SupervisorServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class BotSupervisor:
+    """
+    Класс для процесса-владельца ботов: восстанавливает сессии, запускает ботов
+    и выполняет вызовы веб-воркеров из списка REMOTE_METHODS
+    """
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self._targets = {"auth": auth_manager, "bot": bot_control, "supervisor": self}
+        self._server = None
+
+    def ping(self) -> bool:
+        return True
+
+    def metrics(self, exclude: Sequence[str] = ()) -> str:
+        """
+        Метрики супервизора в формате Prometheus (без метрик, которые выводит сам веб-воркер)
+        """
+        return metrics_registry.render(exclude)
+
+    def dispatch(self, message: Dict) -> Dict:
+        """
+        Выполняет вызов веб-воркера
+
+        Args:
+            message: {"target", "method", "args", "kwargs", "request_id"}
+
+        Returns:
+            Dict: {"ok": True, "result": ...} или {"ok": False, "error": {...}}
+        """
+        target, method = message.get("target"), message.get("method")
+        if method not in REMOTE_METHODS.get(target, ()):
+            return {"ok": False, "error": {"type": "AttributeError", "message": f"Неизвестный метод {target}.{method}"}}
+        try:
+            # Спан продолжает запрос веб-воркера (тот же X-Request-ID)
+            with tracer.span(f"ipc:{target}.{method}", request_id=message.get("request_id") or None):
+                result = getattr(self._targets[target], method)(*message.get("args", ()), **message.get("kwargs", {}))
+            return {"ok": True, "result": result}
+        except Exception as e:
+            if not isinstance(e, QRCapacityError):
+                logger.exception(f"Ошибка при выполнении {target}.{method}: {e}")
+            return {"ok": False, "error": encode_error(e)}
+
+    def stream_events(self, sock: socket.socket):
+        """
+        Пересылает все события шины веб-воркеру, пока он не отключится
+
+        Args:
+            sock: Соединение веб-воркера
+        """
+        events: "queue.Queue" = queue.Queue(maxsize=EVENTS_QUEUE_SIZE)
+
+        def forward(event: str, data: dict, session_id):
+            try:
+                events.put_nowait({"event": event, "data": data, "session_id": session_id})
+            except queue.Full:
+                logger.warning(f"Очередь событий веб-воркера переполнена, событие {event} пропущено")
+
+        event_bus.add_listener(forward)
+        logger.info("Веб-воркер подписался на события")
+        try:
+            while True:
+                try:
+                    message = events.get(timeout=EVENTS_KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    message = {"event": None}
+                send_message(sock, message)
+        except OSError:
+            logger.info("Веб-воркер отписался от событий")
+        finally:
+            event_bus.remove_listener(forward)
+
+    def serve(self):
+        """
+        Запускает ботов и обслуживает веб-воркеры до SIGTERM/SIGINT
+        """
+        if os.path.exists(self.socket_path):
+            # Сокет остался от прежнего запуска
+            os.unlink(self.socket_path)
+        self._server = _SupervisorServer(self.socket_path, _RequestHandler)
+        self._server.supervisor = self
+        # Управлять ботами может только пользователь, от имени которого запущен сервис
+        os.chmod(self.socket_path, 0o600)
+
+        bot_control.install()
+        bot_control.register_metrics(metrics_registry)
+        metrics_registry.gauge("threads_active", "Потоки процесса", threading.active_count)
+        metrics_registry.gauge("log_records_dropped", "Записи лога, отброшенные из-за переполненной очереди",
+                               lambda: log_pipeline.dropped)
+        auth_manager.cleanup_temp_files()
+        if config.API_ID and config.API_HASH:
+            qr_client_pool.start()
+        threading.Thread(target=bot_control.restore_and_start_bots, name="restore-bots", daemon=True).start()
+
+        def shutdown(signum, frame):
+            logger.info(f"Получен сигнал {signum}, останавливаем супервизор")
+            # shutdown() ждет serve_forever - вызываем из другого потока
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+        logger.info(f"Супервизор ботов слушает {self.socket_path}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            logger.info("Супервизор ботов остановлен")
+
+
+if __name__ == '__main__':
+    if not config.BOT_SUPERVISOR_SOCKET:
+        logger.error("BOT_SUPERVISOR_SOCKET не задан")
+        sys.exit(1)
+    BotSupervisor(config.BOT_SUPERVISOR_SOCKET).serve()
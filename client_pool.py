@@ -0,0 +1,162 @@
+"""
+Пул заранее подключенных MTProto клиентов для мгновенной генерации QR-кода
+"""
+import time
+import uuid
+import asyncio
+from collections import deque
+from typing import Optional, Tuple
+from telethon import TelegramClient
+from telethon.sessions import StringSession
+import config
+from async_runtime import async_runtime
+from log_pipeline import get_logger
+
+logger = get_logger("AUTH.POOL")
+
+
+class ClientPool:
+    """
+    Класс для хранения подключенных, но не авторизованных клиентов на temp сессиях в памяти
+    Самая долгая часть генерации QR - TCP и обмен auth key, поэтому клиенты
+    подключаются заранее в фоне, а /api/generate_qr вызывает только qr_login()
+    Все методы выполняются в общем event loop из async_runtime
+    """
+
+    def __init__(self, target_size: int, idle_ttl: float):
+        # Целевое число готовых клиентов в пуле
+        self.target_size = target_size
+        # Через сколько секунд простоя клиент отключается
+        self.idle_ttl = idle_ttl
+        # Готовые клиенты: (client, temp_session, connected_at)
+        self._idle: deque = deque()
+        # Сколько клиентов сейчас подключается
+        self._connecting = 0
+        # Время последней выдачи клиента - пул пополняется только при наличии спроса
+        self._last_acquire_at = 0.0
+        self._refill_task: Optional[asyncio.Task] = None
+        self._maintenance_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """
+        Запускает прогрев пула и фоновую очистку простаивающих клиентов
+        """
+        if self.target_size <= 0:
+            return
+        # Прогрев при старте считаем спросом, чтобы первый QR был мгновенным
+        self._last_acquire_at = time.time()
+        async_runtime.submit(self._start())
+
+    async def _start(self):
+        if self._maintenance_task is None or self._maintenance_task.done():
+            self._maintenance_task = asyncio.create_task(self._maintenance_loop())
+        self._schedule_refill()
+
+    def size(self) -> int:
+        """
+        Возвращает число готовых клиентов в пуле
+
+        Returns:
+            int: Количество готовых клиентов
+        """
+        return len(self._idle)
+
+    async def acquire(self) -> Tuple[TelegramClient, str]:
+        """
+        Выдает подключенный клиент из пула или подключает новый, если пул пуст
+
+        Returns:
+            tuple: (client, temp_session) - клиент и имя его temp сессии (для логов)
+        """
+        self._last_acquire_at = time.time()
+        await self._evict_idle()
+
+        while self._idle:
+            client, temp_session, _ = self._idle.popleft()
+            if client.is_connected():
+                self._schedule_refill()
+                logger.debug(f"Выдан готовый клиент, осталось в пуле: {len(self._idle)}")
+                return client, temp_session
+            await self._discard(client, temp_session)
+
+        # Пул пуст - подключаемся напрямую и параллельно пополняем пул
+        logger.info("Пул пуст, подключаем клиента напрямую")
+        self._schedule_refill()
+        return await self._connect_client()
+
+    async def _connect_client(self) -> Tuple[TelegramClient, str]:
+        """
+        Подключает нового неавторизованного клиента на temp сессии в памяти (без файлов на диске)
+
+        Returns:
+            tuple: (client, temp_session)
+        """
+        if not config.API_ID or not config.API_HASH:
+            raise ValueError("API_ID или API_HASH не установлены в переменных окружения!")
+
+        temp_session = f"temp_{uuid.uuid4()}"
+        client = TelegramClient(StringSession(), config.API_ID, config.API_HASH)
+        try:
+            await asyncio.wait_for(client.connect(), timeout=30)
+        except Exception:
+            await self._discard(client, temp_session)
+            raise
+        return client, temp_session
+
+    def _schedule_refill(self):
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self._refill())
+
+    async def _refill(self):
+        """
+        Подключает клиентов, пока пул не достигнет целевого размера
+        """
+        while len(self._idle) + self._connecting < self.target_size:
+            self._connecting += 1
+            try:
+                client, temp_session = await self._connect_client()
+                self._idle.append((client, temp_session, time.time()))
+                logger.debug(f"Клиент подключен в фоне, в пуле: {len(self._idle)}/{self.target_size}")
+            except Exception as e:
+                logger.error(f"Ошибка при подключении клиента в пул: {type(e).__name__}: {e}")
+                # Не долбим Telegram при ошибках сети - следующая попытка при выдаче или обслуживании
+                break
+            finally:
+                self._connecting -= 1
+
+    async def _evict_idle(self):
+        """
+        Отключает клиентов, простаивающих в пуле дольше idle_ttl
+        """
+        now = time.time()
+        while self._idle and now - self._idle[0][2] > self.idle_ttl:
+            client, temp_session, _ = self._idle.popleft()
+            logger.debug(f"Отключаем простаивающий клиент: {temp_session}")
+            await self._discard(client, temp_session)
+
+    async def _maintenance_loop(self):
+        """
+        Периодически вытесняет простаивающих клиентов и пополняет пул, если есть спрос
+        """
+        interval = max(5.0, min(60.0, self.idle_ttl / 2))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._evict_idle()
+                if time.time() - self._last_acquire_at < self.idle_ttl:
+                    self._schedule_refill()
+            except Exception as e:
+                logger.error(f"Ошибка при обслуживании пула: {e}")
+
+    async def _discard(self, client: TelegramClient, temp_session: str):
+        """
+        Отключает клиента (temp сессия в памяти исчезает вместе с ним)
+        """
+        try:
+            await client.disconnect()
+        except Exception as e:
+            logger.error(f"Ошибка при отключении клиента {temp_session}: {e}")
+
+
+# Глобальный пул клиентов для QR-авторизации
+qr_client_pool = ClientPool(config.QR_CLIENT_POOL_SIZE, config.QR_CLIENT_POOL_IDLE_TTL)
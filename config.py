@@ -19,13 +19,105 @@ SESSIONS_DIR.mkdir(exist_ok=True)
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this-in-production")
 DEBUG = os.getenv("DEBUG", "True").lower() == "true"
 
+# Несколько пользователей в одном процессе (включается явно): каждый браузер получает свой ID в cookie сессии Flask
+# По умолчанию (MULTI_TENANT=false) все запросы работают с одной сессией user.session, как раньше
+MULTI_TENANT = os.getenv("MULTI_TENANT", "False").lower() == "true"
+# Сколько сессий одновременно восстанавливается и запускается при старте сервера
+SESSION_RESTORE_CONCURRENCY = int(os.getenv("SESSION_RESTORE_CONCURRENCY", "20"))
+
+# Сколько секунд запрос ждет завершения запуска/остановки бота, прежде чем ответить текущим состоянием
+BOT_TRANSITION_TIMEOUT = int(os.getenv("BOT_TRANSITION_TIMEOUT", "15"))
+
+# Как часто (в секундах) воркер проверяет запросы других воркеров на остановку его ботов
+BOT_STOP_POLL_INTERVAL = float(os.getenv("BOT_STOP_POLL_INTERVAL", "0.5"))
+
+# Лимиты исходящих ответов бота: для всего аккаунта и для одного чата (сообщений в секунду и подряд)
+REPLY_RATE = float(os.getenv("REPLY_RATE", "5"))
+REPLY_BURST = float(os.getenv("REPLY_BURST", "10"))
+REPLY_CHAT_RATE = float(os.getenv("REPLY_CHAT_RATE", "1"))
+REPLY_CHAT_BURST = float(os.getenv("REPLY_CHAT_BURST", "3"))
+# Сколько ответов бота может ждать отправки и сколько секунд ответ остается актуальным
+REPLY_QUEUE_SIZE = int(os.getenv("REPLY_QUEUE_SIZE", "1000"))
+REPLY_MAX_AGE = int(os.getenv("REPLY_MAX_AGE", "600"))
+
+# Входящие сообщения ботов: сколько обрабатывается одновременно, сколько может ждать всего и в одном чате,
+# сколько секунд может обрабатываться одно сообщение
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "8"))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "2000"))
+UPDATE_CHAT_QUEUE_SIZE = int(os.getenv("UPDATE_CHAT_QUEUE_SIZE", "50"))
+UPDATE_HANDLER_TIMEOUT = int(os.getenv("UPDATE_HANDLER_TIMEOUT", "30"))
+
+# Unix-сокет супервизора ботов (bot_supervisor.py), которому принадлежат все клиенты Telethon
+# Пусто - клиенты и боты живут в самом веб-воркере
+BOT_SUPERVISOR_SOCKET = os.getenv("BOT_SUPERVISOR_SOCKET", "")
+# Сколько секунд веб-воркер ждет ответа супервизора (генерация QR-кода занимает до минуты)
+BOT_SUPERVISOR_TIMEOUT = int(os.getenv("BOT_SUPERVISOR_TIMEOUT", "90"))
+
+# Сколько потоков /api/events одновременно держит один процесс gunicorn (каждый занимает поток запросов);
+# сверх лимита - ответ 503, и страница работает через polling. Должно быть меньше --threads
+SSE_MAX_STREAMS = int(os.getenv("SSE_MAX_STREAMS", "2"))
+
+# Сколько секунд кешируется ответ о валидности сохраненной сессии (/api/check_session_status)
+SESSION_VALIDITY_TTL = int(os.getenv("SESSION_VALIDITY_TTL", "60"))
+
+# Где хранятся постоянные сессии Telegram:
+# file - отдельный файл sessions/user*.session на пользователя (по умолчанию),
+# sqlite - одна база SESSION_DB_PATH в режиме WAL, memory - только в памяти процесса
+SESSION_STORE = os.getenv("SESSION_STORE", "file").lower()
+SESSION_DB_PATH = Path(os.getenv("SESSION_DB_PATH", str(SESSIONS_DIR / "sessions.db")))
+# Общее состояние воркеров gunicorn (авторизация, профили, QR-коды, боты) - SQLite в режиме WAL
+SHARED_STATE_PATH = Path(os.getenv("SHARED_STATE_PATH", str(SESSIONS_DIR / "state.db")))
+
+# Логирование: уровень для всех подсистем (AUTH, API, BOT, SESSION, ...) и переопределения
+# по логгерам через запятую, например "AUTH=DEBUG,API.POLL=WARNING,telethon=INFO"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# Доля запросов опроса статуса (check_status, check_session_status), которые пишутся в лог
+# (предупреждения и ошибки пишутся всегда)
+LOG_POLL_SAMPLE_RATE = float(os.getenv("LOG_POLL_SAMPLE_RATE", "0.05"))
+# Сколько записей может ждать фонового вывода; при переполнении новые записи отбрасываются
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Трассировка запросов (включается явно): спаны с ID запроса, последние TRACE_BUFFER_SIZE спанов видны на /debug/traces
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "False").lower() == "true"
+# Токен администратора для /debug/traces (заголовок Authorization: Bearer <токен>); пусто - маршрута нет
+# Спаны содержат ID пользователей (значение cookie) и qr_id
+TRACES_TOKEN = os.getenv("TRACES_TOKEN", "")
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "2000"))
+# Файл для выгрузки завершенных спанов (по строке JSON), пусто - только в памяти
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+
 # Настройки Telegram API
 API_ID = int(os.getenv("API_ID", "0"))  # Получить на https://my.telegram.org
 API_HASH = os.getenv("API_HASH", "")    # Получить на https://my.telegram.org
 
-# Время жизни QR-кода в секундах (реальный таймаут Telethon ~60 секунд)
+# Время жизни QR-кода в секундах, если Telegram не сообщил время истечения токена
+# (обычно используется реальное время истечения из qr_login.expires)
 QR_CODE_TIMEOUT = 25
 
+# Сколько секунд QR-логин обновляет токен на том же клиенте, прежде чем окончательно истечь
+QR_LOGIN_MAX_AGE = int(os.getenv("QR_LOGIN_MAX_AGE", "600"))
+
+# Максимум изображений QR-кодов в памяти для /api/qr_image/<qr_id>.png
+QR_IMAGE_STORE_SIZE = int(os.getenv("QR_IMAGE_STORE_SIZE", "256"))
+
+# Кеш фото профиля: сколько мегабайт держать в памяти, куда выгружать вытесненные фото и сколько держать на диске
+PHOTO_CACHE_SIZE_MB = int(os.getenv("PHOTO_CACHE_SIZE_MB", "16"))
+PHOTO_CACHE_DIR = Path(os.getenv("PHOTO_CACHE_DIR", str(BASE_DIR / "cache" / "photos")))
+PHOTO_CACHE_DISK_MB = int(os.getenv("PHOTO_CACHE_DISK_MB", "256"))
+
+# Сколько QR-логинов может одновременно ждать сканирования (у каждого открыто соединение с Telegram)
+QR_MAX_PENDING = int(os.getenv("QR_MAX_PENDING", "100"))
+# Через сколько секунд без опросов браузером QR-код можно вытеснить ради нового
+# (страница опрашивает статус минимум раз в 15 секунд)
+QR_IDLE_EVICT_AFTER = int(os.getenv("QR_IDLE_EVICT_AFTER", "45"))
+
+# Пул заранее подключенных клиентов для мгновенной генерации QR-кода
+# Целевое число готовых клиентов (0 - пул отключен)
+QR_CLIENT_POOL_SIZE = int(os.getenv("QR_CLIENT_POOL_SIZE", "2"))
+# Через сколько секунд простоя клиент из пула отключается
+QR_CLIENT_POOL_IDLE_TTL = int(os.getenv("QR_CLIENT_POOL_IDLE_TTL", "300"))
+
 # Порт для Flask (Render использует переменную PORT)
 FLASK_PORT = int(os.getenv("PORT", os.getenv("FLASK_PORT", "5000")))
 FLASK_HOST = os.getenv("FLASK_HOST", "0.0.0.0")
@@ -0,0 +1,177 @@
+"""
+Шина событий для Server-Sent Events (/api/events)
+"""
+import json
+import queue
+import asyncio
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+from log_pipeline import get_logger
+
+logger = get_logger("API.EVENTS")
+
+
+class AsyncSubscriber:
+    """
+    Подписчик в event loop (ASGI поток /api/events): события доставляются в asyncio.Queue его loop,
+    поток не ждет их в блокирующем вызове
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_queue_size: int):
+        self._loop = loop
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+
+    def put_nowait(self, item: Tuple[str, dict]):
+        """
+        Передает событие в loop подписчика (вызывается из любого потока)
+        """
+        try:
+            self._loop.call_soon_threadsafe(self._put, item)
+        except RuntimeError:
+            # Loop подписчика уже закрыт - соединение все равно не отдаст событие
+            pass
+
+    def _put(self, item: Tuple[str, dict]):
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            logger.warning(f"Очередь подписчика переполнена, событие {item[0]} пропущено")
+
+    async def get(self) -> Tuple[str, dict]:
+        """
+        Ждет следующее событие (event, data)
+        """
+        return await self._queue.get()
+
+
+class EventBus:
+    """
+    Класс для рассылки событий авторизации и бота подписчикам SSE
+    Подписчики сгруппированы по session_id: событие пользователя получают только его вкладки
+    Публикация потокобезопасна и не блокирует: можно вызывать из общего event loop
+    """
+
+    def __init__(self, max_queue_size: int = 100):
+        # Очереди подписчиков по пользователям: {session_id: {queue}}
+        # (по одной очереди на открытое SSE-соединение)
+        self._subscribers: Dict[str, Set[Union[queue.Queue, AsyncSubscriber]]] = {}
+        self._lock = threading.Lock()
+        self._max_queue_size = max_queue_size
+        # Слушатели всех событий: callback(event, data, session_id) (например, пересылка в веб-воркеры)
+        self._listeners: List[Callable[[str, dict, Optional[str]], None]] = []
+
+    def subscribe(self, session_id: str) -> queue.Queue:
+        """
+        Создает очередь для нового подписчика
+
+        Args:
+            session_id: ID пользователя, чьи события нужны подписчику
+
+        Returns:
+            queue.Queue: Очередь событий (event, data)
+        """
+        subscriber = queue.Queue(maxsize=self._max_queue_size)
+        with self._lock:
+            self._subscribers.setdefault(session_id, set()).add(subscriber)
+        return subscriber
+
+    def subscribe_async(self, session_id: str) -> AsyncSubscriber:
+        """
+        Создает подписчика для корутины в текущем event loop
+
+        Args:
+            session_id: ID пользователя, чьи события нужны подписчику
+
+        Returns:
+            AsyncSubscriber: Подписчик, события ждутся через await subscriber.get()
+        """
+        subscriber = AsyncSubscriber(asyncio.get_running_loop(), self._max_queue_size)
+        with self._lock:
+            self._subscribers.setdefault(session_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, session_id: str, subscriber: Union[queue.Queue, AsyncSubscriber]):
+        """
+        Удаляет подписчика
+
+        Args:
+            session_id: ID пользователя, переданный в subscribe() или subscribe_async()
+            subscriber: Подписчик, полученный из subscribe() или subscribe_async()
+        """
+        with self._lock:
+            subscribers = self._subscribers.get(session_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[session_id]
+
+    def add_listener(self, callback: Callable[[str, dict, Optional[str]], None]):
+        """
+        Добавляет слушателя всех событий; вызывается в потоке публикации и не должен блокировать
+
+        Args:
+            callback: Функция callback(event, data, session_id)
+        """
+        with self._lock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[str, dict, Optional[str]], None]):
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def publish(self, event: str, data: Optional[dict] = None, session_id: Optional[str] = None):
+        """
+        Отправляет событие подписчикам пользователя
+
+        Args:
+            event: Тип события
+            data: Данные события (должны сериализоваться в JSON)
+            session_id: ID пользователя (None - всем подписчикам)
+        """
+        with self._lock:
+            if session_id is None:
+                subscribers = [s for group in self._subscribers.values() for s in group]
+            else:
+                subscribers = list(self._subscribers.get(session_id, ()))
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(event, data or {}, session_id)
+            except Exception as e:
+                logger.error(f"Ошибка в слушателе событий: {type(e).__name__}: {e}")
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait((event, data or {}))
+            except queue.Full:
+                # Медленный клиент - пропускаем событие, у браузера есть polling
+                logger.warning(f"Очередь подписчика переполнена, событие {event} пропущено")
+
+    def subscriber_count(self) -> int:
+        """
+        Возвращает число активных подписчиков
+
+        Returns:
+            int: Количество подписчиков
+        """
+        with self._lock:
+            return sum(len(group) for group in self._subscribers.values())
+
+
+def format_sse(event: str, data: dict) -> str:
+    """
+    Форматирует событие в формате text/event-stream
+
+    Args:
+        event: Тип события
+        data: Данные события
+
+    Returns:
+        str: Готовый фрагмент SSE
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# Глобальная шина событий
+event_bus = EventBus()
@@ -0,0 +1,135 @@
+"""
+Планировщик истечения сроков: куча дедлайнов и один фоновый поток
+"""
+import time
+import heapq
+import itertools
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+from log_pipeline import get_logger
+
+logger = get_logger("AUTH.EXPIRY")
+
+
+class ExpiryScheduler:
+    """
+    Класс для вызова callback(key) ровно в момент дедлайна ключа
+    Дедлайны хранятся в куче, поток спит до ближайшего из них, поэтому
+    обработка стоит O(log n) на истекший ключ, а не полный обход всех записей.
+    Перенос и отмена дедлайна ленивые: устаревшие элементы кучи пропускаются
+    """
+
+    def __init__(self, callback: Callable[[str], None], name: str = "expiry"):
+        # callback вызывается в потоке планировщика и не должен надолго блокировать
+        self._callback = callback
+        self._name = name
+        # Куча (deadline, seq, key) и актуальный дедлайн каждого ключа
+        self._heap: List[Tuple[float, int, str]] = []
+        self._deadlines: Dict[str, float] = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, key: str, deadline: float):
+        """
+        Назначает или переносит дедлайн ключа
+
+        Args:
+            key: Ключ записи
+            deadline: Время дедлайна (timestamp)
+        """
+        with self._cond:
+            if self._deadlines.get(key) == deadline:
+                return
+            self._deadlines[key] = deadline
+            heapq.heappush(self._heap, (deadline, next(self._seq), key))
+            self._compact()
+            self._ensure_thread()
+            self._cond.notify()
+
+    def cancel(self, key: str):
+        """
+        Отменяет дедлайн ключа (запись удалена раньше срока)
+
+        Args:
+            key: Ключ записи
+        """
+        with self._cond:
+            self._deadlines.pop(key, None)
+
+    def deadline(self, key: str) -> Optional[float]:
+        """
+        Возвращает назначенный дедлайн ключа
+
+        Args:
+            key: Ключ записи
+
+        Returns:
+            float или None: Дедлайн, если он назначен
+        """
+        with self._cond:
+            return self._deadlines.get(key)
+
+    def size(self) -> int:
+        """
+        Возвращает число ключей с назначенным дедлайном
+
+        Returns:
+            int: Количество ключей
+        """
+        with self._cond:
+            return len(self._deadlines)
+
+    def _is_stale(self, entry: Tuple[float, int, str]) -> bool:
+        """
+        Проверяет, что элемент кучи отменен или перенесен (вызывается под блокировкой)
+        """
+        return self._deadlines.get(entry[2]) != entry[0]
+
+    def _compact(self):
+        """
+        Перестраивает кучу, если устаревших элементов стало больше актуальных
+        (вызывается под блокировкой)
+        """
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [entry for entry in self._heap if not self._is_stale(entry)]
+            heapq.heapify(self._heap)
+
+    def _ensure_thread(self):
+        """
+        Запускает поток планировщика при первом дедлайне (вызывается под блокировкой)
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+            self._thread.start()
+
+    def _next_due(self) -> str:
+        """
+        Ждет ближайший дедлайн и возвращает его ключ (вызывается под блокировкой)
+        """
+        while True:
+            while self._heap and self._is_stale(self._heap[0]):
+                heapq.heappop(self._heap)
+            if not self._heap:
+                self._cond.wait()
+                continue
+            delay = self._heap[0][0] - time.time()
+            if delay <= 0:
+                _, _, key = heapq.heappop(self._heap)
+                del self._deadlines[key]
+                return key
+            # Просыпаемся к дедлайну или раньше, если назначен более ранний
+            self._cond.wait(delay)
+
+    def _run(self):
+        """
+        Основной цикл потока: вызывает callback для каждого наступившего дедлайна
+        """
+        logger.info(f"Планировщик {self._name} запущен")
+        while True:
+            with self._cond:
+                key = self._next_due()
+            try:
+                self._callback(key)
+            except Exception as e:
+                logger.error(f"Ошибка при обработке дедлайна {key}: {type(e).__name__}: {e}")
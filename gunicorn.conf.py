@@ -0,0 +1,22 @@
+"""
+Настройки gunicorn (файл подхватывается автоматически из рабочей директории)
+"""
+
+
+def on_starting(server):
+    """
+    Не дает запустить несколько воркеров без супервизора ботов
+
+    Клиент QR-кода и подписчики /api/events живут в памяти воркера, который их создал:
+    другой воркер не может принять пароль 2FA для этого QR-кода, а события qr_refreshed
+    и authorized до его вкладок не доходят. С супервизором (BOT_SUPERVISOR_SOCKET) все
+    клиенты живут в нем, и события рассылаются каждому воркеру
+    """
+    # Импорт внутри хука: имя config на уровне модуля gunicorn принял бы за свою настройку
+    import config
+    if server.cfg.workers > 1 and not config.BOT_SUPERVISOR_SOCKET:
+        raise RuntimeError(
+            f"--workers {server.cfg.workers} без BOT_SUPERVISOR_SOCKET: пароль 2FA и события /api/events "
+            "обслуживает только воркер, создавший QR-код. Запустите один воркер (WEB_CONCURRENCY=1) "
+            "или супервизор ботов (bot_supervisor.py)"
+        )
@@ -0,0 +1,152 @@
+"""
+Логирование через очередь: запросы только кладут записи в очередь, вывод делает фоновый поток
+"""
+import sys
+import atexit
+import queue
+import random
+import logging
+import threading
+import contextvars
+from logging.handlers import QueueHandler, QueueListener
+import config
+
+# Логгеры подсистем; вложенные логгеры (AUTH.POOL, SESSION.STORE, ...) наследуют их уровень
+SUBSYSTEMS = ("APP", "API", "AUTH", "BOT", "SESSION", "RUNTIME")
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+# Попал ли текущий запрос опроса в выборку (устанавливается в начале запроса)
+_poll_sampled: contextvars.ContextVar[bool] = contextvars.ContextVar("poll_sampled", default=True)
+
+
+def parse_levels(spec: str) -> dict:
+    """
+    Разбирает переопределения уровней вида "AUTH=DEBUG,API.POLL=WARNING"
+
+    Args:
+        spec: Строка из LOG_LEVELS
+
+    Returns:
+        dict: {имя логгера: уровень}
+    """
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler, который не блокирует поток при переполненной очереди,
+    а отбрасывает запись и считает отброшенные
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class PollSamplingFilter(logging.Filter):
+    """
+    Пропускает записи опроса статуса только для запросов, попавших в выборку
+    Предупреждения и ошибки проходят всегда
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or _poll_sampled.get()
+
+
+class LogPipeline:
+    """
+    Класс для настройки логирования процесса: все логгеры пишут в ограниченную очередь,
+    фоновый поток QueueListener забирает записи, форматирует и выводит в stdout
+    """
+
+    def __init__(self, level: str, overrides: dict, sample_rate: float, queue_size: int):
+        self.level = level
+        self.overrides = overrides
+        self.sample_rate = sample_rate
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.handler = DroppingQueueHandler(self._queue)
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Подключает очередь к корневому логгеру и запускает поток вывода (повторный вызов ничего не делает)
+        """
+        with self._lock:
+            if self._listener is not None:
+                return
+            output = logging.StreamHandler(sys.stdout)
+            output.setFormatter(logging.Formatter(LOG_FORMAT))
+            self._listener = QueueListener(self._queue, output, respect_handler_level=True)
+            self._listener.start()
+
+            root = logging.getLogger()
+            root.addHandler(self.handler)
+            # Сторонние библиотеки (telethon) пишут только предупреждения и ошибки, если не указано иное
+            root.setLevel(logging.WARNING)
+            for name in SUBSYSTEMS:
+                logging.getLogger(name).setLevel(self.level)
+            for name, level in self.overrides.items():
+                logging.getLogger(name).setLevel(level)
+            logging.getLogger("API.POLL").addFilter(PollSamplingFilter())
+
+    def stop(self):
+        """
+        Выводит оставшиеся в очереди записи и останавливает поток вывода
+        """
+        with self._lock:
+            if self._listener is None:
+                return
+            self._listener.stop()
+            self._listener = None
+
+    def sample_poll_request(self) -> bool:
+        """
+        Решает, пишется ли в лог текущий запрос опроса статуса (вызывается в начале запроса)
+
+        Returns:
+            bool: True если запрос попал в выборку
+        """
+        sampled = random.random() < self.sample_rate
+        _poll_sampled.set(sampled)
+        return sampled
+
+    @property
+    def dropped(self) -> int:
+        """
+        Сколько записей отброшено из-за переполненной очереди
+        """
+        return self.handler.dropped
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Возвращает логгер подсистемы (AUTH, API, BOT, SESSION, ...) или ее части (AUTH.POOL)
+
+    Args:
+        name: Имя логгера
+
+    Returns:
+        logging.Logger: Логгер
+    """
+    return logging.getLogger(name)
+
+
+# Глобальный конвейер логирования (запускается при первом импорте)
+log_pipeline = LogPipeline(
+    config.LOG_LEVEL, parse_levels(config.LOG_LEVELS), config.LOG_POLL_SAMPLE_RATE, config.LOG_QUEUE_SIZE
+)
+log_pipeline.start()
+# При завершении процесса выводим записи, оставшиеся в очереди
+atexit.register(log_pipeline.stop)
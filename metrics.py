@@ -0,0 +1,243 @@
+"""
+Метрики в текстовом формате Prometheus (для /metrics) без внешних зависимостей
+"""
+import math
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from log_pipeline import get_logger
+
+logger = get_logger("APP.METRICS")
+
+# Границы корзин гистограмм по умолчанию (секунды): от 5 мс до 30 с
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Sequence[str], extra: str = "") -> str:
+    """
+    Форматирует метки метрики: {name="value",...}
+    """
+    parts = []
+    for name, value in zip(labelnames, labelvalues):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{name}="{value}"')
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """
+    Базовый класс метрики с метками
+    """
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}, получено {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def collect(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.collect())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """
+    Счетчик, который только растет
+    """
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in values]
+
+
+class Histogram(_Metric):
+    """
+    Гистограмма длительностей с накопительными корзинами
+    """
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # {метки: ([счетчики по корзинам], сумма, количество)}
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Измеряет длительность блока with и записывает ее в гистограмму
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _bucket_line(self, key: Tuple[str, ...], bound: float, cumulative: int) -> str:
+        le = 'le="' + _format_value(bound) + '"'
+        return f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+        lines = []
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(self._bucket_line(key, bound, cumulative))
+            # Последняя корзина +Inf содержит все наблюдения
+            lines.append(self._bucket_line(key, math.inf, count))
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    Текущее значение, которое вычисляется функцией в момент запроса /metrics
+    Функция возвращает число или {кортеж значений меток: число}
+    """
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, func: Callable, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.func = func
+
+    def collect(self) -> List[str]:
+        try:
+            value = self.func()
+        except Exception as e:
+            logger.error(f"Ошибка при вычислении {self.name}: {e}")
+            return []
+        if isinstance(value, dict):
+            return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}"
+                    for key, v in value.items()]
+        return [f"{self.name} {_format_value(value)}"]
+
+
+class MetricsRegistry:
+    """
+    Класс для хранения всех метрик процесса и вывода их в формате Prometheus
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, func: Callable, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, func, labelnames))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return list(self._metrics)
+
+    def render(self, exclude: Sequence[str] = ()) -> str:
+        """
+        Возвращает все метрики в текстовом формате Prometheus 0.0.4
+
+        Args:
+            exclude: Имена метрик, которые не нужно выводить (их уже выводит другой процесс)
+
+        Returns:
+            str: Текст для ответа /metrics
+        """
+        with self._lock:
+            metrics = [metric for name, metric in self._metrics.items() if name not in exclude]
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+# Глобальный реестр метрик
+registry = MetricsRegistry()
+
+# Метрики, которые пишутся из разных модулей
+HTTP_REQUESTS = registry.counter(
+    "http_requests_total", "HTTP запросы по маршруту, методу и статусу", ("route", "method", "status"))
+HTTP_REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "Длительность HTTP запросов", ("route", "method"))
+QR_GENERATE_PHASE = registry.histogram(
+    "qr_generate_phase_seconds", "Длительность фаз генерации QR-кода: connect, qr_login, render, encode", ("phase",))
+SESSION_CHECKS = registry.counter(
+    "session_checks_total", "Проверки валидности сессии по результату: cached, valid, invalid, error", ("outcome",))
+ECHO_REPLY_DURATION = registry.histogram(
+    "echo_reply_seconds", "Длительность отправки эхо-ответа бота")
+REPLY_QUEUE_WAIT = registry.histogram(
+    "reply_queue_wait_seconds", "Сколько ответ бота ждал в очереди отправки (лимиты и FloodWait)",
+    buckets=(0.01, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+REPLY_FLOOD_WAITS = registry.counter(
+    "reply_flood_waits_total", "FloodWaitError при отправке ответов бота (очередь ставится на паузу)")
+UPDATE_QUEUE_WAIT = registry.histogram(
+    "update_queue_wait_seconds", "Сколько входящее обновление бота ждало воркера")
+UPDATES_DROPPED = registry.counter(
+    "updates_dropped_total", "Входящие обновления ботов, отброшенные: queue_full, chat_full, stopped",
+    ("reason",))
+REPLY_DROPPED = registry.counter(
+    "reply_dropped_total", "Неотправленные ответы бота по причине: queue_full, expired, error, stopped", ("reason",))
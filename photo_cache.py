@@ -0,0 +1,283 @@
+"""
+Кеш фото профиля по photo_id Telegram: в памяти с выгрузкой на диск
+"""
+import os
+import uuid
+import asyncio
+import threading
+from io import BytesIO
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+from PIL import Image
+import config
+from log_pipeline import get_logger
+
+logger = get_logger("SESSION.PHOTO")
+
+# Варианты фото, которые отдает Telegram: small - 160x160, big - 640x640
+PHOTO_VARIANTS = ("small", "big")
+DEFAULT_PHOTO_SIZE = "big"
+# Размер варианта small в пикселях (больший размер уменьшается из big)
+SMALL_PHOTO_PX = 160
+# Границы размера для уменьшения на сервере (?size=<пиксели>)
+MIN_PHOTO_PX = 16
+MAX_PHOTO_PX = 640
+
+
+def parse_photo_size(size: Optional[str]) -> str:
+    """
+    Проверяет параметр size: small, big или число пикселей
+
+    Args:
+        size: Значение параметра (None - размер по умолчанию)
+
+    Returns:
+        str: Нормализованный размер
+
+    Raises:
+        ValueError: Недопустимый размер
+    """
+    if not size:
+        return DEFAULT_PHOTO_SIZE
+    if size in PHOTO_VARIANTS:
+        return size
+    if size.isdigit() and MIN_PHOTO_PX <= int(size) <= MAX_PHOTO_PX:
+        return str(int(size))
+    raise ValueError(f"Недопустимый размер фото: {size}")
+
+
+def source_variant(size: str) -> str:
+    """
+    Возвращает вариант Telegram, из которого получается фото нужного размера
+
+    Args:
+        size: Нормализованный размер
+
+    Returns:
+        str: small или big
+    """
+    if size in PHOTO_VARIANTS:
+        return size
+    return "small" if int(size) <= SMALL_PHOTO_PX else "big"
+
+
+def downscale_photo(data: bytes, size: str) -> bytes:
+    """
+    Уменьшает фото до квадрата size x size пикселей
+
+    Args:
+        data: JPEG исходного варианта
+        size: Размер в пикселях
+
+    Returns:
+        bytes: JPEG нужного размера
+    """
+    px = int(size)
+    image = Image.open(BytesIO(data))
+    if image.width <= px and image.height <= px:
+        return data
+    image = image.convert("RGB").resize((px, px), Image.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=85, optimize=True)
+    return buffer.getvalue()
+
+
+class PhotoCache:
+    """
+    Класс для хранения фото профиля по ключу (photo_id, размер)
+    Фото неизменяемо для своего photo_id, поэтому запись никогда не устаревает.
+    В памяти держится не больше max_bytes; вытесненные фото выгружаются на диск
+    и при следующем запросе читаются оттуда без обращения к Telegram.
+    На диске держится не больше max_disk_bytes: давно не читавшиеся файлы удаляются
+    """
+
+    def __init__(self, max_bytes: int, spill_dir: Path, max_disk_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.spill_dir = Path(spill_dir)
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        # {ключ: JPEG} от давно использованных к недавно использованным
+        self._photos: "OrderedDict[str, bytes]" = OrderedDict()
+        self._total_bytes = 0
+        # Файлы на диске: {ключ: размер} от давно использованных к недавно использованным
+        self._spilled: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._load_spilled()
+
+    @staticmethod
+    def _key(photo_id: int, size: str) -> str:
+        return f"{photo_id}_{size}"
+
+    def _spill_path(self, key: str) -> Path:
+        return self.spill_dir / f"{key}.jpg"
+
+    def _load_spilled(self):
+        """
+        Восстанавливает порядок файлов на диске после перезапуска (по времени изменения)
+        """
+        files = []
+        for path in self.spill_dir.glob("*.jpg"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, path.stem, stat.st_size))
+        for _, key, size in sorted(files):
+            self._spilled[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def get(self, photo_id: int, size: str) -> Optional[bytes]:
+        """
+        Возвращает фото из памяти или с диска (блокирующее чтение - не для event loop)
+
+        Args:
+            photo_id: ID фото в Telegram
+            size: Нормализованный размер
+
+        Returns:
+            bytes или None: JPEG, если фото есть в кеше
+        """
+        key = self._key(photo_id, size)
+        data = self._get_memory(key)
+        if data is not None:
+            return data
+        return self._read_spilled(key)
+
+    async def get_async(self, photo_id: int, size: str) -> Optional[bytes]:
+        """
+        То же, что get(), для вызова из event loop: файл с диска читается в пуле потоков
+        """
+        key = self._key(photo_id, size)
+        data = self._get_memory(key)
+        if data is not None:
+            return data
+        with self._lock:
+            if key not in self._spilled:
+                return None
+        return await asyncio.get_running_loop().run_in_executor(None, self._read_spilled, key)
+
+    def _get_memory(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._photos.get(key)
+            if data is not None:
+                self._photos.move_to_end(key)
+            return data
+
+    def _read_spilled(self, key: str) -> Optional[bytes]:
+        """
+        Читает фото с диска и возвращает его в память
+        """
+        with self._lock:
+            if key not in self._spilled:
+                return None
+        try:
+            data = self._spill_path(key).read_bytes()
+        except OSError as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.error(f"Ошибка при чтении {key} с диска: {e}")
+            # Файл удален (например, другим воркером) - забываем о нем
+            with self._lock:
+                size = self._spilled.pop(key, None)
+                if size is not None:
+                    self._disk_bytes -= size
+            return None
+        with self._lock:
+            if key in self._spilled:
+                self._spilled.move_to_end(key)
+        # Фото снова используется - возвращаем его в память
+        self._put_memory(key, data)
+        return data
+
+    def put(self, photo_id: int, size: str, data: bytes):
+        """
+        Сохраняет фото в кеш
+
+        Args:
+            photo_id: ID фото в Telegram
+            size: Нормализованный размер
+            data: JPEG
+        """
+        self._put_memory(self._key(photo_id, size), data)
+
+    def remove(self, photo_id: int):
+        """
+        Удаляет все размеры фото из памяти и с диска (пользователь вышел)
+
+        Args:
+            photo_id: ID фото в Telegram
+        """
+        prefix = f"{photo_id}_"
+        with self._lock:
+            for key in [key for key in self._photos if key.startswith(prefix)]:
+                self._total_bytes -= len(self._photos.pop(key))
+            removed = [key for key in self._spilled if key.startswith(prefix)]
+            for key in removed:
+                self._disk_bytes -= self._spilled.pop(key)
+        for key in removed:
+            self._spill_path(key).unlink(missing_ok=True)
+
+    def _put_memory(self, key: str, data: bytes):
+        """
+        Кладет фото в память и выгружает на диск вытесненные
+        """
+        spilled = []
+        with self._lock:
+            old = self._photos.pop(key, None)
+            if old is not None:
+                self._total_bytes -= len(old)
+            self._photos[key] = data
+            self._total_bytes += len(data)
+            while self._total_bytes > self.max_bytes and len(self._photos) > 1:
+                evicted_key, evicted = self._photos.popitem(last=False)
+                self._total_bytes -= len(evicted)
+                spilled.append((evicted_key, evicted))
+        for evicted_key, evicted in spilled:
+            self._spill(evicted_key, evicted)
+        if spilled:
+            self._evict_disk()
+
+    def _spill(self, key: str, data: bytes):
+        """
+        Атомарно записывает фото на диск (если его там еще нет)
+        """
+        with self._lock:
+            if key in self._spilled:
+                self._spilled.move_to_end(key)
+                return
+        path = self._spill_path(key)
+        tmp_path = path.with_name(f".{key}.{uuid.uuid4().hex}.tmp")
+        try:
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Ошибка при выгрузке {key} на диск: {e}")
+            tmp_path.unlink(missing_ok=True)
+            return
+        with self._lock:
+            self._disk_bytes += len(data) - self._spilled.pop(key, 0)
+            self._spilled[key] = len(data)
+
+    def _evict_disk(self):
+        """
+        Удаляет с диска давно не читавшиеся фото сверх max_disk_bytes
+        """
+        evicted = []
+        with self._lock:
+            while self._disk_bytes > self.max_disk_bytes and self._spilled:
+                key, size = self._spilled.popitem(last=False)
+                self._disk_bytes -= size
+                evicted.append(key)
+        for key in evicted:
+            try:
+                self._spill_path(key).unlink(missing_ok=True)
+            except OSError as e:
+                logger.error(f"Ошибка при удалении {key} с диска: {e}")
+
+
+# Глобальный кеш фото профиля
+photo_cache = PhotoCache(
+    config.PHOTO_CACHE_SIZE_MB * 1024 * 1024, config.PHOTO_CACHE_DIR, config.PHOTO_CACHE_DISK_MB * 1024 * 1024
+)
@@ -0,0 +1,125 @@
+"""
+Кеш профилей авторизованных пользователей: заполняется при входе и обновляется событиями Telegram
+"""
+import threading
+from typing import Dict, Optional, Tuple
+from telethon.tl.types import UserProfilePhoto, UpdateUserName, UpdateUserPhone
+from shared_state import SharedState, shared_state
+
+
+def user_to_profile(user) -> Dict:
+    """
+    Собирает запись профиля из объекта User от Telethon
+
+    Args:
+        user: Объект User
+
+    Returns:
+        Dict: {"user_data": {...}, "photo": [photo_id, dc_id] или None}
+    """
+    photo = getattr(user, "photo", None)
+    return {
+        "user_data": {
+            "id": user.id,
+            "first_name": user.first_name,
+            "last_name": user.last_name or "",
+            "username": user.username or "",
+            "phone": user.phone or "",
+        },
+        "photo": [photo.photo_id, photo.dc_id] if isinstance(photo, UserProfilePhoto) else None,
+    }
+
+
+class ProfileCache:
+    """
+    Класс для хранения профилей пользователей по session_id
+    Профиль получается один раз (из результата входа или одним get_me), дальше
+    меняется только событиями UpdateUserName / UpdateUserPhone / UpdateUser от бота.
+    Профили лежат в общем состоянии воркеров (shared_state), поэтому переживают
+    перезапуск и изменение, полученное ботом одного воркера, сразу видно остальным
+    """
+
+    def __init__(self, state: SharedState):
+        self._state = state
+        # Чтение-изменение-запись профиля в apply_update
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        """
+        Возвращает данные пользователя (id, имя, username, телефон)
+
+        Args:
+            session_id: ID пользователя
+
+        Returns:
+            Dict или None: Копия данных пользователя
+        """
+        profile = self._state.get_profile(session_id)
+        return dict(profile["user_data"]) if profile else None
+
+    def get_photo_ref(self, session_id: str) -> Optional[Tuple[int, int]]:
+        """
+        Возвращает текущее фото профиля
+
+        Args:
+            session_id: ID пользователя
+
+        Returns:
+            tuple или None: (photo_id, dc_id) или None, если фото нет или профиль неизвестен
+        """
+        profile = self._state.get_profile(session_id)
+        if not profile or not profile.get("photo"):
+            return None
+        photo_id, dc_id = profile["photo"]
+        return photo_id, dc_id
+
+    def set_user(self, session_id: str, user):
+        """
+        Заполняет профиль из объекта User (при входе или после события UpdateUser)
+
+        Args:
+            session_id: ID пользователя
+            user: Объект User от Telethon
+        """
+        self._state.put_profile(session_id, user_to_profile(user))
+
+    def apply_update(self, session_id: str, update) -> bool:
+        """
+        Применяет событие изменения имени или телефона к профилю
+
+        Args:
+            session_id: ID пользователя
+            update: UpdateUserName или UpdateUserPhone
+
+        Returns:
+            bool: True если профиль изменился
+        """
+        with self._lock:
+            profile = self._state.get_profile(session_id)
+            if not profile or profile["user_data"]["id"] != getattr(update, "user_id", None):
+                return False
+            user_data = profile["user_data"]
+            if isinstance(update, UpdateUserName):
+                user_data["first_name"] = update.first_name
+                user_data["last_name"] = update.last_name or ""
+                active = [u.username for u in update.usernames or [] if getattr(u, "active", True)]
+                user_data["username"] = active[0] if active else ""
+            elif isinstance(update, UpdateUserPhone):
+                user_data["phone"] = update.phone or ""
+            else:
+                return False
+            self._state.put_profile(session_id, profile)
+            return True
+
+    def remove(self, session_id: str):
+        """
+        Удаляет профиль пользователя (выход или отзыв сессии)
+
+        Args:
+            session_id: ID пользователя
+        """
+        self._state.delete_profile(session_id)
+
+
+# Глобальный кеш профилей (для SESSION_STORE=memory профили тоже только в памяти)
+profile_cache = ProfileCache(shared_state)
@@ -0,0 +1,105 @@
+"""
+Хранилище изображений QR-кодов в памяти (вместо файлов в static/qr/)
+"""
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional, NamedTuple
+import config
+from log_pipeline import get_logger
+
+logger = get_logger("AUTH.QR_STORE")
+
+
+class QRImage(NamedTuple):
+    """
+    Изображение QR-кода для одной версии токена
+    """
+    data: bytes
+    mimetype: str
+    version: int
+    expires_at: float
+
+
+class QRImageStore:
+    """
+    Класс для хранения готовых изображений QR-кодов по qr_id
+    Размер ограничен: при переполнении вытесняется самое давно обновленное изображение.
+    Изображение удаляется вместе с QR-записью или само, когда истекает его токен
+    """
+
+    def __init__(self, max_items: int):
+        # Не больше max_items изображений, порядок - от самого старого обновления
+        self.max_items = max_items
+        self._images: "OrderedDict[str, QRImage]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, qr_id: str, data: bytes, mimetype: str, version: int, expires_at: float):
+        """
+        Сохраняет изображение QR-кода (новая версия заменяет предыдущую)
+
+        Args:
+            qr_id: ID QR-кода
+            data: Содержимое изображения
+            mimetype: MIME тип изображения
+            version: Версия токена
+            expires_at: Время истечения токена (timestamp)
+        """
+        with self._lock:
+            self._images.pop(qr_id, None)
+            self._images[qr_id] = QRImage(data, mimetype, version, expires_at)
+            self._evict_expired(time.time())
+            while len(self._images) > self.max_items:
+                evicted_id, _ = self._images.popitem(last=False)
+                logger.warning(f"Хранилище переполнено, вытеснено изображение {evicted_id}")
+
+    def get(self, qr_id: str) -> Optional[QRImage]:
+        """
+        Возвращает изображение QR-кода, если его токен еще не истек
+
+        Args:
+            qr_id: ID QR-кода
+
+        Returns:
+            QRImage или None
+        """
+        with self._lock:
+            image = self._images.get(qr_id)
+            if image is None:
+                return None
+            if image.expires_at <= time.time():
+                del self._images[qr_id]
+                return None
+            return image
+
+    def remove(self, qr_id: str):
+        """
+        Удаляет изображение QR-кода
+
+        Args:
+            qr_id: ID QR-кода
+        """
+        with self._lock:
+            self._images.pop(qr_id, None)
+
+    def size(self) -> int:
+        """
+        Возвращает число изображений в хранилище
+
+        Returns:
+            int: Количество изображений
+        """
+        with self._lock:
+            return len(self._images)
+
+    def _evict_expired(self, now: float):
+        """
+        Удаляет изображения с истекшими токенами (вызывается под блокировкой)
+        """
+        expired = [qr_id for qr_id, image in self._images.items() if image.expires_at <= now]
+        for qr_id in expired:
+            del self._images[qr_id]
+
+
+# Глобальное хранилище изображений QR-кодов
+qr_image_store = QRImageStore(config.QR_IMAGE_STORE_SIZE)
@@ -0,0 +1,151 @@
+"""
+Реестр активных QR-кодов с ограничением числа ожидающих QR-логинов
+"""
+import math
+import time
+import threading
+from collections import OrderedDict
+from typing import Iterator, List, Optional, Tuple
+
+# Статусы, при которых у QR-кода открыто соединение с Telegram и он ждет пользователя
+WAITING_STATUSES = ("pending", "needs_password")
+
+
+class QRCapacityError(Exception):
+    """
+    Превышен лимит одновременно ожидающих QR-логинов
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Too many pending QR logins, retry after {retry_after}s")
+        # Через сколько секунд имеет смысл повторить запрос
+        self.retry_after = retry_after
+
+
+class QRRegistry:
+    """
+    Класс для хранения записей QR-кодов по qr_id в порядке последнего опроса
+    Число ожидающих QR-логинов ограничено max_pending: новый QR вытесняет
+    давно не опрашиваемый, а если таких нет - получает QRCapacityError
+    """
+
+    def __init__(self, max_pending: int, idle_timeout: float):
+        self.max_pending = max_pending
+        # Через сколько секунд без опросов QR-код считается брошенным и может быть вытеснен
+        self.idle_timeout = idle_timeout
+        # Записи от давно опрошенных к недавно опрошенным
+        self._records: "OrderedDict[str, dict]" = OrderedDict()
+        # QR-коды, которые сейчас создаются (место под них уже занято)
+        self._reserved = 0
+        self._lock = threading.Lock()
+
+    def get(self, qr_id: str) -> Optional[dict]:
+        with self._lock:
+            return self._records.get(qr_id)
+
+    def __getitem__(self, qr_id: str) -> dict:
+        with self._lock:
+            return self._records[qr_id]
+
+    def __setitem__(self, qr_id: str, qr_data: dict):
+        with self._lock:
+            qr_data.setdefault("last_polled_at", time.time())
+            self._records[qr_id] = qr_data
+            self._records.move_to_end(qr_id)
+
+    def __contains__(self, qr_id: str) -> bool:
+        with self._lock:
+            return qr_id in self._records
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._records)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def pop(self, qr_id: str, default=None) -> Optional[dict]:
+        with self._lock:
+            return self._records.pop(qr_id, default)
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._records.keys())
+
+    def values(self) -> List[dict]:
+        with self._lock:
+            return list(self._records.values())
+
+    def items(self) -> List[Tuple[str, dict]]:
+        """
+        Возвращает копию записей (можно удалять записи во время обхода)
+        """
+        with self._lock:
+            return list(self._records.items())
+
+    def touch(self, qr_id: str):
+        """
+        Отмечает опрос QR-кода браузером
+
+        Args:
+            qr_id: ID QR-кода
+        """
+        with self._lock:
+            qr_data = self._records.get(qr_id)
+            if qr_data is not None:
+                qr_data["last_polled_at"] = time.time()
+                self._records.move_to_end(qr_id)
+
+    def waiting_count(self) -> int:
+        """
+        Возвращает число QR-логинов, ожидающих пользователя (включая создаваемые)
+
+        Returns:
+            int: Количество ожидающих QR-логинов
+        """
+        with self._lock:
+            return self._waiting_count()
+
+    def reserve(self) -> List[Tuple[str, dict]]:
+        """
+        Занимает место под новый QR-код. Если лимит достигнут, вытесняет из реестра
+        самый давно опрошенный брошенный QR-код (его нужно отключить вызывающему)
+
+        Returns:
+            List[Tuple[str, dict]]: Вытесненные записи (qr_id, qr_data)
+
+        Raises:
+            QRCapacityError: Лимит достигнут и вытеснять некого
+        """
+        now = time.time()
+        evicted = []
+        with self._lock:
+            if self._waiting_count() >= self.max_pending:
+                # Записи упорядочены по последнему опросу - первая ожидающая самая давняя
+                lru_id, lru_data = next(
+                    ((qr_id, qr_data) for qr_id, qr_data in self._records.items()
+                     if qr_data.get("status") == "pending"),
+                    (None, None),
+                )
+                idle_for = now - lru_data["last_polled_at"] if lru_data else 0
+                if lru_data is None or idle_for < self.idle_timeout:
+                    retry_after = self.idle_timeout - idle_for if lru_data else self.idle_timeout
+                    raise QRCapacityError(max(1, math.ceil(retry_after)))
+                del self._records[lru_id]
+                evicted.append((lru_id, lru_data))
+            self._reserved += 1
+        return evicted
+
+    def release(self):
+        """
+        Освобождает место, занятое reserve() (после регистрации QR-кода или ошибки)
+        """
+        with self._lock:
+            self._reserved = max(0, self._reserved - 1)
+
+    def _waiting_count(self) -> int:
+        """
+        Считает ожидающие QR-логины (вызывается под блокировкой)
+        """
+        waiting = sum(1 for qr_data in self._records.values() if qr_data.get("status") in WAITING_STATUSES)
+        return waiting + self._reserved
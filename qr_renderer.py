@@ -0,0 +1,253 @@
+"""
+Быстрая отрисовка QR-кодов с логотипом Telegram
+"""
+import io
+import base64
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional, Tuple
+import qrcode
+from PIL import Image, ImageDraw
+import config
+
+# Параметры отрисовки (совпадают с прежним путем через qrcode.make_image)
+BOX_SIZE = 10
+BORDER = 4
+ERROR_CORRECTION = qrcode.constants.ERROR_CORRECT_L
+
+# Логотип по центру QR-кода: ~15% ширины плюс белый круг с отступом 5px
+LOGO_PATH = Path(config.BASE_DIR) / 'static' / 'img' / 'tg_icon.png'
+LOGO_SCALE = 0.15
+LOGO_PADDING = 10
+
+# Форматы ответа /api/generate_qr:
+# png - RGB PNG с логотипом, png1 - 1-битный PNG с палитрой без логотипа,
+# svg - SVG с путем на каждую строку модулей, matrix - матрица модулей и URL для отрисовки в браузере
+QR_FORMATS = ("png", "png1", "svg", "matrix")
+DEFAULT_QR_FORMAT = "png"
+
+# Подобранная версия QR по длине данных: URL логина всегда одной длины,
+# поэтому подбор версии (best_fit) выполняется один раз
+_version_by_length: dict = {}
+
+
+def qr_matrix(data: str) -> List[List[bool]]:
+    """
+    Строит матрицу модулей QR-кода вместе с рамкой
+
+    Args:
+        data: Данные для кодирования
+
+    Returns:
+        List[List[bool]]: Матрица модулей (True - черный модуль)
+    """
+    version = _version_by_length.get(len(data))
+    qr = qrcode.QRCode(version=version, error_correction=ERROR_CORRECTION, border=BORDER)
+    qr.add_data(data)
+    qr.make(fit=version is None)
+    _version_by_length.setdefault(len(data), qr.version)
+    return qr.get_matrix()
+
+
+def _matrix_to_image(matrix: List[List[bool]], box_size: int) -> Image.Image:
+    """
+    Растеризует матрицу модулей: 1 пиксель на модуль и масштабирование без сглаживания
+    """
+    size = len(matrix)
+    raw = bytes(0 if module else 255 for row in matrix for module in row)
+    image = Image.frombytes('L', (size, size), raw)
+    return image.resize((size * box_size, size * box_size), Image.Resampling.NEAREST)
+
+
+@lru_cache(maxsize=1)
+def _load_logo() -> Optional[Image.Image]:
+    """
+    Загружает логотип с диска один раз за время работы процесса
+    """
+    if not LOGO_PATH.exists():
+        return None
+    with Image.open(str(LOGO_PATH)) as logo:
+        return logo.convert('RGBA')
+
+
+@lru_cache(maxsize=16)
+def _logo_badge(image_size: int) -> Optional[Tuple[Image.Image, Image.Image, int]]:
+    """
+    Готовит белый круг с логотипом и маску круга для QR-кода заданного размера
+    Кешируется по размеру изображения (то есть по версии QR и box_size)
+
+    Args:
+        image_size: Ширина QR-кода в пикселях
+
+    Returns:
+        tuple или None: (badge RGB, маска L, радиус круга)
+    """
+    logo = _load_logo()
+    if logo is None:
+        return None
+
+    logo_size = int(image_size * LOGO_SCALE)
+    radius = (logo_size + LOGO_PADDING) // 2
+    diameter = radius * 2 + 1
+
+    # Маска белой круглой зоны (тот же эллипс, что рисовался поверх QR раньше)
+    mask = Image.new('L', (diameter, diameter), 0)
+    ImageDraw.Draw(mask).ellipse([0, 0, radius * 2, radius * 2], fill=255)
+
+    # Белый круг с логотипом по центру, с сохранением прозрачности логотипа
+    badge = Image.new('RGB', (diameter, diameter), 'white')
+    scaled_logo = logo.resize((logo_size, logo_size), Image.Resampling.LANCZOS)
+    offset = radius - logo_size // 2
+    badge.paste(scaled_logo, (offset, offset), scaled_logo)
+
+    return badge, mask, radius
+
+
+def render_qr_image(data: str, box_size: int = BOX_SIZE) -> Image.Image:
+    """
+    Рисует QR-код с логотипом Telegram в центре
+
+    Args:
+        data: Данные для кодирования (tg://login?token=...)
+        box_size: Размер модуля в пикселях
+
+    Returns:
+        Image.Image: RGB изображение QR-кода
+    """
+    image = _matrix_to_image(qr_matrix(data), box_size).convert('RGB')
+
+    badge = _logo_badge(image.width)
+    if badge is not None:
+        badge_image, mask, radius = badge
+        center = image.width // 2
+        image.paste(badge_image, (center - radius, center - radius), mask)
+
+    return image
+
+
+def encode_png(image: Image.Image) -> bytes:
+    """
+    Кодирует изображение в PNG
+
+    Args:
+        image: Изображение
+
+    Returns:
+        bytes: Содержимое PNG
+    """
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def render_qr_png1(data: str, box_size: int = BOX_SIZE) -> bytes:
+    """
+    Рисует QR-код без логотипа как PNG с палитрой из двух цветов (1 бит на пиксель)
+
+    Args:
+        data: Данные для кодирования
+        box_size: Размер модуля в пикселях
+
+    Returns:
+        bytes: Содержимое PNG
+    """
+    matrix = qr_matrix(data)
+    size = len(matrix)
+    # Индекс 0 - белый, 1 - черный
+    raw = bytes(1 if module else 0 for row in matrix for module in row)
+    image = Image.frombytes('P', (size, size), raw)
+    image.putpalette([255, 255, 255, 0, 0, 0])
+    image = image.resize((size * box_size, size * box_size), Image.Resampling.NEAREST)
+    return encode_png(image)
+
+
+@lru_cache(maxsize=1)
+def _logo_data_uri() -> Optional[str]:
+    """
+    Возвращает исходный файл логотипа как data URI для вставки в SVG
+    Исходный PNG с палитрой меньше уменьшенной RGBA копии, а масштабирует его браузер
+    """
+    if not LOGO_PATH.exists():
+        return None
+    return "data:image/png;base64," + base64.b64encode(LOGO_PATH.read_bytes()).decode()
+
+
+def _row_path(row: List[bool], y: int) -> str:
+    """
+    Строит SVG path для одной строки модулей: линия толщиной в модуль на каждую серию черных модулей
+    Перемещения между сериями относительные, чтобы путь был короче
+    """
+    commands = []
+    x = 0
+    pen = None
+    width = len(row)
+    while x < width:
+        if not row[x]:
+            x += 1
+            continue
+        start = x
+        while x < width and row[x]:
+            x += 1
+        if pen is None:
+            commands.append(f"M{start} {y}.5")
+        else:
+            commands.append(f"m{start - pen} 0")
+        commands.append(f"h{x - start}")
+        pen = x
+    return "".join(commands)
+
+
+def render_qr_svg(data: str, box_size: int = BOX_SIZE) -> str:
+    """
+    Рисует QR-код с логотипом Telegram как SVG: один path на строку модулей
+
+    Args:
+        data: Данные для кодирования
+        box_size: Размер модуля в пикселях (задает width/height, геометрия в модулях)
+
+    Returns:
+        str: SVG документ
+    """
+    matrix = qr_matrix(data)
+    size = len(matrix)
+    pixels = size * box_size
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{pixels}" height="{pixels}" '
+        f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">',
+        f'<rect width="{size}" height="{size}" fill="#fff"/>',
+        '<g stroke="#000">',
+    ]
+    for y, row in enumerate(matrix):
+        path = _row_path(row, y)
+        if path:
+            parts.append(f'<path d="{path}"/>')
+    parts.append('</g>')
+
+    # Тот же белый круг с логотипом, что и в PNG, в координатах модулей
+    logo_uri = _logo_data_uri()
+    if logo_uri is not None:
+        logo_size = int(pixels * LOGO_SCALE)
+        center = (pixels // 2) / box_size
+        radius = ((logo_size + LOGO_PADDING) // 2) / box_size
+        logo_units = logo_size / box_size
+        parts.append(f'<circle cx="{center:g}" cy="{center:g}" r="{radius:g}" fill="#fff"/>')
+        parts.append(
+            f'<image href="{logo_uri}" x="{center - logo_units / 2:g}" y="{center - logo_units / 2:g}" '
+            f'width="{logo_units:g}" height="{logo_units:g}"/>'
+        )
+
+    parts.append('</svg>')
+    return "".join(parts)
+
+
+def render_qr_modules(data: str) -> List[str]:
+    """
+    Возвращает матрицу модулей QR-кода для отрисовки на клиенте
+
+    Args:
+        data: Данные для кодирования
+
+    Returns:
+        List[str]: Строки матрицы вместе с рамкой, "1" - черный модуль, "0" - белый
+    """
+    return ["".join("1" if module else "0" for module in row) for row in qr_matrix(data)]
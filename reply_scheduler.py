@@ -0,0 +1,230 @@
+"""
+Очередь исходящих ответов бота с ограничением скорости (token bucket) и паузой при FloodWaitError
+"""
+import time
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple
+from telethon.errors import AuthKeyUnregisteredError, SessionRevokedError, UnauthorizedError, FloodWaitError
+from metrics import REPLY_QUEUE_WAIT, REPLY_FLOOD_WAITS, REPLY_DROPPED
+from log_pipeline import get_logger
+
+logger = get_logger("BOT.REPLY")
+
+# Ошибки, после которых аккаунт больше не может отправлять сообщения
+AUTH_ERRORS = (AuthKeyUnregisteredError, SessionRevokedError, UnauthorizedError)
+
+
+class TokenBucket:
+    """
+    Класс для ограничения скорости: rate отправок в секунду, не больше burst подряд
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, now: float) -> float:
+        """
+        Возвращает, через сколько секунд будет доступна следующая отправка (0 - сейчас)
+        """
+        self._refill(now)
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self._tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self._tokens >= self.burst
+
+
+class ReplyScheduler:
+    """
+    Класс для очереди исходящих сообщений одного аккаунта
+    Сообщения одного чата уходят по порядку, чаты обслуживаются по кругу. Каждую отправку
+    ограничивают общий для аккаунта и свой для чата token bucket. FloodWaitError ставит всю
+    очередь на паузу на FloodWaitError.seconds, после чего то же сообщение отправляется снова.
+    Очередь работает в общем event loop; задача отправки живет, только пока очередь не пуста
+    """
+
+    def __init__(self, name: str, global_rate: float, global_burst: float, chat_rate: float, chat_burst: float,
+                 max_size: int, max_age: float,
+                 on_auth_error: Optional[Callable[[Exception], Awaitable[None]]] = None):
+        """
+        Args:
+            name: Имя очереди для логов (ID пользователя)
+            global_rate, global_burst: Лимит отправок аккаунта (в секунду и подряд)
+            chat_rate, chat_burst: Лимит отправок в один чат
+            max_size: Сколько сообщений может ждать отправки; сверх лимита новые отбрасываются
+            max_age: Через сколько секунд неотправленное сообщение теряет смысл и отбрасывается
+            on_auth_error: Корутина, вызываемая, если сессия стала невалидной при отправке
+        """
+        self.name = name
+        self._global_bucket = TokenBucket(global_rate, global_burst)
+        self._chat_rate, self._chat_burst = chat_rate, chat_burst
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._max_size = max_size
+        self._max_age = max_age
+        self._on_auth_error = on_auth_error
+        # Очереди чатов в порядке обслуживания: {chat_id: deque[(send, время постановки)]}
+        self._chats: Dict[int, Deque[Tuple[Callable[[], Awaitable], float]]] = {}
+        self._size = 0
+        # До какого момента (time.monotonic) очередь стоит после FloodWaitError
+        self._parked_until = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    def __len__(self) -> int:
+        return self._size
+
+    def is_parked(self) -> bool:
+        return self._parked_until > time.monotonic()
+
+    def enqueue(self, chat_id: int, send: Callable[[], Awaitable]) -> bool:
+        """
+        Ставит сообщение в очередь (вызывается в общем event loop)
+
+        Args:
+            chat_id: ID чата
+            send: Функция без аргументов, возвращающая корутину отправки
+
+        Returns:
+            bool: False если очередь переполнена или закрыта и сообщение отброшено
+        """
+        if self._closed:
+            return False
+        if self._size >= self._max_size:
+            REPLY_DROPPED.inc(reason="queue_full")
+            logger.warning(f"Очередь ответов {self.name} переполнена ({self._size}), сообщение отброшено")
+            return False
+        self._chats.setdefault(chat_id, deque()).append((send, time.monotonic()))
+        self._size += 1
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._drain())
+        else:
+            self._wakeup.set()
+        return True
+
+    def close(self):
+        """
+        Останавливает отправку и отбрасывает неотправленные сообщения (бот остановлен)
+        """
+        self._closed = True
+        # Из самой задачи отправки (ошибка авторизации) ее не отменяем - она завершится сама
+        if self._task is not None and not self._task.done() and self._task is not asyncio.current_task():
+            self._task.cancel()
+        if self._size:
+            REPLY_DROPPED.inc(self._size, reason="stopped")
+        self._chats.clear()
+        self._size = 0
+
+    async def _sleep(self, delay: float):
+        """
+        Ждет delay секунд или новое сообщение (у нового чата может быть свободный лимит)
+        """
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+    def _next_chat(self, now: float) -> Tuple[Optional[int], float]:
+        """
+        Выбирает первый по кругу чат, в который можно отправить сейчас
+
+        Returns:
+            tuple: (chat_id, 0) или (None, через сколько секунд освободится ближайший чат)
+        """
+        wait = None
+        for chat_id in self._chats:
+            bucket = self._chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = self._chat_buckets[chat_id] = TokenBucket(self._chat_rate, self._chat_burst)
+            delay = bucket.delay(now)
+            if delay == 0:
+                return chat_id, 0.0
+            wait = delay if wait is None else min(wait, delay)
+        return None, wait or 0.0
+
+    def _pop_chat(self, chat_id: int):
+        """
+        Убирает пустую очередь чата или переносит чат в конец круга
+        """
+        messages = self._chats.pop(chat_id, None)
+        if messages:
+            self._chats[chat_id] = messages
+
+    async def _drain(self):
+        """
+        Отправляет сообщения, пока очередь не опустеет
+        """
+        try:
+            while self._size:
+                now = time.monotonic()
+                if self._parked_until > now:
+                    # Пауза FloodWaitError относится ко всему аккаунту
+                    await asyncio.sleep(self._parked_until - now)
+                    continue
+                global_delay = self._global_bucket.delay(now)
+                if global_delay:
+                    await asyncio.sleep(global_delay)
+                    continue
+                chat_id, chat_delay = self._next_chat(now)
+                if chat_id is None:
+                    await self._sleep(chat_delay)
+                    continue
+                await self._send_next(chat_id, now)
+        finally:
+            # Лимиты чатов, которые уже восстановились, больше не нужны
+            now = time.monotonic()
+            for chat_id in [c for c, bucket in self._chat_buckets.items() if c not in self._chats and bucket.is_full(now)]:
+                del self._chat_buckets[chat_id]
+
+    async def _send_next(self, chat_id: int, now: float):
+        """
+        Отправляет первое сообщение чата
+        """
+        messages = self._chats[chat_id]
+        send, enqueued_at = messages[0]
+        if now - enqueued_at > self._max_age:
+            messages.popleft()
+            self._size -= 1
+            self._pop_chat(chat_id)
+            REPLY_DROPPED.inc(reason="expired")
+            logger.warning(f"Ответ в чат {chat_id} ({self.name}) ждал дольше {self._max_age} секунд и отброшен")
+            return
+        self._global_bucket.take(now)
+        self._chat_buckets[chat_id].take(now)
+        REPLY_QUEUE_WAIT.observe(now - enqueued_at)
+        try:
+            await send()
+        except FloodWaitError as e:
+            # Сообщение остается первым в очереди чата и уйдет после паузы
+            REPLY_FLOOD_WAITS.inc()
+            self._parked_until = time.monotonic() + e.seconds
+            logger.warning(f"FloodWait {e.seconds} секунд для {self.name}: очередь ответов ({self._size}) на паузе")
+            return
+        except AUTH_ERRORS as e:
+            logger.warning(f"Сессия {self.name} стала невалидной при отправке ответа: {type(e).__name__}")
+            self.close()
+            if self._on_auth_error is not None:
+                await self._on_auth_error(e)
+            return
+        except Exception as e:
+            REPLY_DROPPED.inc(reason="error")
+            logger.error(f"Ошибка при отправке ответа в чат {chat_id} ({self.name}): {type(e).__name__}: {e}")
+        messages.popleft()
+        self._size -= 1
+        self._pop_chat(chat_id)
@@ -0,0 +1,300 @@
+"""
+Хранилище сессий Telegram с подключаемыми бэкендами
+
+Клиенты Telethon всегда работают на StringSession в памяти: хранилище только
+отдает строку сессии при подключении и атомарно сохраняет ее после авторизации.
+Поэтому SQLite-файлы сессий не открываются клиентами и не блокируются.
+"""
+import os
+import time
+import uuid
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional
+from telethon.crypto import AuthKey
+from telethon.sessions import StringSession, SQLiteSession
+import config
+from tenants import session_path, list_session_ids
+from log_pipeline import get_logger
+
+logger = get_logger("SESSION.STORE")
+
+
+class SessionStore(ABC):
+    """
+    Базовый класс хранилища: строки StringSession по ID пользователя
+    """
+
+    # Название бэкенда для логов
+    name = "base"
+
+    @abstractmethod
+    def load(self, session_id: str) -> Optional[str]:
+        """
+        Загружает строку сессии пользователя
+
+        Args:
+            session_id: ID пользователя
+
+        Returns:
+            str или None: Строка StringSession, если сессия есть
+        """
+
+    @abstractmethod
+    def save(self, session_id: str, session_string: str):
+        """
+        Атомарно сохраняет строку сессии пользователя (заменяет предыдущую)
+
+        Args:
+            session_id: ID пользователя
+            session_string: Строка StringSession
+        """
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        """
+        Удаляет сессию пользователя
+
+        Args:
+            session_id: ID пользователя
+        """
+
+    @abstractmethod
+    def list_ids(self) -> List[str]:
+        """
+        Возвращает ID всех пользователей с сохраненной сессией
+
+        Returns:
+            List[str]: ID пользователей
+        """
+
+    def exists(self, session_id: str) -> bool:
+        """
+        Проверяет, есть ли сохраненная сессия пользователя
+
+        Args:
+            session_id: ID пользователя
+
+        Returns:
+            bool: True если сессия есть
+        """
+        return self.load(session_id) is not None
+
+    def open_session(self, session_id: str) -> Optional[StringSession]:
+        """
+        Создает StringSession для TelegramClient из сохраненной сессии
+
+        Args:
+            session_id: ID пользователя
+
+        Returns:
+            StringSession или None, если сессии нет
+        """
+        session_string = self.load(session_id)
+        if not session_string:
+            return None
+        return StringSession(session_string)
+
+    def promote(self, session_id: str, client_session) -> str:
+        """
+        Делает сессию авторизованного клиента (обычно временную, в памяти) постоянной сессией пользователя
+
+        Args:
+            session_id: ID пользователя
+            client_session: Сессия клиента (client.session)
+
+        Returns:
+            str: Сохраненная строка сессии
+        """
+        session_string = StringSession.save(client_session)
+        if not session_string:
+            raise ValueError("У сессии клиента нет ключа авторизации")
+        self.save(session_id, session_string)
+        return session_string
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Сессии только в памяти процесса (теряются при перезапуске)
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self._sessions: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> Optional[str]:
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def save(self, session_id: str, session_string: str):
+        with self._lock:
+            self._sessions[session_id] = session_string
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def list_ids(self) -> List[str]:
+        with self._lock:
+            return sorted(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Все сессии в одной SQLite базе в режиме WAL: чтения не блокируются записью,
+    сохранение сессии - одна транзакция INSERT OR REPLACE
+    """
+
+    name = "sqlite"
+
+    def __init__(self, db_path: Path, legacy_store: Optional[SessionStore] = None):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, session TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        if legacy_store is not None:
+            self._import_from(legacy_store)
+
+    def _import_from(self, legacy_store: SessionStore):
+        """
+        Переносит сессии из прежнего хранилища, если база еще пустая
+        """
+        with self._lock:
+            has_rows = self._conn.execute("SELECT 1 FROM sessions LIMIT 1").fetchone()
+        if has_rows:
+            return
+        imported = 0
+        for session_id in legacy_store.list_ids():
+            session_string = legacy_store.load(session_id)
+            if session_string:
+                self.save(session_id, session_string)
+                imported += 1
+        if imported:
+            logger.info(f"Перенесено сессий в {self.db_path.name}: {imported}")
+
+    def load(self, session_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT session FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def save(self, session_id: str, session_string: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, session, updated_at) VALUES (?, ?, ?)",
+                (session_id, session_string, time.time()),
+            )
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def list_ids(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT session_id FROM sessions ORDER BY session_id").fetchall()
+        return [row[0] for row in rows]
+
+
+class FileSessionStore(SessionStore):
+    """
+    Прежняя раскладка: отдельный файл Telethon (.session, SQLite) на пользователя
+    Файл читается один раз при подключении, а записывается целиком во временный
+    файл и подменяется через os.replace - частично записанной сессии не бывает
+    """
+
+    name = "file"
+
+    def load(self, session_id: str) -> Optional[str]:
+        path = session_path(session_id)
+        if not path.exists():
+            return None
+        try:
+            # Открываем только на чтение: файл не блокируется для других процессов
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                row = conn.execute(
+                    "SELECT dc_id, server_address, port, auth_key FROM sessions"
+                ).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"Не удалось прочитать {path.name}: {e}")
+            return None
+        if not row or not row[3]:
+            return None
+
+        session = StringSession()
+        session.set_dc(row[0], row[1], row[2])
+        session.auth_key = AuthKey(row[3])
+        return session.save()
+
+    def save(self, session_id: str, session_string: str):
+        path = session_path(session_id)
+        source = StringSession(session_string)
+        # Пишем полноценный файл Telethon рядом и атомарно подменяем им постоянный
+        tmp_path = path.with_name(f".{path.stem}.{uuid.uuid4().hex}.session")
+        tmp_session = SQLiteSession(str(tmp_path))
+        try:
+            try:
+                tmp_session.set_dc(source.dc_id, source.server_address, source.port)
+                tmp_session.auth_key = source.auth_key
+                tmp_session.save()
+            finally:
+                tmp_session.close()
+            os.replace(tmp_path, path)
+        except Exception:
+            # Недописанный временный файл не оставляем - его не нужно искать при очистке
+            for leftover in tmp_path.parent.glob(tmp_path.name + "*"):
+                leftover.unlink(missing_ok=True)
+            raise
+
+    def delete(self, session_id: str):
+        path = session_path(session_id)
+        # Файл сессии вместе с journal и другими служебными файлами
+        for session_file in path.parent.glob(path.name + "*"):
+            try:
+                session_file.unlink()
+                logger.info(f"Удален файл сессии: {session_file.name}")
+            except Exception as e:
+                logger.error(f"Ошибка при удалении файла сессии {session_file.name}: {e}")
+
+    def exists(self, session_id: str) -> bool:
+        return session_path(session_id).exists()
+
+    def list_ids(self) -> List[str]:
+        return list_session_ids()
+
+
+def create_session_store(backend: str) -> SessionStore:
+    """
+    Создает хранилище сессий по названию бэкенда
+
+    Args:
+        backend: file, sqlite или memory
+
+    Returns:
+        SessionStore: Хранилище сессий
+    """
+    if backend == "memory":
+        return MemorySessionStore()
+    if backend == "sqlite":
+        # Существующие файлы сессий переносятся в базу при первом запуске
+        return SQLiteSessionStore(config.SESSION_DB_PATH, legacy_store=FileSessionStore())
+    if backend == "file":
+        return FileSessionStore()
+    raise ValueError(f"Неизвестный бэкенд хранилища сессий: {backend}")
+
+
+# Глобальное хранилище сессий
+session_store = create_session_store(config.SESSION_STORE)
+logger.info(f"Хранилище сессий: {session_store.name}")
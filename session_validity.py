@@ -0,0 +1,131 @@
+"""
+Кеш ответов о валидности сохраненных сессий (для /api/check_session_status)
+"""
+import time
+import threading
+import concurrent.futures
+from typing import Callable, Dict, Optional, Tuple
+import config
+from async_runtime import async_runtime
+from metrics import SESSION_CHECKS
+from log_pipeline import get_logger
+
+logger = get_logger("SESSION.VALIDITY")
+
+
+class SessionValidityCache:
+    """
+    Класс для кеширования результата проверки сессии через Telegram API
+    Ответ живет ttl секунд; одновременные запросы одного пользователя ждут одну
+    общую проверку (single-flight) вместо отдельного подключения на каждый запрос.
+    Отзыв сессии и выход сбрасывают кеш сразу
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        # {session_id: (valid, checked_at)}
+        self._answers: Dict[str, Tuple[bool, float]] = {}
+        # Проверки, которые сейчас выполняются: {session_id: Future}
+        self._inflight: Dict[str, concurrent.futures.Future] = {}
+        # Номер поколения пользователя: растет при каждом сбросе, чтобы
+        # проверка, начатая до сброса, не записала устаревший ответ
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[bool]:
+        """
+        Возвращает закешированный ответ, если он еще не устарел
+
+        Args:
+            session_id: ID пользователя
+
+        Returns:
+            bool или None: Валидность сессии или None, если ответа нет
+        """
+        with self._lock:
+            answer = self._answers.get(session_id)
+            if answer is None:
+                return None
+            valid, checked_at = answer
+            if time.time() - checked_at >= self.ttl:
+                del self._answers[session_id]
+                return None
+            return valid
+
+    def check(self, session_id: str, probe: Callable, timeout: float = 10) -> bool:
+        """
+        Возвращает валидность сессии из кеша или выполняет одну общую проверку
+
+        Args:
+            session_id: ID пользователя
+            probe: Функция без аргументов, возвращающая корутину проверки (-> bool)
+            timeout: Сколько ждать проверку в секундах
+
+        Returns:
+            bool: True если сессия валидна
+        """
+        cached = self.get(session_id)
+        if cached is not None:
+            SESSION_CHECKS.inc(outcome="cached")
+            return cached
+
+        with self._lock:
+            future = self._inflight.get(session_id)
+            if future is None:
+                generation = self._generations.get(session_id, 0)
+                future = async_runtime.submit(probe())
+                self._inflight[session_id] = future
+                future.add_done_callback(
+                    lambda done: self._on_probe_done(session_id, generation, done)
+                )
+            else:
+                logger.debug(f"Проверка сессии {session_id} уже выполняется, ждем ее результат")
+        try:
+            valid = future.result(timeout=timeout)
+        except Exception:
+            SESSION_CHECKS.inc(outcome="error")
+            raise
+        SESSION_CHECKS.inc(outcome="valid" if valid else "invalid")
+        return valid
+
+    def set(self, session_id: str, valid: bool):
+        """
+        Записывает известный ответ (например, сразу после авторизации)
+
+        Args:
+            session_id: ID пользователя
+            valid: Валидна ли сессия
+        """
+        with self._lock:
+            self._generations[session_id] = self._generations.get(session_id, 0) + 1
+            self._answers[session_id] = (valid, time.time())
+
+    def invalidate(self, session_id: str):
+        """
+        Сбрасывает ответ пользователя (сессия отозвана или удалена)
+
+        Args:
+            session_id: ID пользователя
+        """
+        with self._lock:
+            self._generations[session_id] = self._generations.get(session_id, 0) + 1
+            self._answers.pop(session_id, None)
+            self._inflight.pop(session_id, None)
+
+    def _on_probe_done(self, session_id: str, generation: int, future: concurrent.futures.Future):
+        """
+        Сохраняет результат проверки, если за время проверки кеш не сбрасывали
+        Ошибки проверки (сеть, таймаут) не кешируются
+        """
+        with self._lock:
+            if self._inflight.get(session_id) is future:
+                del self._inflight[session_id]
+            if self._generations.get(session_id, 0) != generation:
+                return
+            if future.cancelled() or future.exception() is not None:
+                return
+            self._answers[session_id] = (bool(future.result()), time.time())
+
+
+# Глобальный кеш валидности сессий
+session_validity = SessionValidityCache(config.SESSION_VALIDITY_TTL)
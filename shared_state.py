@@ -0,0 +1,373 @@
+"""
+Состояние, общее для всех воркеров gunicorn: авторизация, профили, результаты QR-кодов и боты
+"""
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+import config
+from log_pipeline import get_logger
+
+logger = get_logger("SESSION.SHARED")
+
+# Поля записи QR-кода, которые видны другим воркерам (клиент и задачи остаются у владельца)
+QR_SNAPSHOT_FIELDS = ("session_id", "created_at", "expires_at", "output", "format",
+                      "version", "status", "user_data", "error", "qr_payload")
+
+
+def _process_start_time(pid: int) -> Optional[str]:
+    """
+    Возвращает время старта процесса из /proc (Linux), чтобы отличать его от процесса с тем же PID
+    """
+    try:
+        stat = Path(f"/proc/{pid}/stat").read_text()
+    except OSError:
+        return None
+    # Имя процесса в скобках может содержать пробелы - считаем поля после него
+    return stat[stat.rindex(")") + 2:].split()[19]
+
+
+def current_owner() -> str:
+    """
+    Возвращает идентификатор текущего воркера: PID и время его старта
+
+    Returns:
+        str: "pid:время старта"
+    """
+    pid = os.getpid()
+    return f"{pid}:{_process_start_time(pid) or ''}"
+
+
+def is_owner_alive(owner: str) -> bool:
+    """
+    Проверяет, жив ли воркер-владелец записи на этой машине
+    После перезапуска контейнера PID может совпасть, поэтому сверяется и время старта
+
+    Args:
+        owner: Идентификатор из current_owner()
+
+    Returns:
+        bool: True если воркер существует
+    """
+    pid_text, _, start_time = owner.partition(":")
+    pid = int(pid_text)
+    if pid == os.getpid():
+        return owner == current_owner()
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return not start_time or _process_start_time(pid) in (None, start_time)
+
+
+class SharedState:
+    """
+    Класс для состояния, которое должен видеть любой воркер, в одной SQLite базе в режиме WAL
+    Живые объекты (клиенты Telethon, задачи ожидания QR) остаются в воркере-владельце,
+    а в базу пишутся их результаты с PID владельца. QR-коды и боты умершего воркера считаются
+    недействительными - как если бы это состояние было в памяти процесса. Авторизация
+    привязана к сохраненной сессии, а не к воркеру, и снимается только при выходе или отзыве.
+    Вызовы блокирующие (ожидание блокировки до busy_timeout), поэтому из event loop они
+    выполняются через run() / post() в отдельном потоке
+    """
+
+    def __init__(self, db_path: Optional[Path] = None):
+        # Без файла база живет в памяти процесса (один воркер)
+        self.db_path = Path(db_path) if db_path else None
+        # Идентификатор этого воркера в колонках owner (вычисляется заново после fork)
+        self._owner: Optional[str] = None
+        self._owner_pid: Optional[int] = None
+        self._lock = threading.Lock()
+        # Поток для вызовов из event loop (создается заново после fork)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_pid: Optional[int] = None
+        self._conn = sqlite3.connect(
+            str(self.db_path) if self.db_path else ":memory:", check_same_thread=False, isolation_level=None
+        )
+        if self.db_path:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            # Другие воркеры могут держать блокировку записи - ждем, а не падаем
+            self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS auth ("
+            "session_id TEXT PRIMARY KEY, owner TEXT NOT NULL, updated_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS profiles ("
+            "session_id TEXT PRIMARY KEY, profile TEXT NOT NULL, updated_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS qr_codes ("
+            "qr_id TEXT PRIMARY KEY, session_id TEXT NOT NULL, record TEXT NOT NULL, "
+            "image BLOB, image_version INTEGER, owner TEXT NOT NULL, updated_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS bots ("
+            "session_id TEXT PRIMARY KEY, owner TEXT NOT NULL, stop_requested INTEGER NOT NULL DEFAULT 0, "
+            "updated_at REAL NOT NULL);"
+        )
+        self._purge_dead_owners()
+
+    @property
+    def owner(self) -> str:
+        pid = os.getpid()
+        if self._owner_pid != pid:
+            self._owner, self._owner_pid = current_owner(), pid
+        return self._owner
+
+    def _alive(self, owner: str) -> bool:
+        return owner == self.owner or is_owner_alive(owner)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        pid = os.getpid()
+        if self._executor_pid != pid:
+            # Один поток: записи из event loop выполняются в порядке вызова
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-state")
+            self._executor_pid = pid
+        return self._executor
+
+    async def run(self, func: Callable, *args):
+        """
+        Выполняет блокирующий вызов (метод общего состояния или хранилищ) в потоке общего состояния
+        Для вызова из event loop: ожидание блокировки SQLite не останавливает остальных клиентов
+
+        Args:
+            func: Функция
+            *args: Аргументы
+
+        Returns:
+            Результат func
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._get_executor(), func, *args)
+
+    def post(self, func: Callable, *args):
+        """
+        Ставит запись в поток общего состояния, не дожидаясь ее (публикация состояния QR-кодов)
+        Записи выполняются по очереди, поэтому более поздняя не обгонит раннюю
+
+        Args:
+            func: Функция
+            *args: Аргументы
+        """
+        def call():
+            try:
+                func(*args)
+            except Exception as e:
+                logger.error(f"Ошибка при записи общего состояния ({func.__name__}): {type(e).__name__}: {e}")
+        self._get_executor().submit(call)
+
+    def _purge_dead_owners(self):
+        """
+        Удаляет QR-коды и ботов воркеров, которых уже нет (после перезапуска или падения)
+        """
+        for table in ("qr_codes", "bots"):
+            with self._lock:
+                owners = [row[0] for row in self._conn.execute(f"SELECT DISTINCT owner FROM {table}")]
+            for owner in owners:
+                if not self._alive(owner):
+                    self._execute(f"DELETE FROM {table} WHERE owner = ?", (owner,))
+
+    def _execute(self, sql: str, params: Tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def _fetchone(self, sql: str, params: Tuple = ()) -> Optional[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()
+
+    # --- Авторизация ---
+
+    def set_authorized(self, session_id: str):
+        """
+        Отмечает пользователя авторизованным (сессия сохранена в хранилище)
+        Отметка не зависит от воркера: перезапуск воркера не разлогинивает пользователя
+
+        Args:
+            session_id: ID пользователя
+        """
+        self._execute(
+            "INSERT OR REPLACE INTO auth (session_id, owner, updated_at) VALUES (?, ?, ?)",
+            (session_id, self.owner, time.time()),
+        )
+
+    def clear_authorized(self, session_id: str):
+        """
+        Снимает отметку авторизации (выход или отзыв сессии)
+
+        Args:
+            session_id: ID пользователя
+        """
+        self._execute("DELETE FROM auth WHERE session_id = ?", (session_id,))
+
+    def is_authorized(self, session_id: str) -> bool:
+        """
+        Проверяет, авторизован ли пользователь (отметка снимается только при выходе или отзыве сессии)
+
+        Args:
+            session_id: ID пользователя
+
+        Returns:
+            bool: True если авторизован
+        """
+        return self._fetchone("SELECT 1 FROM auth WHERE session_id = ?", (session_id,)) is not None
+
+    # --- Профили ---
+
+    def get_profile(self, session_id: str) -> Optional[Dict]:
+        row = self._fetchone("SELECT profile FROM profiles WHERE session_id = ?", (session_id,))
+        return json.loads(row[0]) if row else None
+
+    def put_profile(self, session_id: str, profile: Dict):
+        self._execute(
+            "INSERT OR REPLACE INTO profiles (session_id, profile, updated_at) VALUES (?, ?, ?)",
+            (session_id, json.dumps(profile, ensure_ascii=False), time.time()),
+        )
+
+    def delete_profile(self, session_id: str) -> bool:
+        return self._execute("DELETE FROM profiles WHERE session_id = ?", (session_id,)).rowcount > 0
+
+    def profile_count(self) -> int:
+        return self._fetchone("SELECT COUNT(*) FROM profiles")[0]
+
+    # --- QR-коды ---
+
+    def put_qr(self, qr_id: str, qr_data: dict, image: Optional[bytes] = None):
+        """
+        Публикует текущее состояние QR-кода для других воркеров
+
+        Args:
+            qr_id: ID QR-кода
+            qr_data: Запись QR-кода (сохраняются только поля QR_SNAPSHOT_FIELDS)
+            image: PNG текущей версии для /api/qr_image (None - изображения нет)
+        """
+        record = {field: qr_data.get(field) for field in QR_SNAPSHOT_FIELDS}
+        self._execute(
+            "INSERT OR REPLACE INTO qr_codes "
+            "(qr_id, session_id, record, image, image_version, owner, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (qr_id, qr_data["session_id"], json.dumps(record, ensure_ascii=False),
+             image, qr_data.get("version") if image else None, self.owner, time.time()),
+        )
+
+    def get_qr(self, qr_id: str) -> Optional[dict]:
+        """
+        Возвращает опубликованное состояние QR-кода, если его воркер-владелец жив
+
+        Args:
+            qr_id: ID QR-кода
+
+        Returns:
+            dict или None: Снимок записи QR-кода (без клиента)
+        """
+        row = self._fetchone("SELECT record, owner FROM qr_codes WHERE qr_id = ?", (qr_id,))
+        if not row or not self._alive(row[1]):
+            return None
+        return json.loads(row[0])
+
+    def get_qr_image(self, qr_id: str) -> Optional[Tuple[bytes, int]]:
+        """
+        Возвращает опубликованное изображение QR-кода
+
+        Args:
+            qr_id: ID QR-кода
+
+        Returns:
+            tuple или None: (PNG, версия токена)
+        """
+        row = self._fetchone(
+            "SELECT image, image_version, owner FROM qr_codes WHERE qr_id = ?", (qr_id,)
+        )
+        if not row or row[0] is None or not self._alive(row[2]):
+            return None
+        return row[0], row[1]
+
+    def delete_qr(self, qr_id: str):
+        self._execute("DELETE FROM qr_codes WHERE qr_id = ?", (qr_id,))
+
+    # --- Боты ---
+
+    def claim_bot(self, session_id: str) -> bool:
+        """
+        Отмечает, что бот пользователя запускается в текущем воркере, если он не запущен в другом
+        Проверка и запись выполняются в одной транзакции, поэтому бот достается только одному воркеру
+
+        Args:
+            session_id: ID пользователя
+
+        Returns:
+            bool: True если бот закреплен за текущим воркером
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT owner FROM bots WHERE session_id = ?", (session_id,)).fetchone()
+                if row and row[0] != self.owner and is_owner_alive(row[0]):
+                    self._conn.execute("ROLLBACK")
+                    return False
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO bots (session_id, owner, stop_requested, updated_at) VALUES (?, ?, 0, ?)",
+                    (session_id, self.owner, time.time()),
+                )
+                self._conn.execute("COMMIT")
+                return True
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def clear_bot_owner(self, session_id: str):
+        """
+        Снимает отметку о боте, если он запущен в текущем воркере
+
+        Args:
+            session_id: ID пользователя
+        """
+        self._execute("DELETE FROM bots WHERE session_id = ? AND owner = ?", (session_id, self.owner))
+
+    def bot_owner(self, session_id: str) -> Optional[str]:
+        """
+        Возвращает живой воркер, в котором запущен бот пользователя
+
+        Args:
+            session_id: ID пользователя
+
+        Returns:
+            str или None: Идентификатор воркера или None, если бот нигде не запущен
+        """
+        row = self._fetchone("SELECT owner FROM bots WHERE session_id = ?", (session_id,))
+        if not row or not self._alive(row[0]):
+            return None
+        return row[0]
+
+    def request_bot_stop(self, session_id: str) -> bool:
+        """
+        Просит воркер-владелец остановить бота пользователя
+
+        Args:
+            session_id: ID пользователя
+
+        Returns:
+            bool: True если бот запущен в другом живом воркере и запрос записан
+        """
+        owner = self.bot_owner(session_id)
+        if owner is None or owner == self.owner:
+            return False
+        self._execute("UPDATE bots SET stop_requested = 1 WHERE session_id = ?", (session_id,))
+        return True
+
+    def stop_requests(self) -> List[str]:
+        """
+        Возвращает пользователей, чьих ботов в текущем воркере попросили остановить
+
+        Returns:
+            List[str]: ID пользователей
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT session_id FROM bots WHERE owner = ? AND stop_requested = 1", (self.owner,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+
+# Глобальное общее состояние (для SESSION_STORE=memory - только в памяти процесса)
+shared_state = SharedState(None if config.SESSION_STORE == "memory" else config.SHARED_STATE_PATH)
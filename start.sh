@@ -1,3 +1,9 @@
 #!/bin/bash
-gunicorn app:app --bind 0.0.0.0:$PORT --workers 2 --threads 2 --timeout 120
-
+# Супервизор ботов держит все клиенты Telethon, веб-воркеры обращаются к нему через Unix-сокет
+# Без супервизора клиенты QR-кодов живут в веб-воркере, поэтому воркер один (см. gunicorn.conf.py)
+WORKERS=1
+if [ -n "$BOT_SUPERVISOR_SOCKET" ]; then
+    python bot_supervisor.py &
+    WORKERS=2
+fi
+gunicorn app:app --bind 0.0.0.0:$PORT --workers $WORKERS --threads 4 --timeout 120
@@ -1,10 +1,21 @@
 // Управление состоянием приложения
 let currentQrId = null;
+let currentQrVersion = 1; // Версия токена QR: сервер обновляет токен на том же клиенте
 let statusCheckInterval = null;
 let qrTimerInterval = null;
 let sessionCheckInterval = null; // Интервал для проверки сессии
 let qrTimeLeft = 25; // Таймаут QR кода
 let isSubmittingPassword = false; // Флаг для предотвращения двойной отправки пароля
+let isLoggingOut = false; // Флаг выхода, чтобы не реагировать на собственное событие logout
+
+// Server-Sent Events: сервер сам сообщает об изменениях, polling остается запасным вариантом
+let eventSource = null;
+let sseConnected = false;
+let lastStatusPollAt = 0;
+let lastSessionPollAt = 0;
+const SSE_FALLBACK_POLL_INTERVAL = 15000; // Редкий контрольный опрос при активном SSE
+const SSE_RECONNECT_DELAY = 60000; // Повторная попытка открыть поток после отказа сервера
+const QR_FORMAT = 'svg'; // Формат QR-кода от /api/generate_qr (см. API.md)
 
 // BroadcastChannel для отслеживания активной вкладки
 const CHANNEL_NAME = 'tg_qr_auth_tab_control';
@@ -301,6 +312,9 @@ document.addEventListener('DOMContentLoaded', async () => {
     // Инициализируем отслеживание активной вкладки ПЕРЕД всем остальным
     initTabTracking();
     
+    // Подписываемся на события сервера
+    initEventStream();
+    
     // Небольшая задержка чтобы дать время отслеживанию вкладок проверить другие вкладки
     await new Promise(resolve => setTimeout(resolve, 200));
     
@@ -361,6 +375,75 @@ document.addEventListener('DOMContentLoaded', async () => {
     if (logoutModalConfirm) logoutModalConfirm.addEventListener('click', handleLogout);
 });
 
+/**
+ * Подключается к потоку событий сервера /api/events
+ * При обрыве браузер переподключается сам, а на это время работает обычный polling
+ */
+function initEventStream() {
+    if (typeof EventSource === 'undefined') {
+        console.warn('[SSE] EventSource не поддерживается, используем только polling');
+        return;
+    }
+    
+    eventSource = new EventSource('/api/events');
+    
+    eventSource.onopen = () => {
+        sseConnected = true;
+        console.log('[SSE] Подключено к /api/events');
+    };
+    
+    eventSource.onerror = () => {
+        // Браузер переподключится сам, до этого работает polling
+        sseConnected = false;
+        console.warn('[SSE] Соединение потеряно, временно используем polling');
+        if (eventSource.readyState === EventSource.CLOSED) {
+            // Сервер отказал (503 - открыто максимум потоков): сам браузер не переподключается,
+            // работаем через polling и пробуем снова позже
+            eventSource = null;
+            setTimeout(initEventStream, SSE_RECONNECT_DELAY);
+        }
+    };
+    
+    eventSource.addEventListener('qr_status', (event) => {
+        const data = JSON.parse(event.data);
+        if (!currentQrId || data.qr_id !== currentQrId) return;
+        console.log('[SSE] qr_status:', data.status);
+        
+        if (data.status === 'authorized') {
+            // check_status вернет профиль и состояние бота
+            checkAuthorizationStatus();
+        } else if (data.status === 'needs_password') {
+            stopStatusCheck();
+            showPasswordScreen();
+        } else if (data.status === 'expired' || data.status === 'error') {
+            stopStatusCheck();
+            generateNewQR(false);
+        }
+    });
+    
+    eventSource.addEventListener('qr_refreshed', (event) => {
+        const data = JSON.parse(event.data);
+        if (!currentQrId || data.qr_id !== currentQrId) return;
+        updateQrImage(data, data.version);
+    });
+    
+    eventSource.addEventListener('bot_status', (event) => {
+        const data = JSON.parse(event.data);
+        if (currentQrId !== 'active_session' || !profileScreen || !profileScreen.classList.contains('active')) return;
+        console.log('[SSE] bot_status:', data.active);
+        botToggle.checked = data.active;
+        lastSyncedBotState = data.active;
+    });
+    
+    const onSessionEnded = (event) => {
+        if (isLoggingOut || currentQrId !== 'active_session') return;
+        console.log('[SSE] Сессия завершена:', event.type);
+        checkSessionValidity();
+    };
+    eventSource.addEventListener('session_revoked', onSessionEnded);
+    eventSource.addEventListener('logout', onSessionEnded);
+}
+
 /**
  * Генерирует новый QR-код
  * @param {boolean} showSpinner - показывать ли спиннер загрузки (только при первой генерации)
@@ -384,6 +467,8 @@ async function generateNewQR(showSpinner = true) {
                 headers: {
                     'Content-Type': 'application/json'
                 },
+                // SVG заметно меньше base64 PNG, логотип встроен в сам SVG
+                body: JSON.stringify({ format: QR_FORMAT }),
                 signal: controller.signal
             });
             
@@ -404,11 +489,12 @@ async function generateNewQR(showSpinner = true) {
         
         if (data.success) {
             currentQrId = data.qr_id;
+            currentQrVersion = data.qr_version || 1;
             // Если это не первая генерация, делаем мгновенную замену без спиннера
             const isFirstGeneration = showSpinner;
             
             const imgElement = document.createElement('img');
-            imgElement.src = `data:image/png;base64,${data.qr_image}`;
+            imgElement.src = qrImageSrc(data);
             imgElement.alt = 'QR Code';
             
             // При первой генерации - плавное появление, при смене - мгновенная замена
@@ -450,6 +536,38 @@ async function generateNewQR(showSpinner = true) {
     }
 }
 
+/**
+ * Возвращает src для изображения QR-кода из ответа сервера (svg или png в base64)
+ * @param {Object} data - ответ с полями qr_svg или qr_image
+ * @returns {string|null} data URI изображения
+ */
+function qrImageSrc(data) {
+    if (data.qr_svg) {
+        return `data:image/svg+xml;charset=utf-8,${encodeURIComponent(data.qr_svg)}`;
+    }
+    if (data.qr_image) {
+        return `data:image/png;base64,${data.qr_image}`;
+    }
+    return null;
+}
+
+/**
+ * Заменяет изображение QR-кода после обновления токена на сервере
+ * @param {Object} data - поля изображения из ответа сервера (qr_svg или qr_image)
+ * @param {number} version - версия токена
+ */
+function updateQrImage(data, version) {
+    if (version <= currentQrVersion) return;
+    const imgElement = qrContainer.querySelector('img');
+    const src = qrImageSrc(data);
+    if (!imgElement || !src) return;
+    
+    currentQrVersion = version;
+    imgElement.classList.add('qr-instant');
+    imgElement.src = src;
+    console.log('[QR] Токен обновлен, версия:', version);
+}
+
 /**
  * Начинает периодическую проверку статуса авторизации
  */
@@ -458,7 +576,11 @@ function startStatusCheck() {
         clearInterval(statusCheckInterval);
     }
     
-    statusCheckInterval = setInterval(checkAuthorizationStatus, 2000); // Проверка каждые 2 секунды
+    // Проверка каждые 2 секунды, при активном SSE - только контрольная раз в 15 секунд
+    statusCheckInterval = setInterval(() => {
+        if (sseConnected && Date.now() - lastStatusPollAt < SSE_FALLBACK_POLL_INTERVAL) return;
+        checkAuthorizationStatus();
+    }, 2000);
 }
 
 /**
@@ -476,11 +598,17 @@ function stopStatusCheck() {
  */
 async function checkAuthorizationStatus() {
     if (!currentQrId) return;
+    lastStatusPollAt = Date.now();
     
     try {
-        const response = await fetch(`/api/check_status/${currentQrId}`);
+        const response = await fetch(`/api/check_status/${currentQrId}?v=${currentQrVersion}`);
         const data = await response.json();
         
+        // Токен обновлен на сервере - меняем только изображение
+        if (data.qr_version) {
+            updateQrImage(data, data.qr_version);
+        }
+        
         if (!data.success) {
             if (data.qr_expired) {
                 stopStatusCheck();
@@ -525,7 +653,8 @@ function showProfile(userData) {
     userPhoto.src = '';
     
     // Заполняем данные пользователя
-    userPhoto.src = `/api/user_photo?t=${Date.now()}`; // Добавляем timestamp для обновления
+    // Фото 120px (240px для HiDPI); браузер перепроверяет его по ETag и получает 304, если оно не менялось
+    userPhoto.src = '/api/user_photo?size=240';
     userPhoto.onerror = function() {
         this.src = 'data:image/svg+xml,%3Csvg xmlns=%22http://www.w3.org/2000/svg%22 width=%22100%22 height=%22100%22%3E%3Ccircle cx=%2250%22 cy=%2250%22 r=%2250%22 fill=%22%23667eea%22/%3E%3Ctext x=%2250%22 y=%2250%22 text-anchor=%22middle%22 dy=%22.3em%22 fill=%22white%22 font-size=%2240%22%3E' + 
                    userData.first_name.charAt(0).toUpperCase() + '%3C/text%3E%3C/svg%3E';
@@ -642,6 +771,7 @@ async function handleLogout() {
     // Скрываем модальное окно
     hideLogoutModal();
     
+    isLoggingOut = true;
     try {
         const response = await fetch('/api/logout', {
             method: 'POST',
@@ -687,6 +817,8 @@ async function handleLogout() {
     } catch (error) {
         console.error('Ошибка при выходе:', error);
         alert('Ошибка соединения с сервером');
+    } finally {
+        isLoggingOut = false;
     }
 }
 
@@ -814,7 +946,7 @@ async function checkActiveSessions() {
     try {
         console.log('[INIT] Проверка активных сессий...');
         
-        // Сначала проверяем check_session_status - он проверяет файл сессии даже если _user_data потерян
+        // Сначала проверяем check_session_status - он проверяет файл сессии даже если user_data потерян
         const statusResponse = await fetch('/api/check_session_status');
         let sessionValid = false;
         
@@ -917,8 +1049,12 @@ function startSessionCheck() {
     
     // Проверяем каждые 5 секунд
     sessionCheckInterval = setInterval(async () => {
+        // При активном SSE изменения приходят событиями - опрашиваем только изредка
+        if (sseConnected && Date.now() - lastSessionPollAt < SSE_FALLBACK_POLL_INTERVAL) return;
+        
         // Проверяем только если сессия активна
         if (currentQrId === 'active_session') {
+            lastSessionPollAt = Date.now();
             console.log('[SESSION] Проверка валидности сессии...');
             await checkSessionValidity();
             
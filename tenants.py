@@ -0,0 +1,72 @@
+"""
+Идентификаторы пользователей (tenant) и пути к их сессиям
+"""
+import re
+import uuid
+from pathlib import Path
+from typing import List
+import config
+
+# Пользователь по умолчанию: его сессия лежит в прежнем файле user.session
+DEFAULT_SESSION_ID = "main"
+
+# Допустимый ID: буквы, цифры, "_" и "-" (ID попадает в имя файла сессии)
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def new_session_id() -> str:
+    """
+    Создает новый случайный ID пользователя
+
+    Returns:
+        str: ID пользователя
+    """
+    return uuid.uuid4().hex
+
+
+def is_valid_session_id(session_id) -> bool:
+    """
+    Проверяет, что ID пользователя можно использовать в имени файла
+
+    Args:
+        session_id: ID пользователя
+
+    Returns:
+        bool: True если ID допустим
+    """
+    return isinstance(session_id, str) and bool(_SESSION_ID_RE.match(session_id))
+
+
+def session_path(session_id: str) -> Path:
+    """
+    Возвращает путь к файлу постоянной сессии пользователя
+
+    Args:
+        session_id: ID пользователя
+
+    Returns:
+        Path: sessions/user.session для пользователя по умолчанию, иначе sessions/user_<id>.session
+    """
+    if not is_valid_session_id(session_id):
+        raise ValueError(f"Недопустимый ID сессии: {session_id!r}")
+    if session_id == DEFAULT_SESSION_ID:
+        return config.SESSIONS_DIR / "user.session"
+    return config.SESSIONS_DIR / f"user_{session_id}.session"
+
+
+def list_session_ids() -> List[str]:
+    """
+    Возвращает ID всех пользователей, у которых есть файл постоянной сессии
+
+    Returns:
+        List[str]: ID пользователей
+    """
+    session_ids = []
+    for path in config.SESSIONS_DIR.glob("user*.session"):
+        if path.name == "user.session":
+            session_ids.append(DEFAULT_SESSION_ID)
+        elif path.name.startswith("user_"):
+            session_id = path.name[len("user_"):-len(".session")]
+            if is_valid_session_id(session_id):
+                session_ids.append(session_id)
+    return sorted(session_ids)
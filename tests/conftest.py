@@ -0,0 +1,7 @@
+"""
+Общие настройки тестов: состояние и сессии только в памяти, без файлов в sessions/
+"""
+import os
+
+# До импорта config: тесты не трогают sessions/state.db и файлы сессий
+os.environ.setdefault("SESSION_STORE", "memory")
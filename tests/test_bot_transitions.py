@@ -0,0 +1,123 @@
+"""
+Тесты Future переходов бота (start/stop): общий Future, порядок переходов и дедлайн ожидания
+"""
+import asyncio
+import threading
+import pytest
+from async_runtime import async_runtime
+from userbot_manager import UserbotManager
+
+
+class Gate:
+    """
+    Переход, который завершается, когда тест откроет его (из своего потока)
+    """
+
+    def __init__(self, name, log, result=True):
+        self.name = name
+        self.log = log
+        self.result = result
+        self.calls = 0
+        self._event = None
+        self._ready = threading.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        self._event = asyncio.Event()
+        self._ready.set()
+        self.log.append(f"{self.name}:begin")
+        await self._event.wait()
+        self.log.append(f"{self.name}:end")
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+    def open(self):
+        assert self._ready.wait(2), f"переход {self.name} не начался"
+        async_runtime.loop.call_soon_threadsafe(self._event.set)
+
+
+@pytest.fixture
+def manager():
+    return UserbotManager()
+
+
+def test_repeated_transition_shares_one_future(manager):
+    start = Gate("start", [])
+
+    first = manager.run_transition("alice", "start", start)
+    second = manager.run_transition("alice", "start", start)
+    start.open()
+
+    assert first is second
+    assert first.result(timeout=2) is True
+    assert start.calls == 1
+
+
+def test_next_transition_waits_for_the_current_one(manager):
+    log = []
+    start, stop = Gate("start", log), Gate("stop", log)
+
+    started = manager.run_transition("alice", "start", start)
+    stopped = manager.run_transition("alice", "stop", stop)
+    # Текущий переход пользователя - последний запрошенный
+    assert manager.pending_transitions() == {"start": 0, "stop": 1}
+    start.open()
+    stop.open()
+
+    assert started.result(timeout=2) is True
+    assert stopped.result(timeout=2) is True
+    assert log == ["start:begin", "start:end", "stop:begin", "stop:end"]
+
+
+def test_failed_transition_does_not_block_the_next_one(manager):
+    log = []
+    start, stop = Gate("start", log, result=RuntimeError("connect failed")), Gate("stop", log)
+
+    started = manager.run_transition("alice", "start", start)
+    stopped = manager.run_transition("alice", "stop", stop)
+    start.open()
+    stop.open()
+
+    assert UserbotManager.wait_transition(started, timeout=2) is False
+    assert stopped.result(timeout=2) is True
+
+
+def test_transitions_of_different_users_run_independently(manager):
+    alice, bob = Gate("alice", []), Gate("bob", [])
+
+    alice_future = manager.run_transition("alice", "start", alice)
+    bob_future = manager.run_transition("bob", "start", bob)
+    bob.open()
+
+    assert bob_future.result(timeout=2) is True
+    assert not alice_future.done()
+    alice.open()
+    assert alice_future.result(timeout=2) is True
+
+
+def test_wait_transition_deadline_leaves_transition_running(manager):
+    start = Gate("start", [])
+    future = manager.run_transition("alice", "start", start)
+
+    assert UserbotManager.wait_transition(future, timeout=0.05) is None
+    assert not future.done()
+
+    start.open()
+    assert UserbotManager.wait_transition(future, timeout=2) is True
+
+
+def test_finished_transition_is_forgotten(manager):
+    start = Gate("start", [])
+    future = manager.run_transition("alice", "start", start)
+    start.open()
+    future.result(timeout=2)
+
+    assert manager.pending_transitions() == {"start": 0, "stop": 0}
+    assert "alice" not in manager._transitions
+    # Новый переход того же вида после завершения получает новый Future
+    again = Gate("start", [])
+    next_future = manager.run_transition("alice", "start", again)
+    assert next_future is not future
+    again.open()
+    assert next_future.result(timeout=2) is True
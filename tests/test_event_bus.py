@@ -0,0 +1,96 @@
+"""
+Тесты шины событий SSE: доставка по пользователям, переполнение очереди, слушатели
+"""
+import queue
+import asyncio
+import threading
+from event_bus import EventBus, format_sse
+
+
+def test_event_reaches_only_subscribers_of_its_user():
+    bus = EventBus()
+    alice = bus.subscribe("alice")
+    bob = bus.subscribe("bob")
+
+    bus.publish("qr_status", {"status": "authorized"}, session_id="alice")
+
+    assert alice.get_nowait() == ("qr_status", {"status": "authorized"})
+    assert bob.empty()
+
+
+def test_event_without_session_id_reaches_everyone():
+    bus = EventBus()
+    subscribers = [bus.subscribe("alice"), bus.subscribe("bob")]
+
+    bus.publish("bot_status", {"active": True})
+
+    assert [s.get_nowait() for s in subscribers] == [("bot_status", {"active": True})] * 2
+
+
+def test_full_subscriber_queue_drops_event_without_blocking():
+    bus = EventBus(max_queue_size=1)
+    subscriber = bus.subscribe("alice")
+
+    bus.publish("first", session_id="alice")
+    bus.publish("second", session_id="alice")
+
+    assert subscriber.get_nowait() == ("first", {})
+    assert subscriber.empty()
+
+
+def test_unsubscribe_removes_subscriber():
+    bus = EventBus()
+    subscriber = bus.subscribe("alice")
+    assert bus.subscriber_count() == 1
+
+    bus.unsubscribe("alice", subscriber)
+    bus.publish("logout", session_id="alice")
+
+    assert bus.subscriber_count() == 0
+    try:
+        subscriber.get_nowait()
+        assert False, "событие не должно дойти до отписанной очереди"
+    except queue.Empty:
+        pass
+
+
+def test_listener_sees_every_event_and_its_errors_are_isolated():
+    bus = EventBus()
+    seen = []
+    bus.add_listener(lambda *args: (_ for _ in ()).throw(RuntimeError("listener failed")))
+    bus.add_listener(lambda event, data, session_id: seen.append((event, data, session_id)))
+    subscriber = bus.subscribe("alice")
+
+    bus.publish("logout", {"reason": "user"}, session_id="alice")
+
+    assert seen == [("logout", {"reason": "user"}, "alice")]
+    assert subscriber.get_nowait() == ("logout", {"reason": "user"})
+
+
+def test_async_subscriber_receives_events_published_from_other_threads():
+    async def scenario():
+        bus = EventBus(max_queue_size=1)
+        subscriber = bus.subscribe_async("alice")
+        # Публикуют общий event loop и веб-потоки, а ждет событий loop сервера
+        publisher = threading.Thread(target=lambda: [
+            bus.publish("first", session_id="alice"),
+            bus.publish("second", session_id="alice"),
+        ])
+        publisher.start()
+        publisher.join()
+        first = await asyncio.wait_for(subscriber.get(), 1)
+        bus.unsubscribe("alice", subscriber)
+        bus.publish("after", session_id="alice")
+        await asyncio.sleep(0.01)
+        # Второе событие не поместилось в очередь, после отписки ничего не приходит
+        queue_empty = subscriber._queue.empty()
+        return first, queue_empty, bus.subscriber_count()
+
+    first, queue_empty, count = asyncio.run(scenario())
+    assert first == ("first", {})
+    assert queue_empty
+    assert count == 0
+
+
+def test_format_sse():
+    assert format_sse("qr_status", {"status": "expired"}) == 'event: qr_status\ndata: {"status": "expired"}\n\n'
@@ -0,0 +1,87 @@
+"""
+Тесты планировщика дедлайнов: порядок, перенос, отмена и ошибки callback
+"""
+import time
+import queue
+from expiry_scheduler import ExpiryScheduler
+
+
+def make_scheduler():
+    fired = queue.Queue()
+    scheduler = ExpiryScheduler(lambda key: fired.put((key, time.time())), name="test-expiry")
+    return scheduler, fired
+
+
+def drain(fired, count, timeout=2.0):
+    return [fired.get(timeout=timeout)[0] for _ in range(count)]
+
+
+def test_keys_fire_in_deadline_order():
+    scheduler, fired = make_scheduler()
+    now = time.time()
+    scheduler.schedule("late", now + 0.15)
+    scheduler.schedule("early", now + 0.05)
+    scheduler.schedule("middle", now + 0.1)
+
+    assert drain(fired, 3) == ["early", "middle", "late"]
+    assert scheduler.size() == 0
+
+
+def test_callback_is_not_called_before_deadline():
+    scheduler, fired = make_scheduler()
+    deadline = time.time() + 0.1
+    scheduler.schedule("qr", deadline)
+
+    key, fired_at = fired.get(timeout=2)
+    assert key == "qr"
+    assert fired_at >= deadline
+
+
+def test_rescheduled_key_fires_once_at_new_deadline():
+    scheduler, fired = make_scheduler()
+    scheduler.schedule("qr", time.time() + 0.05)
+    new_deadline = time.time() + 0.2
+    scheduler.schedule("qr", new_deadline)
+    assert scheduler.deadline("qr") == new_deadline
+
+    key, fired_at = fired.get(timeout=2)
+    assert key == "qr"
+    assert fired_at >= new_deadline
+    time.sleep(0.1)
+    assert fired.empty()
+
+
+def test_cancelled_key_never_fires():
+    scheduler, fired = make_scheduler()
+    scheduler.schedule("cancelled", time.time() + 0.05)
+    scheduler.schedule("kept", time.time() + 0.1)
+    scheduler.cancel("cancelled")
+
+    assert drain(fired, 1) == ["kept"]
+    time.sleep(0.1)
+    assert fired.empty()
+
+
+def test_failing_callback_does_not_stop_scheduler():
+    fired = queue.Queue()
+
+    def callback(key):
+        if key == "broken":
+            raise RuntimeError("callback failed")
+        fired.put(key)
+
+    scheduler = ExpiryScheduler(callback, name="test-expiry")
+    scheduler.schedule("broken", time.time() + 0.02)
+    scheduler.schedule("next", time.time() + 0.05)
+
+    assert fired.get(timeout=2) == "next"
+
+
+def test_many_reschedules_keep_heap_compact():
+    scheduler, _ = make_scheduler()
+    far = time.time() + 60
+    for i in range(1000):
+        scheduler.schedule("qr", far + i)
+
+    assert scheduler.size() == 1
+    assert len(scheduler._heap) <= 2 * scheduler.size() + 65
@@ -0,0 +1,100 @@
+"""
+Тесты реестра QR-кодов: порядок опроса, вытеснение брошенных и ответ 429 (QRCapacityError)
+"""
+import time
+import pytest
+from qr_registry import QRRegistry, QRCapacityError
+
+
+def add(registry, qr_id, status="pending", polled_ago=0.0):
+    registry.reserve()
+    registry[qr_id] = {"status": status, "last_polled_at": time.time() - polled_ago}
+    registry.release()
+
+
+def test_reserve_evicts_least_recently_polled_idle_qr():
+    registry = QRRegistry(max_pending=2, idle_timeout=30)
+    add(registry, "old", polled_ago=60)
+    add(registry, "recent", polled_ago=50)
+
+    evicted = registry.reserve()
+
+    assert [qr_id for qr_id, _ in evicted] == ["old"]
+    assert "old" not in registry
+    assert "recent" in registry
+
+
+def test_touch_moves_qr_to_the_end_of_eviction_order():
+    registry = QRRegistry(max_pending=2, idle_timeout=0)
+    add(registry, "first")
+    add(registry, "second")
+    registry.touch("first")
+
+    evicted = registry.reserve()
+
+    assert [qr_id for qr_id, _ in evicted] == ["second"]
+
+
+def test_full_registry_of_active_qrs_raises_capacity_error():
+    registry = QRRegistry(max_pending=2, idle_timeout=45)
+    add(registry, "a", polled_ago=5)
+    add(registry, "b", polled_ago=1)
+
+    with pytest.raises(QRCapacityError) as error:
+        registry.reserve()
+
+    # Самый давний QR-код станет брошенным через 40 секунд
+    assert 39 <= error.value.retry_after <= 41
+    assert len(registry) == 2
+
+
+def test_qr_waiting_for_password_is_never_evicted():
+    registry = QRRegistry(max_pending=1, idle_timeout=1)
+    add(registry, "2fa", status="needs_password", polled_ago=600)
+
+    with pytest.raises(QRCapacityError) as error:
+        registry.reserve()
+
+    assert error.value.retry_after == 1
+    assert "2fa" in registry
+
+
+def test_finished_qrs_do_not_count_towards_limit():
+    registry = QRRegistry(max_pending=1, idle_timeout=45)
+    add(registry, "done", status="authorized")
+    add(registry, "expired", status="expired")
+
+    assert registry.waiting_count() == 0
+    assert registry.reserve() == []
+
+
+def test_reservations_count_until_released():
+    registry = QRRegistry(max_pending=1, idle_timeout=45)
+    registry.reserve()
+    assert registry.waiting_count() == 1
+
+    with pytest.raises(QRCapacityError):
+        registry.reserve()
+
+    registry.release()
+    assert registry.waiting_count() == 0
+    registry.release()
+    assert registry.waiting_count() == 0
+
+
+def test_generate_qr_answers_429_with_retry_after(monkeypatch):
+    import config
+    import app as web
+
+    async def over_capacity(session_id, qr_format):
+        raise QRCapacityError(17)
+
+    monkeypatch.setattr(config, "API_ID", 1)
+    monkeypatch.setattr(config, "API_HASH", "hash")
+    monkeypatch.setattr(web.auth_manager, "generate_qr_code_async", over_capacity)
+
+    response = web.app.test_client().post("/api/generate_qr")
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "17"
+    assert response.get_json()["retry_after"] == 17
@@ -0,0 +1,145 @@
+"""
+Тесты очереди ответов бота: порядок внутри чата, лимиты, пауза FloodWait и ошибки авторизации
+"""
+import time
+import asyncio
+from telethon.errors import FloodWaitError, AuthKeyUnregisteredError
+from reply_scheduler import ReplyScheduler, TokenBucket
+
+
+def make_scheduler(**overrides):
+    options = dict(global_rate=1000, global_burst=1000, chat_rate=1000, chat_burst=1000, max_size=100, max_age=60)
+    options.update(overrides)
+    return ReplyScheduler("test", **options)
+
+
+def recorder(sent, chat_id, text, fail_with=None):
+    """
+    Функция отправки для enqueue(): записывает (chat_id, text, время) или один раз бросает fail_with
+    """
+    errors = [fail_with] if fail_with else []
+
+    async def send():
+        if errors:
+            raise errors.pop()
+        sent.append((chat_id, text, time.monotonic()))
+    return lambda: send()
+
+
+async def wait_sent(sent, count, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while len(sent) < count:
+        assert time.monotonic() < deadline, f"отправлено {len(sent)} из {count}"
+        await asyncio.sleep(0.01)
+
+
+def test_token_bucket_allows_burst_then_rate():
+    bucket = TokenBucket(rate=10, burst=2)
+    now = time.monotonic()
+    bucket.take(now)
+    bucket.take(now)
+    assert abs(bucket.delay(now) - 0.1) < 1e-6
+    assert bucket.delay(now + 0.1) == 0
+
+
+def test_messages_of_one_chat_keep_order():
+    async def scenario():
+        sent = []
+        scheduler = make_scheduler()
+        for i in range(5):
+            scheduler.enqueue(1, recorder(sent, 1, i))
+            scheduler.enqueue(2, recorder(sent, 2, i))
+        await wait_sent(sent, 10)
+        return sent
+
+    sent = asyncio.run(scenario())
+    assert [text for chat_id, text, _ in sent if chat_id == 1] == list(range(5))
+    assert [text for chat_id, text, _ in sent if chat_id == 2] == list(range(5))
+
+
+def test_busy_chat_does_not_delay_other_chats():
+    async def scenario():
+        sent = []
+        scheduler = make_scheduler(chat_rate=5, chat_burst=1)
+        scheduler.enqueue(1, recorder(sent, 1, "first"))
+        scheduler.enqueue(1, recorder(sent, 1, "second"))
+        scheduler.enqueue(2, recorder(sent, 2, "other"))
+        await wait_sent(sent, 3)
+        return sent
+
+    sent = asyncio.run(scenario())
+    assert [text for _, text, _ in sent] == ["first", "other", "second"]
+    # Второе сообщение чата ждет свой лимит (5 в секунду)
+    assert sent[2][2] - sent[0][2] >= 0.15
+
+
+def test_flood_wait_parks_queue_and_resends_same_message():
+    async def scenario():
+        sent = []
+        scheduler = make_scheduler()
+        flood = FloodWaitError(None, 1)
+        flood.seconds = 0.3
+        scheduler.enqueue(1, recorder(sent, 1, "flooded", fail_with=flood))
+        scheduler.enqueue(1, recorder(sent, 1, "next"))
+        scheduler.enqueue(2, recorder(sent, 2, "other chat"))
+        started = time.monotonic()
+        await asyncio.sleep(0.1)
+        parked = scheduler.is_parked()
+        sent_while_parked = list(sent)
+        await wait_sent(sent, 3)
+        return started, parked, sent_while_parked, sent
+
+    started, parked, sent_while_parked, sent = asyncio.run(scenario())
+    assert parked
+    # Пауза относится ко всему аккаунту: другие чаты тоже ждут
+    assert sent_while_parked == []
+    assert [text for _, text, _ in sent][:2] in (["flooded", "next"], ["flooded", "other chat"])
+    assert [text for chat_id, text, _ in sent if chat_id == 1] == ["flooded", "next"]
+    assert sent[0][2] - started >= 0.3
+
+
+def test_full_queue_rejects_new_messages():
+    async def scenario():
+        sent = []
+        scheduler = make_scheduler(max_size=2)
+        accepted = [scheduler.enqueue(1, recorder(sent, 1, i)) for i in range(3)]
+        await wait_sent(sent, 2)
+        return accepted, sent
+
+    accepted, sent = asyncio.run(scenario())
+    assert accepted == [True, True, False]
+    assert len(sent) == 2
+
+
+def test_stale_message_is_dropped():
+    async def scenario():
+        sent = []
+        scheduler = make_scheduler(global_rate=5, global_burst=1, max_age=0.05)
+        scheduler.enqueue(1, recorder(sent, 1, "fresh"))
+        scheduler.enqueue(2, recorder(sent, 2, "stale"))
+        await asyncio.sleep(0.4)
+        return sent, len(scheduler)
+
+    sent, left = asyncio.run(scenario())
+    assert [text for _, text, _ in sent] == ["fresh"]
+    assert left == 0
+
+
+def test_auth_error_closes_queue_and_reports():
+    async def scenario():
+        sent, reported = [], []
+
+        async def on_auth_error(error):
+            reported.append(type(error).__name__)
+
+        scheduler = make_scheduler(on_auth_error=on_auth_error)
+        scheduler.enqueue(1, recorder(sent, 1, "revoked", fail_with=AuthKeyUnregisteredError(None)))
+        scheduler.enqueue(1, recorder(sent, 1, "never sent"))
+        await asyncio.sleep(0.1)
+        return sent, reported, len(scheduler), scheduler.enqueue(1, recorder(sent, 1, "after close"))
+
+    sent, reported, left, accepted = asyncio.run(scenario())
+    assert sent == []
+    assert reported == ["AuthKeyUnregisteredError"]
+    assert left == 0
+    assert accepted is False
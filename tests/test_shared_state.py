@@ -0,0 +1,129 @@
+"""
+Тесты общего состояния воркеров: владельцы QR-кодов и ботов, перехват у умершего воркера
+"""
+import os
+import time
+import subprocess
+import sys
+import pytest
+from shared_state import SharedState, current_owner, is_owner_alive, _process_start_time
+
+
+def parent_owner() -> str:
+    """
+    Живой процесс, отличный от текущего (родитель pytest), как владелец в другом воркере
+    """
+    ppid = os.getppid()
+    return f"{ppid}:{_process_start_time(ppid)}"
+
+
+def exited_owner() -> str:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return f"{process.pid}:{_process_start_time(process.pid) or '1'}"
+
+
+def insert_bot(state: SharedState, session_id: str, owner: str):
+    state._execute(
+        "INSERT OR REPLACE INTO bots (session_id, owner, stop_requested, updated_at) VALUES (?, ?, 0, ?)",
+        (session_id, owner, time.time()),
+    )
+
+
+@pytest.fixture
+def state(tmp_path):
+    return SharedState(tmp_path / "state.db")
+
+
+def test_owner_liveness():
+    assert is_owner_alive(current_owner())
+    assert is_owner_alive(parent_owner())
+    assert not is_owner_alive(exited_owner())
+
+
+def test_reused_pid_with_other_start_time_is_dead():
+    # После перезапуска контейнера PID может совпасть с PID прежнего воркера
+    assert not is_owner_alive(f"{os.getppid()}:1")
+    assert not is_owner_alive(f"{os.getpid()}:1")
+
+
+def test_claim_bot_keeps_bot_in_one_worker(state):
+    insert_bot(state, "alice", parent_owner())
+
+    assert not state.claim_bot("alice")
+    assert state.bot_owner("alice") == parent_owner()
+    assert state.claim_bot("bob")
+    assert state.claim_bot("bob")
+    assert state.bot_owner("bob") == state.owner
+
+
+@pytest.mark.parametrize("stale", [exited_owner, lambda: f"{os.getppid()}:1"])
+def test_claim_bot_takes_over_from_stale_owner(state, stale):
+    insert_bot(state, "alice", stale())
+
+    assert state.bot_owner("alice") is None
+    assert state.claim_bot("alice")
+    assert state.bot_owner("alice") == state.owner
+
+
+def test_stop_request_reaches_owner_worker(tmp_path):
+    ours = SharedState(tmp_path / "state.db")
+    other = SharedState(tmp_path / "state.db")
+    # Второй экземпляр изображает другой живой воркер
+    other._owner, other._owner_pid = parent_owner(), os.getpid()
+    assert other.claim_bot("alice")
+
+    assert ours.request_bot_stop("alice")
+    assert ours.stop_requests() == []
+    assert other.stop_requests() == ["alice"]
+    # Свой бот не останавливается через запрос
+    assert not other.request_bot_stop("alice")
+
+
+def test_clear_bot_owner_only_clears_own_bot(state):
+    insert_bot(state, "alice", parent_owner())
+    state.clear_bot_owner("alice")
+    assert state.bot_owner("alice") == parent_owner()
+
+    state.claim_bot("bob")
+    state.clear_bot_owner("bob")
+    assert state.bot_owner("bob") is None
+
+
+def test_qr_of_dead_worker_is_invisible(state):
+    state.put_qr("qr", {"session_id": "alice", "status": "pending", "version": 2}, b"png")
+    assert state.get_qr("qr")["status"] == "pending"
+    assert state.get_qr_image("qr") == (b"png", 2)
+
+    state._execute("UPDATE qr_codes SET owner = ?", (exited_owner(),))
+
+    assert state.get_qr("qr") is None
+    assert state.get_qr_image("qr") is None
+
+
+def test_restart_purges_dead_workers_but_keeps_authorization(tmp_path):
+    state = SharedState(tmp_path / "state.db")
+    state.set_authorized("alice")
+    state.put_qr("qr", {"session_id": "alice", "status": "pending"})
+    insert_bot(state, "alice", exited_owner())
+    state._execute("UPDATE qr_codes SET owner = ?", (exited_owner(),))
+    state._execute("UPDATE auth SET owner = ?", (exited_owner(),))
+
+    restarted = SharedState(tmp_path / "state.db")
+
+    assert restarted.is_authorized("alice")
+    assert restarted._fetchone("SELECT COUNT(*) FROM qr_codes")[0] == 0
+    assert restarted._fetchone("SELECT COUNT(*) FROM bots")[0] == 0
+
+
+def test_authorization_and_profiles_are_shared_between_connections(tmp_path):
+    writer = SharedState(tmp_path / "state.db")
+    reader = SharedState(tmp_path / "state.db")
+
+    writer.set_authorized("alice")
+    writer.put_profile("alice", {"first_name": "Алиса"})
+
+    assert reader.is_authorized("alice")
+    assert reader.get_profile("alice") == {"first_name": "Алиса"}
+    reader.clear_authorized("alice")
+    assert not writer.is_authorized("alice")
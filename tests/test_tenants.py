@@ -0,0 +1,33 @@
+"""
+Тесты ID пользователей и путей к их сессиям
+"""
+import pytest
+import config
+from tenants import DEFAULT_SESSION_ID, new_session_id, is_valid_session_id, session_path, list_session_ids
+
+
+def test_new_session_ids_are_valid_and_unique():
+    ids = {new_session_id() for _ in range(100)}
+    assert len(ids) == 100
+    assert all(is_valid_session_id(session_id) for session_id in ids)
+
+
+@pytest.mark.parametrize("session_id", ["", "../user", "a/b", "a" * 65, None, 123, "имя"])
+def test_unsafe_session_ids_are_rejected(session_id):
+    assert not is_valid_session_id(session_id)
+
+
+def test_session_path_keeps_legacy_file_for_default_user(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "SESSIONS_DIR", tmp_path)
+    assert session_path(DEFAULT_SESSION_ID) == tmp_path / "user.session"
+    assert session_path("abc") == tmp_path / "user_abc.session"
+    with pytest.raises(ValueError):
+        session_path("../escape")
+
+
+def test_list_session_ids_skips_foreign_files(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "SESSIONS_DIR", tmp_path)
+    for name in ("user.session", "user_abc.session", "user_a b.session", "other.session", "user_x.db"):
+        (tmp_path / name).touch()
+
+    assert list_session_ids() == sorted([DEFAULT_SESSION_ID, "abc"])
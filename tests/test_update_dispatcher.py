@@ -0,0 +1,129 @@
+"""
+Тесты обработки обновлений ботов: порядок внутри чата, лимиты очередей и очистка при остановке бота
+"""
+import asyncio
+from update_dispatcher import UpdateDispatcher
+
+
+def make_dispatcher(**overrides):
+    options = dict(workers=4, max_pending=100, max_per_chat=10, handler_timeout=5)
+    options.update(overrides)
+    return UpdateDispatcher(**options)
+
+
+def handler(log, key, value, delay=0.0, started=None):
+    """
+    Обработчик для submit(): записывает (ключ, значение) после задержки
+    """
+    async def handle():
+        if started is not None:
+            started.set()
+        await asyncio.sleep(delay)
+        log.append((key, value))
+    return handle
+
+
+async def drain(dispatcher, timeout=3.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while dispatcher.pending():
+        assert loop.time() < deadline, f"не обработано: {dispatcher.pending()}"
+        await asyncio.sleep(0.01)
+
+
+def test_updates_of_one_chat_keep_order():
+    async def scenario():
+        log = []
+        dispatcher = make_dispatcher()
+        for i in range(5):
+            # Первые обновления дольше последующих: без очереди чата порядок бы нарушился
+            dispatcher.submit(("s", 1), handler(log, 1, i, delay=0.05 - i * 0.01))
+            dispatcher.submit(("s", 2), handler(log, 2, i, delay=0.05 - i * 0.01))
+        await drain(dispatcher)
+        return log
+
+    log = asyncio.run(scenario())
+    assert [value for key, value in log if key == 1] == list(range(5))
+    assert [value for key, value in log if key == 2] == list(range(5))
+
+
+def test_different_chats_run_in_parallel():
+    async def scenario():
+        log = []
+        dispatcher = make_dispatcher(workers=2)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        dispatcher.submit(("s", 1), handler(log, 1, 0, delay=0.2))
+        dispatcher.submit(("s", 2), handler(log, 2, 0, delay=0.2))
+        await asyncio.sleep(0.05)
+        busy = dispatcher.busy()
+        await drain(dispatcher)
+        return busy, loop.time() - started
+
+    busy, elapsed = asyncio.run(scenario())
+    assert busy == 2
+    assert elapsed < 0.35
+
+
+def test_full_queues_drop_new_updates():
+    async def scenario():
+        log = []
+        dispatcher = make_dispatcher(workers=1, max_pending=3, max_per_chat=2)
+        accepted = [
+            dispatcher.submit(("s", 1), handler(log, 1, 0)),
+            dispatcher.submit(("s", 1), handler(log, 1, 1)),
+            dispatcher.submit(("s", 1), handler(log, 1, 2)),  # лимит чата
+            dispatcher.submit(("s", 2), handler(log, 2, 0)),
+            dispatcher.submit(("s", 3), handler(log, 3, 0)),  # общий лимит
+        ]
+        await drain(dispatcher)
+        return accepted, log
+
+    accepted, log = asyncio.run(scenario())
+    assert accepted == [True, True, False, True, False]
+    assert sorted(log) == [(1, 0), (1, 1), (2, 0)]
+
+
+def test_handler_timeout_and_errors_do_not_stop_chat():
+    async def scenario():
+        log = []
+        dispatcher = make_dispatcher(workers=1, handler_timeout=0.05)
+
+        async def failing():
+            raise ValueError("boom")
+
+        dispatcher.submit(("s", 1), handler(log, 1, "slow", delay=1))
+        dispatcher.submit(("s", 1), failing)
+        dispatcher.submit(("s", 1), handler(log, 1, "next"))
+        await drain(dispatcher)
+        return log, dispatcher.busy()
+
+    log, busy = asyncio.run(scenario())
+    assert log == [(1, "next")]
+    assert busy == 0
+
+
+def test_discard_purges_stopped_bot_and_keeps_others():
+    async def scenario():
+        log = []
+        dispatcher = make_dispatcher(workers=1)
+        started = asyncio.Event()
+        # Первое обновление бота "a" уже у воркера, остальные ждут
+        dispatcher.submit(("a", 1), handler(log, "a1", 0, delay=0.1, started=started))
+        dispatcher.submit(("a", 1), handler(log, "a1", 1))
+        dispatcher.submit(("a", 2), handler(log, "a2", 0))
+        dispatcher.submit(("b", 1), handler(log, "b1", 0))
+        await started.wait()
+        dropped = dispatcher.discard(lambda key: key[0] == "a")
+        pending_after = dispatcher.pending()
+        await drain(dispatcher)
+        # Очередь чата, которую обрабатывал воркер, убрана после завершения
+        accepted = dispatcher.submit(("a", 1), handler(log, "a1", "after restart"))
+        await drain(dispatcher)
+        return dropped, pending_after, log, accepted
+
+    dropped, pending_after, log, accepted = asyncio.run(scenario())
+    assert dropped == 2
+    assert pending_after == 2
+    assert log == [("a1", 0), ("b1", 0), ("a1", "after restart")]
+    assert accepted
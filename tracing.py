@@ -0,0 +1,250 @@
+"""
+Легкая трассировка запросов: спаны с ID запроса, который переходит между потоками и event loop
+"""
+import json
+import time
+import uuid
+import queue
+import threading
+import functools
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import config
+from log_pipeline import get_logger
+
+logger = get_logger("APP.TRACE")
+
+# Текущий спан выполняющегося кода (свой у каждого потока и каждой asyncio задачи)
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+class Span:
+    """
+    Отрезок работы внутри запроса: имя, время, поток, родительский спан и атрибуты
+    """
+
+    __slots__ = ("request_id", "span_id", "parent_id", "name", "attrs",
+                 "started_at", "_started", "_token", "duration_ms", "thread", "error")
+
+    def __init__(self, name: str, request_id: str, parent_id: Optional[str] = None, attrs: Optional[Dict] = None):
+        self.request_id = request_id
+        self.span_id = uuid.uuid4().hex[:8]
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = dict(attrs or {})
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        # Токен contextvars для возврата предыдущего текущего спана
+        self._token = None
+        self.duration_ms: Optional[float] = None
+        self.thread = threading.current_thread().name
+        self.error: Optional[str] = None
+
+    def set(self, **attrs):
+        """
+        Добавляет атрибуты спану
+        """
+        self.attrs.update(attrs)
+
+    def finish(self):
+        self.duration_ms = round((time.perf_counter() - self._started) * 1000, 3)
+
+    def to_dict(self) -> Dict:
+        return {
+            "request_id": self.request_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "thread": self.thread,
+            "attrs": self.attrs,
+            "error": self.error,
+        }
+
+
+class Tracer:
+    """
+    Класс для создания спанов и хранения завершенных спанов
+    Завершенные спаны кладутся в кольцевой буфер (для /debug/traces) и, если задан файл,
+    пишутся в него построчно в JSON фоновым потоком
+    """
+
+    def __init__(self, enabled: bool, buffer_size: int, export_path: Optional[Path] = None):
+        self.enabled = enabled
+        self._finished: deque = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self.export_path = Path(export_path) if export_path else None
+        self._export_queue: "queue.SimpleQueue[Optional[Dict]]" = queue.SimpleQueue()
+        self._export_thread: Optional[threading.Thread] = None
+        if self.enabled and self.export_path:
+            self._export_thread = threading.Thread(target=self._export_loop, name="trace-export", daemon=True)
+            self._export_thread.start()
+
+    @staticmethod
+    def current_span() -> Optional[Span]:
+        return _current_span.get()
+
+    def current_request_id(self) -> Optional[str]:
+        """
+        Возвращает ID запроса, к которому относится выполняющийся код
+
+        Returns:
+            str или None: ID запроса или None вне запроса
+        """
+        span = _current_span.get()
+        return span.request_id if span else None
+
+    def start_span(self, name: str, request_id: Optional[str] = None, **attrs) -> Span:
+        """
+        Открывает спан и делает его текущим; закрывается через end_span()
+        Без request_id спан продолжает текущий запрос, а вне запроса начинает новый
+
+        Args:
+            name: Имя спана
+            request_id: ID нового запроса (например, из заголовка X-Request-ID)
+            **attrs: Атрибуты спана
+
+        Returns:
+            Span: Открытый спан
+        """
+        parent = _current_span.get()
+        if request_id is None and parent is not None:
+            span = Span(name, parent.request_id, parent.span_id, attrs)
+        else:
+            span = Span(name, request_id or new_request_id(), None, attrs)
+        span._token = _current_span.set(span)
+        return span
+
+    def end_span(self, span: Span, error: Optional[BaseException] = None):
+        """
+        Закрывает спан, возвращает предыдущий текущий спан и сохраняет результат
+        """
+        token, span._token = span._token, None
+        if token is not None:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # Спан закрывается в другом контексте (например, Flask teardown) - просто снимаем его
+                _current_span.set(None)
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        span.finish()
+        self._record(span)
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """
+        Спан на время блока with (работает и в обычном коде, и внутри корутин)
+
+        Args:
+            name: Имя спана
+            **attrs: Атрибуты спана
+        """
+        if not self.enabled:
+            yield None
+            return
+        span = self.start_span(name, **attrs)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, e)
+            raise
+        self.end_span(span)
+
+    def bind_coroutine(self, coro):
+        """
+        Переносит текущий спан в корутину, которая будет выполняться в другом потоке
+        (run_coroutine_threadsafe не копирует contextvars вызывающего потока)
+
+        Args:
+            coro: Корутина
+
+        Returns:
+            Корутина, выполняющаяся в спане "loop:<имя корутины>"
+        """
+        parent = _current_span.get()
+        if not self.enabled or parent is None:
+            return coro
+        submitted_at = time.perf_counter()
+
+        async def traced():
+            _current_span.set(parent)
+            # Сколько корутина ждала своей очереди в event loop
+            queued_ms = round((time.perf_counter() - submitted_at) * 1000, 3)
+            with self.span(f"loop:{getattr(coro, '__qualname__', 'coroutine')}", queued_ms=queued_ms):
+                return await coro
+
+        return traced()
+
+    @staticmethod
+    def bind(fn: Callable) -> Callable:
+        """
+        Переносит текущий контекст (и спан) в функцию для другого потока или executor
+
+        Args:
+            fn: Функция
+
+        Returns:
+            Callable: Функция, выполняющаяся в скопированном контексте
+        """
+        context = contextvars.copy_context()
+        return functools.partial(context.run, fn)
+
+    def recent(self, request_id: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        """
+        Возвращает последние завершенные спаны
+
+        Args:
+            request_id: Только спаны этого запроса
+            limit: Максимум спанов
+
+        Returns:
+            List[Dict]: Спаны от новых к старым
+        """
+        with self._lock:
+            spans = list(self._finished)
+        result = []
+        for span in reversed(spans):
+            if request_id is None or span.request_id == request_id:
+                result.append(span.to_dict())
+                if len(result) >= limit:
+                    break
+        return result
+
+    def _record(self, span: Span):
+        with self._lock:
+            self._finished.append(span)
+        if self._export_thread is not None:
+            self._export_queue.put(span.to_dict())
+
+    def _export_loop(self):
+        """
+        Основной цикл потока экспорта: дописывает спаны в файл по строке JSON
+        """
+        while True:
+            item = self._export_queue.get()
+            batch = [item]
+            # Забираем все, что накопилось, чтобы писать в файл пачками
+            while True:
+                try:
+                    batch.append(self._export_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self.export_path.open("a", encoding="utf-8") as f:
+                    for span in batch:
+                        f.write(json.dumps(span, ensure_ascii=False, default=str) + "\n")
+            except OSError as e:
+                logger.error(f"Ошибка при записи спанов в {self.export_path}: {e}")
+
+
+# Глобальный трассировщик
+tracer = Tracer(config.TRACING_ENABLED, config.TRACE_BUFFER_SIZE, config.TRACE_FILE)
@@ -0,0 +1,166 @@
+"""
+Обработка входящих обновлений ботов фиксированным числом воркеров с ограниченными очередями по чатам
+"""
+import time
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Set, Tuple
+from metrics import UPDATE_QUEUE_WAIT, UPDATES_DROPPED
+from log_pipeline import get_logger
+
+logger = get_logger("BOT.UPDATES")
+
+# Не чаще раза в столько секунд пишем в лог об отброшенных обновлениях (при спаме их тысячи)
+DROP_LOG_INTERVAL = 10
+
+
+class UpdateDispatcher:
+    """
+    Класс для обработки обновлений всех ботов в общем event loop без задачи на каждое сообщение
+    У каждого чата своя очередь; чат с необработанными сообщениями стоит в общей очереди готовых
+    ровно один раз, поэтому его сообщения обрабатываются по порядку и только одним воркером,
+    а разные чаты - параллельно и по кругу. Очереди ограничены: сверх лимита новое обновление
+    отбрасывается сразу, а не копится в памяти и не задерживает Telethon (ждать в обработчике
+    события нельзя - это остановило бы прием обновлений всех ботов). Отброшенные обновления
+    учитываются в метриках и в логе (предупреждение не чаще раза в DROP_LOG_INTERVAL секунд)
+    """
+
+    def __init__(self, workers: int, max_pending: int, max_per_chat: int, handler_timeout: float):
+        """
+        Args:
+            workers: Число воркеров (одновременно обрабатываемых обновлений)
+            max_pending: Сколько обновлений всех чатов может ждать обработки
+            max_per_chat: Сколько обновлений одного чата может ждать обработки
+            handler_timeout: Сколько секунд может обрабатываться одно обновление
+        """
+        self._worker_count = max(1, workers)
+        self._max_pending = max_pending
+        self._max_per_chat = max_per_chat
+        self._handler_timeout = handler_timeout
+        # Очереди чатов: {ключ чата: deque[(обработчик, время постановки)]}
+        # Первый элемент остается в очереди, пока воркер его обрабатывает
+        self._chats: Dict[Hashable, Deque[Tuple[Callable[[], Awaitable], float]]] = {}
+        # Очередь готовых чатов: (ключ, очередь чата); устаревшая пара (чат очищен) пропускается
+        self._ready: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._pending = 0
+        self._busy = 0
+        # Чаты, первое обновление которых сейчас у воркера
+        self._processing: Set[Hashable] = set()
+        # Отброшено с последней записи в лог и время этой записи
+        self._dropped = 0
+        self._drop_logged_at = 0.0
+
+    def pending(self) -> int:
+        return self._pending
+
+    def busy(self) -> int:
+        return self._busy
+
+    def submit(self, key: Hashable, handler: Callable[[], Awaitable]) -> bool:
+        """
+        Ставит обновление в очередь его чата (вызывается в общем event loop, не ждет)
+
+        Args:
+            key: Ключ чата (обновления с одним ключом обрабатываются по порядку)
+            handler: Функция без аргументов, возвращающая корутину обработки
+
+        Returns:
+            bool: False если очередь заполнена и обновление отброшено
+        """
+        self._ensure_workers()
+        if self._pending >= self._max_pending:
+            self._drop(key, "queue_full")
+            return False
+        messages = self._chats.get(key)
+        if messages is not None and len(messages) >= self._max_per_chat:
+            self._drop(key, "chat_full")
+            return False
+        if messages is None:
+            messages = self._chats[key] = deque()
+            self._ready.put_nowait((key, messages))
+        messages.append((handler, time.monotonic()))
+        self._pending += 1
+        return True
+
+    def _drop(self, key: Hashable, reason: str):
+        """
+        Учитывает отброшенное обновление в метриках и (не чаще DROP_LOG_INTERVAL) в логе
+        """
+        UPDATES_DROPPED.inc(reason=reason)
+        self._dropped += 1
+        now = time.monotonic()
+        if now - self._drop_logged_at >= DROP_LOG_INTERVAL:
+            logger.warning(f"Очередь обновлений заполнена ({reason}, ожидает {self._pending}, чат {key}): "
+                           f"отброшено обновлений: {self._dropped}")
+            self._dropped = 0
+            self._drop_logged_at = now
+
+    def discard(self, match: Callable[[Hashable], bool]) -> int:
+        """
+        Отбрасывает ожидающие обновления чатов, чьи ключи подходят под match (бот остановлен)
+        Обновление, которое воркер уже обрабатывает, завершается (или прерывается по таймауту)
+
+        Args:
+            match: Функция ключ -> bool
+
+        Returns:
+            int: Сколько обновлений отброшено
+        """
+        dropped = 0
+        for key in [key for key in self._chats if match(key)]:
+            messages = self._chats[key]
+            if key in self._processing:
+                # Первое обновление у воркера - он сам уберет очередь чата, когда закончит
+                while len(messages) > 1:
+                    messages.pop()
+                    dropped += 1
+            else:
+                dropped += len(messages)
+                del self._chats[key]
+        if dropped:
+            self._pending -= dropped
+            UPDATES_DROPPED.inc(dropped, reason="stopped")
+        return dropped
+
+    def _ensure_workers(self):
+        """
+        Запускает воркеры при первом обновлении (в общем event loop)
+        """
+        if self._workers and not all(worker.done() for worker in self._workers):
+            return
+        self._ready = asyncio.Queue()
+        # Обновления, ждавшие остановившихся воркеров, снова ставятся в очередь
+        for key, messages in self._chats.items():
+            self._ready.put_nowait((key, messages))
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self._worker_count)]
+        logger.info(f"Запущено воркеров обновлений: {self._worker_count}")
+
+    async def _work(self):
+        """
+        Воркер: берет готовый чат, обрабатывает его первое обновление и возвращает чат в конец очереди
+        """
+        while True:
+            key, messages = await self._ready.get()
+            if self._chats.get(key) is not messages:
+                # Очередь чата отброшена (бот остановлен)
+                continue
+            handler, queued_at = messages[0]
+            UPDATE_QUEUE_WAIT.observe(time.monotonic() - queued_at)
+            self._busy += 1
+            self._processing.add(key)
+            try:
+                await asyncio.wait_for(handler(), timeout=self._handler_timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"Обработка обновления чата {key} не завершилась за {self._handler_timeout} секунд")
+            except Exception as e:
+                logger.error(f"Ошибка при обработке обновления чата {key}: {type(e).__name__}: {e}")
+            finally:
+                self._busy -= 1
+                self._processing.discard(key)
+                messages.popleft()
+                self._pending -= 1
+                if messages:
+                    self._ready.put_nowait((key, messages))
+                else:
+                    del self._chats[key]
@@ -2,32 +2,61 @@
 Менеджер юзербота для обработки сообщений
 """
 import asyncio
-import time
-from typing import Optional, Callable
+import random
+import threading
+import concurrent.futures
+from typing import Optional, Callable, Awaitable, Dict, Tuple
 from telethon import TelegramClient, events
 from telethon.errors import AuthKeyUnregisteredError, SessionRevokedError, UnauthorizedError
+from telethon.tl.functions.updates import GetStateRequest
+from telethon.tl.functions.users import GetUsersRequest
+from telethon.tl.types import InputUserSelf, UpdateUser, UpdateUserName, UpdateUserPhone
 import config
+from event_bus import event_bus
+from session_validity import session_validity
+from profile_cache import profile_cache
+from shared_state import shared_state
+from async_runtime import async_runtime
+from metrics import ECHO_REPLY_DURATION
+from reply_scheduler import ReplyScheduler
+from update_dispatcher import UpdateDispatcher
+from tracing import tracer, new_request_id
+from log_pipeline import get_logger
+
+logger = get_logger("BOT")
 
 
 class UserbotManager:
     """
-    Класс для управления юзерботом
+    Класс для управления юзерботами всех пользователей
     """
     
     def __init__(self):
         # Словарь активных ботов: {session_id: client}
+        # Все клиенты работают в общем event loop из async_runtime (без потока на пользователя)
         self.active_bots: dict = {}
-        # Словарь event loops для ботов: {session_id: event_loop}
-        self.bot_loops: dict = {}
-        # Callback для вызова при отключении пользователем
-        self.logout_callback: Optional[Callable] = None
+        # Очереди исходящих ответов ботов: {session_id: ReplyScheduler}
+        self.reply_schedulers: Dict[str, ReplyScheduler] = {}
+        # Задачи периодической проверки сессии ботов: {session_id: Task}
+        self._session_checks: Dict[str, asyncio.Task] = {}
+        # Входящие обновления всех ботов обрабатывают фиксированные воркеры, по порядку внутри чата
+        self.update_dispatcher = UpdateDispatcher(
+            config.UPDATE_WORKERS, config.UPDATE_QUEUE_SIZE, config.UPDATE_CHAT_QUEUE_SIZE, config.UPDATE_HANDLER_TIMEOUT
+        )
+        # Callback для вызова при отключении пользователем: callback(session_id)
+        self.logout_callback: Optional[Callable[[str], None]] = None
+        # Текущий переход бота пользователя: {session_id: (вид перехода, Future)}
+        self._transitions: Dict[str, Tuple[str, concurrent.futures.Future]] = {}
+        self._transitions_lock = threading.Lock()
+        # Задача, которая останавливает ботов этого воркера по запросам других воркеров
+        self._stop_watcher: Optional[asyncio.Task] = None
     
-    def set_logout_callback(self, callback: Callable):
+    def set_logout_callback(self, callback: Callable[[str], None]):
         """
         Устанавливает callback для вызова при logout
         
         Args:
-            callback: Функция для вызова
+            callback: Функция для вызова, получает session_id
         """
         self.logout_callback = callback
         
@@ -43,22 +72,32 @@ class UserbotManager:
             bool: True если бот успешно запущен
         """
         try:
-            print(f"[BOT] start_bot вызван для session_id: {session_id}")
+            logger.debug(f"start_bot вызван для session_id: {session_id}")
             
             # Если бот уже запущен - останавливаем его сначала
             if session_id in self.active_bots:
-                print(f"[BOT] start_bot: бот уже запущен для {session_id}, останавливаем старый")
+                logger.info(f"start_bot: бот уже запущен для {session_id}, останавливаем старый")
                 old_client = self.active_bots[session_id]
                 try:
                     await old_client.disconnect()
-                    print(f"[BOT] Старый клиент отключен")
+                    logger.debug(f"Старый клиент отключен")
                 except Exception as e:
-                    print(f"[BOT] Ошибка при отключении старого клиента: {e}")
+                    logger.error(f"Ошибка при отключении старого клиента: {e}")
                 del self.active_bots[session_id]
+                self._close_bot_tasks(session_id)
+            
+            # Бот пользователя должен работать только в одном воркере
+            if not await self._claim_bot(session_id):
+                logger.warning(f"start_bot: бот {session_id} запущен в другом воркере и не остановился")
+                try:
+                    await client.disconnect()
+                except Exception as e:
+                    logger.error(f"Ошибка при отключении клиента: {e}")
+                return False
             
             # Используем уже авторизованного клиента для работы юзербота
             userbot_client = client
-            print(f"[BOT] start_bot: клиент получен, регистрируем обработчики")
+            logger.debug(f"start_bot: клиент получен, регистрируем обработчики")
             
             # Функция для обработки отключения сессии
             async def handle_session_logout(error=None):
@@ -66,125 +105,162 @@ class UserbotManager:
                 Обрабатывает отключение сессии (удаление в Telegram)
                 """
                 try:
+                    # Бот уже остановлен или перезапущен с новым клиентом - ошибка старого клиента не в счет
+                    if self.active_bots.get(session_id) is not userbot_client:
+                        return
                     error_type = type(error).__name__ if error else "Unknown"
-                    print(f"[BOT] Обнаружено отключение сессии: {error_type}")
+                    logger.error(f"Обнаружено отключение сессии: {error_type}")
                     
                     # Удаляем бота из активных
-                    if session_id in self.active_bots:
-                        del self.active_bots[session_id]
-                        print(f"[BOT] Бот удален из активных")
+                    del self.active_bots[session_id]
+                    self._close_bot_tasks(session_id)
+                    await shared_state.run(shared_state.clear_bot_owner, session_id)
+                    logger.debug(f"Бот удален из активных")
+                    
+                    # Закешированный ответ "сессия валидна" больше не верен
+                    session_validity.invalidate(session_id)
+                    
+                    event_bus.publish("session_revoked", {"session_id": session_id, "reason": error_type},
+                                      session_id=session_id)
+                    event_bus.publish("bot_status", {"session_id": session_id, "active": False},
+                                      session_id=session_id)
                     
-                    # Вызываем callback если он установлен
+                    # Вызываем callback если он установлен (он пишет хранилища - вне event loop)
                     if self.logout_callback:
-                        print(f"[BOT] Вызываем logout_callback для отключения сессии")
-                        self.logout_callback()
+                        logger.debug(f"Вызываем logout_callback для отключения сессии")
+                        await shared_state.run(self.logout_callback, session_id)
                 except Exception as callback_error:
-                    print(f"[BOT] Ошибка в handle_session_logout: {callback_error}")
-                    import traceback
-                    traceback.print_exc()
+                    logger.exception(f"Ошибка в handle_session_logout: {callback_error}")
+            
+            # Ответы уходят через очередь с лимитами аккаунта и чата. Короткий FloodWait Telethon
+            # пережидает внутри отправки (flood_sleep_threshold клиента не меняем - он нужен всем
+            # запросам бота), а FloodWaitError сверх порога ставит очередь на паузу
+            reply_scheduler = ReplyScheduler(
+                session_id, config.REPLY_RATE, config.REPLY_BURST, config.REPLY_CHAT_RATE, config.REPLY_CHAT_BURST,
+                config.REPLY_QUEUE_SIZE, config.REPLY_MAX_AGE, on_auth_error=handle_session_logout,
+            )
+            
+            async def handle_message(event):
+                """
+                Эхо-ответ на входящее сообщение (выполняется воркером обновлений)
+                """
+                logger.debug("Получено сообщение: %s", event.message.text or "медиа")
+                # Получаем текст сообщения или информацию о медиа
+                if event.message.text:
+                    response_text = event.message.text
+                elif event.message.media:
+                    response_text = "Получено медиа"
+                else:
+                    response_text = "Получено неизвестное сообщение"
+                # Каждое сообщение - отдельная трасса (и при повторе после FloodWait)
+                request_id = new_request_id()
+                
+                async def send_reply():
+                    with ECHO_REPLY_DURATION.time(), tracer.span(
+                        "bot.echo_reply", request_id=request_id, session_id=session_id
+                    ):
+                        await event.reply(response_text)
+                    logger.debug("Эхо-ответ отправлен")
+                
+                reply_scheduler.enqueue(event.chat_id, send_reply)
             
             # Регистрируем обработчик для всех входящих сообщений
             @userbot_client.on(events.NewMessage(incoming=True))
             async def echo_handler(event):
                 """
-                Обработчик для эхо-ответов на все входящие сообщения
+                Передает входящее сообщение в очередь его чата: Telethon создает задачу на каждое
+                обновление, поэтому здесь ничего не ждем - обработка идет в воркерах по порядку
                 """
-                # Проверяем, что сообщение не от самого себя
+                # Отвечаем только на личные сообщения
                 if event.is_private:
-                    try:
-                        print(f"[BOT] Получено сообщение: {event.message.text if event.message.text else 'медиа'}")
-                        # Получаем текст сообщения или информацию о медиа
-                        if event.message.text:
-                            response_text = event.message.text
-                        elif event.message.media:
-                            response_text = "Получено медиа"
-                        else:
-                            response_text = "Получено неизвестное сообщение"
-                        
-                        # Отправляем эхо-ответ
-                        await event.reply(response_text)
-                        print(f"[BOT] Эхо-ответ отправлен")
-                        
-                    except (AuthKeyUnregisteredError, SessionRevokedError, UnauthorizedError) as e:
-                        print(f"[BOT] Сессия стала невалидной при отправке ответа: {type(e).__name__}")
-                        await handle_session_logout(e)
-                    except Exception as e:
-                        print(f"[BOT] Ошибка при отправке эхо-ответа: {e}")
+                    self.update_dispatcher.submit((session_id, event.chat_id), lambda: handle_message(event))
             
+            # Профиль пользователя обновляется событиями, а не запросами get_me()
+            async def handle_profile_update(update):
+                """
+                Обновляет кеш профиля при изменении имени, телефона или фото пользователя
+                """
+                user_data = await shared_state.run(profile_cache.get, session_id)
+                if not user_data or update.user_id != user_data["id"]:
+                    return
+                try:
+                    if isinstance(update, UpdateUser):
+                        # UpdateUser не содержит данных (например, сменилось фото) - запрашиваем себя один раз
+                        users = await userbot_client(GetUsersRequest([InputUserSelf()]))
+                        if users:
+                            await shared_state.run(profile_cache.set_user, session_id, users[0])
+                    else:
+                        await shared_state.run(profile_cache.apply_update, session_id, update)
+                    logger.info(f"Профиль пользователя {session_id} обновлен: {type(update).__name__}")
+                except Exception as e:
+                    logger.error(f"Ошибка при обновлении профиля: {type(e).__name__}: {e}")
+
+            @userbot_client.on(events.Raw(types=(UpdateUserName, UpdateUserPhone, UpdateUser)))
+            async def profile_handler(update):
+                # Изменения профиля применяются по порядку, в своей очереди пользователя
+                self.update_dispatcher.submit((session_id, "profile"), lambda: handle_profile_update(update))
+
             # Также добавляем периодическую проверку валидности сессии (каждые 20 секунд)
             async def periodic_session_check():
                 """
                 Периодически проверяет валидность сессии через простой API вызов
                 """
-                while session_id in self.active_bots:
+                # Случайный сдвиг, чтобы проверки сотен ботов не совпадали по времени
+                await asyncio.sleep(random.uniform(0, 20))
+                # Проверка принадлежит этому клиенту: после перезапуска бота у нового клиента своя проверка
+                while self.active_bots.get(session_id) is userbot_client:
                     try:
                         await asyncio.sleep(20)  # Проверка каждые 20 секунд
                         
-                        # Проверяем что клиент все еще в активных ботах
-                        if session_id not in self.active_bots:
-                            print(f"[BOT] Периодическая проверка: бот больше не активен, прекращаем проверку")
+                        # Проверяем что клиент все еще работает ботом
+                        if self.active_bots.get(session_id) is not userbot_client:
+                            logger.info(f"Периодическая проверка: бот больше не активен, прекращаем проверку")
                             break
                         
-                        # Проверяем валидность сессии через вызов get_me()
-                        # Используем тот же client, который уже работает в текущем event loop
-                        # Это предотвращает ошибку "The asyncio event loop must not change after connection"
+                        # Проверяем валидность сессии самым легким запросом updates.getState
+                        # (профиль берется из кеша, get_me() здесь не нужен)
                         try:
-                            # Проверяем что клиент подключен перед вызовом get_me()
+                            # Проверяем что клиент подключен перед запросом
                             if not userbot_client.is_connected():
-                                print(f"[BOT] Периодическая проверка: клиент не подключен, сессия невалидна")
+                                logger.warning(f"Периодическая проверка: клиент не подключен, сессия невалидна")
                                 await handle_session_logout()
                                 break
                             
-                            user = await asyncio.wait_for(userbot_client.get_me(), timeout=5)
-                            if user is None:
-                                print(f"[BOT] Периодическая проверка: get_me() вернул None - сессия невалидна")
-                                await handle_session_logout()
-                                break
+                            await asyncio.wait_for(userbot_client(GetStateRequest()), timeout=5)
                         except (AuthKeyUnregisteredError, SessionRevokedError, UnauthorizedError) as e:
-                            print(f"[BOT] Периодическая проверка: сессия отозвана: {type(e).__name__}")
+                            logger.warning(f"Периодическая проверка: сессия отозвана: {type(e).__name__}")
                             await handle_session_logout(e)
                             break
                         except asyncio.TimeoutError:
-                            print(f"[BOT] Периодическая проверка: таймаут при get_me()")
+                            logger.warning(f"Периодическая проверка: таймаут при getState")
                             # Таймаут - не критично, продолжаем проверку
                             continue
-                        except RuntimeError as e:
-                            error_msg = str(e)
-                            if "asyncio event loop must not change" in error_msg.lower():
-                                print(f"[BOT] Периодическая проверка: RuntimeError (event loop changed) - пропускаем эту проверку")
-                                # Эта ошибка возникает если клиент используется в другом loop
-                                # Не критично, просто пропускаем эту проверку
-                                continue
-                            else:
-                                # Другие RuntimeError - критичны
-                                raise
                     except Exception as e:
                         error_name = type(e).__name__
                         # Для критических ошибок авторизации прерываем цикл
                         if isinstance(e, (AuthKeyUnregisteredError, SessionRevokedError, UnauthorizedError)):
-                            print(f"[BOT] Периодическая проверка: критическая ошибка авторизации: {error_name}")
+                            logger.error(f"Периодическая проверка: критическая ошибка авторизации: {error_name}")
                             await handle_session_logout(e)
                             break
-                        print(f"[BOT] Ошибка при периодической проверке сессии: {error_name}: {e}")
+                        logger.error(f"Ошибка при периодической проверке сессии: {error_name}: {e}")
                         # Не прерываем цикл при обычных ошибках
                         continue
             
-            # Запускаем периодическую проверку в фоне
-            asyncio.create_task(periodic_session_check())
-            
-            print(f"[BOT] start_bot: обработчик зарегистрирован, сохраняем бота")
-            # Сохраняем бота
+            logger.debug(f"start_bot: обработчик зарегистрирован, сохраняем бота")
+            # Сохраняем бота и запускаем периодическую проверку в фоне
             self.active_bots[session_id] = userbot_client
-            # Event loop будет сохранен в start_bot_with_client или в restore_and_start_bot
-            # Не пытаемся получить его здесь, так как он может быть не установлен или клиент может быть из другого loop
+            self.reply_schedulers[session_id] = reply_scheduler
+            self._session_checks[session_id] = asyncio.create_task(periodic_session_check())
+            self._ensure_stop_watcher()
+            event_bus.publish("bot_status", {"session_id": session_id, "active": True}, session_id=session_id)
             
-            print(f"[BOT] Юзербот для сессии {session_id} успешно запущен")
+            logger.info(f"Юзербот для сессии {session_id} успешно запущен")
             return True
             
         except Exception as e:
-            print(f"[BOT] Ошибка при запуске юзербота: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"Ошибка при запуске юзербота: {e}")
+            if session_id not in self.active_bots:
+                await shared_state.run(shared_state.clear_bot_owner, session_id)
             return False
     
     async def stop_bot(self, session_id: str) -> bool:
@@ -203,51 +279,54 @@ class UserbotManager:
                 client = self.active_bots[session_id]
                 try:
                     await client.disconnect()
-                    print(f"[BOT] Клиент для сессии {session_id} отключен")
+                    logger.debug(f"Клиент для сессии {session_id} отключен")
                 except Exception as e:
-                    print(f"[BOT] Ошибка при отключении клиента: {e}")
-                
-                # Закрываем event loop если он есть
-                if session_id in self.bot_loops:
-                    bot_loop = self.bot_loops[session_id]
-                    try:
-                        # Останавливаем loop если он запущен в другом потоке
-                        if bot_loop.is_running():
-                            # Останавливаем loop через call_soon_threadsafe
-                            bot_loop.call_soon_threadsafe(bot_loop.stop)
-                            print(f"[BOT] Отправлен сигнал остановки event loop для сессии {session_id}")
-                            # Ждем немного чтобы loop остановился
-                            time.sleep(0.5)
-                        else:
-                            # Loop не запущен - можем закрыть сразу
-                            if not bot_loop.is_closed():
-                                bot_loop.close()
-                                print(f"[BOT] Event loop для сессии {session_id} закрыт")
-                    except Exception as e:
-                        print(f"[BOT] Ошибка при закрытии event loop: {e}")
-                        import traceback
-                        traceback.print_exc()
-                    finally:
-                        # Удаляем loop из словаря
-                        if session_id in self.bot_loops:
-                            del self.bot_loops[session_id]
+                    logger.error(f"Ошибка при отключении клиента: {e}")
                 
                 # Удаляем из активных ботов
                 del self.active_bots[session_id]
-                print(f"[BOT] Юзербот для сессии {session_id} остановлен")
+                self._close_bot_tasks(session_id)
+                await shared_state.run(shared_state.clear_bot_owner, session_id)
+                event_bus.publish("bot_status", {"session_id": session_id, "active": False}, session_id=session_id)
+                logger.info(f"Юзербот для сессии {session_id} остановлен")
                 return True
             
-            return False
+            # Бот может работать в другом воркере - просим его остановить
+            return await self._stop_remote_bot(session_id)
             
         except Exception as e:
-            print(f"[BOT] Ошибка при остановке юзербота: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"Ошибка при остановке юзербота: {e}")
             return False
     
+    def _close_bot_tasks(self, session_id: str):
+        """
+        Останавливает очередь ответов бота (неотправленные ответы отбрасываются), проверку его сессии
+        и отбрасывает его необработанные входящие обновления
+        """
+        self.update_dispatcher.discard(lambda key: key[0] == session_id)
+        scheduler = self.reply_schedulers.pop(session_id, None)
+        if scheduler is not None:
+            scheduler.close()
+        check = self._session_checks.pop(session_id, None)
+        # Из самой проверки (сессия отозвана) ее не отменяем - она завершится сама
+        if check is not None and check is not asyncio.current_task():
+            check.cancel()
+    
+    def reply_queue_depth(self) -> int:
+        """
+        Возвращает число ответов всех ботов, ожидающих отправки
+        """
+        return sum(len(scheduler) for scheduler in list(self.reply_schedulers.values()))
+    
+    def reply_queues_parked(self) -> int:
+        """
+        Возвращает число ботов, чьи очереди ответов стоят на паузе после FloodWaitError
+        """
+        return sum(1 for scheduler in list(self.reply_schedulers.values()) if scheduler.is_parked())
+    
     def is_bot_active(self, session_id: str) -> bool:
         """
-        Проверяет, активен ли бот для данной сессии
+        Проверяет, активен ли бот для данной сессии (в этом или другом воркере)
         
         Args:
             session_id: ID сессии
@@ -255,7 +334,149 @@ class UserbotManager:
         Returns:
             bool: True если бот активен
         """
-        return session_id in self.active_bots
+        return session_id in self.active_bots or shared_state.bot_owner(session_id) is not None
+    
+    async def _claim_bot(self, session_id: str) -> bool:
+        """
+        Закрепляет бота за этим воркером; если бот работает в другом воркере - просит его остановиться
+        
+        Args:
+            session_id: ID сессии
+            
+        Returns:
+            bool: True если бота можно запускать здесь
+        """
+        if await shared_state.run(shared_state.claim_bot, session_id):
+            return True
+        logger.info(f"Бот {session_id} запущен в другом воркере, просим его остановиться")
+        await self._stop_remote_bot(session_id)
+        return await shared_state.run(shared_state.claim_bot, session_id)
+    
+    async def _stop_remote_bot(self, session_id: str) -> bool:
+        """
+        Просит другой воркер остановить бота и ждет, пока тот снимет отметку
+        
+        Args:
+            session_id: ID сессии
+            
+        Returns:
+            bool: True если бот был запущен в другом воркере и остановлен
+        """
+        if not await shared_state.run(shared_state.request_bot_stop, session_id):
+            return False
+        deadline = asyncio.get_running_loop().time() + config.BOT_TRANSITION_TIMEOUT
+        while await shared_state.run(shared_state.bot_owner, session_id) is not None:
+            if asyncio.get_running_loop().time() >= deadline:
+                logger.warning(f"Другой воркер не остановил бота {session_id} за {config.BOT_TRANSITION_TIMEOUT} секунд")
+                return False
+            await asyncio.sleep(config.BOT_STOP_POLL_INTERVAL)
+        logger.info(f"Бот {session_id} остановлен другим воркером")
+        return True
+    
+    def _ensure_stop_watcher(self):
+        """
+        Запускает задачу, выполняющую запросы других воркеров на остановку ботов (в общем event loop)
+        """
+        if self._stop_watcher is not None and not self._stop_watcher.done():
+            return
+        
+        async def watch_stop_requests():
+            while True:
+                await asyncio.sleep(config.BOT_STOP_POLL_INTERVAL)
+                try:
+                    for session_id in await shared_state.run(shared_state.stop_requests):
+                        logger.info(f"Другой воркер попросил остановить бота {session_id}")
+                        if session_id in self.active_bots:
+                            await self.stop_bot(session_id)
+                        else:
+                            # Бот уже не запущен здесь - снимаем оставшуюся отметку
+                            await shared_state.run(shared_state.clear_bot_owner, session_id)
+                except Exception as e:
+                    logger.error(f"Ошибка при обработке запросов остановки ботов: {type(e).__name__}: {e}")
+        
+        self._stop_watcher = asyncio.create_task(watch_stop_requests())
+    
+    def pending_transitions(self) -> Dict[str, int]:
+        """
+        Возвращает число незавершенных переходов ботов по виду перехода
+        
+        Returns:
+            Dict[str, int]: {"start": N, "stop": M}
+        """
+        counts = {"start": 0, "stop": 0}
+        with self._transitions_lock:
+            for kind, future in self._transitions.values():
+                if not future.done():
+                    counts[kind] = counts.get(kind, 0) + 1
+        return counts
+    
+    def run_transition(self, session_id: str, kind: str,
+                       coro_factory: Callable[[], Awaitable[bool]]) -> concurrent.futures.Future:
+        """
+        Запускает переход бота (start/stop) в общем event loop и возвращает его Future
+        Future завершается ровно тогда, когда переход выполнен. Повторный запрос того же
+        перехода получает уже идущий Future, а другой переход ждет завершения текущего
+        
+        Args:
+            session_id: ID сессии
+            kind: Вид перехода: "start" или "stop"
+            coro_factory: Функция без аргументов, возвращающая корутину перехода (-> bool)
+            
+        Returns:
+            concurrent.futures.Future: Результат перехода (bool)
+        """
+        with self._transitions_lock:
+            current = self._transitions.get(session_id)
+            if current and not current[1].done():
+                if current[0] == kind:
+                    return current[1]
+                previous = current[1]
+            else:
+                previous = None
+            
+            async def transition():
+                if previous is not None:
+                    # Переходы одного пользователя выполняются по очереди
+                    try:
+                        await asyncio.wrap_future(previous)
+                    except Exception:
+                        pass
+                return await coro_factory()
+            
+            future = async_runtime.submit(transition())
+            self._transitions[session_id] = (kind, future)
+        future.add_done_callback(lambda done: self._clear_transition(session_id, done))
+        return future
+    
+    def _clear_transition(self, session_id: str, future: concurrent.futures.Future):
+        """
+        Забывает завершенный переход, если после него не начался новый
+        """
+        with self._transitions_lock:
+            current = self._transitions.get(session_id)
+            if current and current[1] is future:
+                del self._transitions[session_id]
+    
+    @staticmethod
+    def wait_transition(future: concurrent.futures.Future, timeout: float) -> Optional[bool]:
+        """
+        Ждет завершения перехода бота, но не дольше timeout
+        
+        Args:
+            future: Future из run_transition()
+            timeout: Дедлайн в секундах
+            
+        Returns:
+            bool или None: Результат перехода или None, если дедлайн истек (переход продолжается)
+        """
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            logger.warning(f"Переход бота не завершился за {timeout} секунд, продолжается в фоне")
+            return None
+        except Exception as e:
+            logger.error(f"Ошибка при переходе бота: {type(e).__name__}: {e}")
+            return False
     
     def get_client(self, session_id: str) -> Optional[TelegramClient]:
         """